@@ -5,6 +5,13 @@ import sys
 
 files = {}
 
+# Общие модули берутся как есть из scripts/ (их же использует Rust-версия)
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
+
+def shared_module(name):
+    with open(os.path.join(SCRIPTS_DIR, name)) as f:
+        return f.read()
+
 # 1. CONFIG.YAML
 files['config.yaml'] = """
 system:
@@ -13,14 +20,43 @@ system:
     vision_enabled: true
     voice_enabled: true
     bluetooth_enabled: true
+  memory:
+    min_available_mb: 64   # Ниже - выгрузить модель Vosk
+    psi_some_avg10: 20.0   # /proc/pressure/memory, % времени ожидания памяти
+  executor_workers: 3      # Потоки для блокирующих вызовов (TTS, I2C, D-Bus)
+  report_interval: 300     # Задержки задач в лог, с
+  metrics:                 # aiva_v1.prom для metrics_exporter.py (http://127.0.0.1:9101/metrics)
+    enabled: true
+    dir: "/dev/shm/aiva_metrics"
+    interval: 5
+  profiling:               # kill -USR1 / -USR2 <pid main.py>: профиль стеков / tracemalloc
+    dir: "/dev/shm"
+    interval: 0.02
+    max_seconds: 300
+    top: 25
+  logging:                 # Живой лог: /dev/shm/aiva_logs/system.log, архив: logs/system.*.log.gz
+    dir: "/dev/shm/aiva_logs"
+    archive_dir: "logs"
+    batch_kb: 64           # WARNING и выше пишутся сразу
+    flush_interval: 5      # При падении теряется не больше этого интервала INFO
+    max_kb: 1024
+    keep: 20
+  journal:                 # Бинарный журнал кадров, фраз и питания: event_journal.py query --since 1h
+    enabled: true
+    dir: "logs/journal"
+    flush_interval: 10     # warning/critical питания пишутся сразу
+    keep_days: 30
 
 power:
   enabled: true
   i2c_bus: 1
   i2c_address: 0x42  # Стандарт для Waveshare UPS HAT C
+  # backend: "sim:load=30:450/5:900,speed=100"  # Симулятор INA219 вместо UPS HAT
+  # broker_snapshot: "/dev/shm/aiva_power.snap"  # Читать данные power_broker.py
+  # broker_max_age: 10  # с: снимок старше - брокер завис, чтение INA219 напрямую
   shutdown_voltage: 3.2
   warning_voltage: 3.5
-  check_interval: 60
+  check_interval: 5  # с, своя задача asyncio
 
 vision:
   camera_mode: "imx500"
@@ -31,13 +67,44 @@ vision:
     # Проверьте этот путь на вашей OS (Bookworm)
     model_config: "/usr/share/rpi-camera-assets/imx500_mobilenet_ssd.json"
     confidence_threshold: 0.5
+  stream: true  # Один rpicam-vid на всё время работы (false - запуск на каждый кадр)
+  cache_max_age: 2.0  # Секунды, сколько последние детекции отвечают на "что видишь" без нового захвата
+  index:                   # Недавние детекции в памяти: "когда последний раз", "сколько за час", "где обычно"
+    bucket_seconds: 60     # Шаг счётчиков по времени
+    horizon: 86400         # Сколько секунд помнить счётчики
+    track_timeout: 5       # Секунды без объекта, после которых следующее появление - новое
+    match_distance: 0.2    # Доля кадра: дальше - другой объект того же класса
+    grid: 3                # Сетка занятости grid x grid
 
 voice:
   speech_recognition:
     model_path: "./voice_models/vosk-model-small-ru-0.22"
     sample_rate: 16000
     trigger_words: ["ассистент", "помощник", "робот"]
-    energy_threshold: 300
+    wake_word: true     # Сначала слово активации, потом команда (false - команды без него)
+    command_window: 6   # Секунды ожидания команды после слова активации
+    fuzzy_distance: 1   # Допустимые опечатки распознавания в слове команды (0 - только точно)
+    min_score: 0.75     # Минимальная уверенность неточного совпадения
+    early_dispatch: true  # Выполнять команду по промежуточной гипотезе, если она однозначна
+    lazy_load: true     # Грузить модель при первой речи, а не при старте
+    idle_unload: 300    # Выгрузить модель после N секунд без речи (0 - держать всегда)
+    min_resident: 60    # Выгрузка по нехватке памяти не раньше N секунд после загрузки
+    reload_cooldown: 30 # После такой выгрузки N секунд не грузить модель (фразы пропускаются)
+    grammar: true  # Словарь только из trigger_words и commands (false - открытая модель)
+    capture:
+      buffer_seconds: 10       # Кольцевой буфер микрофона
+      frames_per_buffer: 1600  # 100 мс на callback PortAudio
+    energy_threshold: 300  # Минимальный RMS речи (int16) для VAD
+    vad:
+      enabled: true
+      frame_ms: 25
+      noise_ratio: 3.0     # Порог = max(energy_threshold, шум * noise_ratio)
+      zcr_max: 0.35        # Выше - широкополосный шум, если энергия не велика
+      start_ms: 50
+      hangover_ms: 400     # Удержание после конца речи
+      preroll_ms: 300      # Начало фразы до срабатывания
+      max_segment_ms: 15000
+      report_interval: 300 # Раз в N секунд писать долю аудио, ушедшую в Vosk
     
   text_to_speech:
     # Замените на имя скачанной модели
@@ -49,6 +116,26 @@ voice:
     what_do_you_see: ["что видишь", "что там", "опиши", "посмотри"]
     stop_listening: ["стоп", "хватит", "отмена"]
     check_battery: ["заряд", "батарея", "питание"]
+    # Вопросы о прошлом по индексу недавних детекций (vision.index), объект - из objects;
+    # одиночное слово ("когда", "где", "сколько") срабатывает, только если назван объект (или период)
+    last_seen: ["когда последний раз", "когда видел", "когда"]
+    count_recent: ["сколько", "как часто"]
+    where_usually: ["где обычно", "где чаще", "где"]
+
+  objects:                 # Формы названий в вопросах -> метка зрения (vision_engine._translate)
+    человек: ["человек", "люди", "людей", "человека", "кто"]
+    машина: ["машина", "машину", "машины", "машин", "автомобиль"]
+    велосипед: ["велосипед", "велосипеда", "велосипеды", "велосипедов"]
+    бутылка: ["бутылка", "бутылку", "бутылки", "бутылок"]
+    стул: ["стул", "стулья", "стульев"]
+    телефон: ["телефон", "телефона", "телефоны"]
+    ноутбук: ["ноутбук", "ноутбука"]
+  periods:                 # "сколько людей за час" -> секунды
+    минуту: 60
+    полчаса: 1800
+    час: 3600
+    день: 86400
+    сутки: 86400
     
   responses:
     greeting: "Система готова."
@@ -56,13 +143,18 @@ voice:
     no_objects: "Ничего не вижу."
     processing: "Секунду..."
     error: "Ошибка системы."
+    which_object: "Что именно?"
 
 bluetooth:
   headphones:
     mac_address: "XX:XX:XX:XX:XX:XX"  # <--- ВСТАВЬТЕ MAC АДРЕС ВАШИХ НАУШНИКОВ
     name: "Headphones"
     auto_connect: true
-    reconnect_attempts: 5
+    reconnect_attempts: 5   # 0 - без ограничения
+    reconnect_backoff: 2.0  # Первая пауза между попытками, далее x2
+    reconnect_backoff_max: 120.0
+  dbus_bus: "system"  # "session" - заглушка bluez_standin.py
+  adapter: "hci0"
   audio:
     profile: "headset_head_unit" # Важно для микрофона
     sample_rate: 16000
@@ -95,7 +187,7 @@ sudo apt update
 sudo apt install -y python3-pip python3-venv python3-numpy python3-pil \
     python3-smbus python3-gpiozero i2c-tools \
     libcamera-apps pulseaudio pulseaudio-module-bluetooth \
-    bluez python3-pyaudio libatlas-base-dev sox libsox-fmt-all
+    bluez python3-dbus python3-gi python3-pyaudio libatlas-base-dev sox libsox-fmt-all
 
 # 2. Настройка прав пользователя
 sudo usermod -a -G video,audio,gpio,i2c,bluetooth $USER
@@ -150,7 +242,12 @@ import logging
 import subprocess
 import json
 import os
-from typing import List, Dict, Any
+import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional
+import event_journal
+from detection_index import DetectionIndex
 
 logger = logging.getLogger(__name__)
 
@@ -166,6 +263,28 @@ class VisionEngine:
         self.cmd_tool = 'rpicam-vid' if os.path.exists('/usr/bin/rpicam-vid') else 'libcamera-vid'
         self.model_config = None
 
+        # Запросы зрения идут через один поток камеры; свежий результат отдаётся из кэша,
+        # одновременные запросы ждут один и тот же захват
+        self.cache_max_age = config.get('cache_max_age', 2.0)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vision')
+        self._lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+        self._last_time = 0.0
+        self._last_detections: Optional[List[Dict[str, Any]]] = None
+        self.stats = {'queries': 0, 'cache_hits': 0, 'coalesced': 0, 'captures': 0}
+
+        # Потоковый режим: один rpicam-vid на всё время работы, метаданные кадров читаются из stdout
+        self.stream = config.get('stream', True)
+        self.fps = config['imx500'].get('fps', 5)
+        self.proc = None
+        self.running = False
+        self._frame_cond = threading.Condition(self._lock)
+        self._frame_seq = 0
+        self.stream_stats = {'frames': 0, 'restarts': 0, 'parse_errors': 0}
+
+        # Недавние детекции для вопросов "когда / сколько / где" без нового захвата
+        self.index = DetectionIndex(config.get('index', {}))
+
     def initialize(self) -> bool:
         logger.info(f"Инициализация Vision Engine ({self.cmd_tool})...")
         
@@ -182,11 +301,139 @@ class VisionEngine:
             self.model_config = cfg_path
             
         logger.info(f"Используем конфиг модели: {self.model_config}")
+        if self.stream:
+            self.running = True
+            threading.Thread(target=self._stream_loop, name='vision-stream', daemon=True).start()
         return True
 
+    def _stream_cmd(self):
+        return [
+            self.cmd_tool,
+            '-t', '0',  # без ограничения по времени
+            '--width', str(self.width),
+            '--height', str(self.height),
+            '--framerate', str(self.fps),
+            '--post-process-file', self.model_config,
+            '--metadata', '-',
+            '--metadata-format', 'json',
+            '--codec', 'yuv420',  # кадры не кодируем, они не нужны
+            '--output', '/dev/null',
+            '--nopreview',
+        ]
+
+    def _stream_loop(self):
+        # Держим rpicam-vid запущенным; если процесс умер - перезапуск с растущей паузой
+        delay = 1.0
+        while self.running:
+            started = time.monotonic()
+            try:
+                self.proc = subprocess.Popen(self._stream_cmd(), stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL)
+                logger.info(f"Поток {self.cmd_tool} запущен (pid {self.proc.pid}, {self.fps} fps)")
+                self._read_metadata(self.proc.stdout)
+                code = self.proc.wait()
+            except OSError as e:
+                code = str(e)
+            if not self.running:
+                break
+            if time.monotonic() - started > 30:
+                delay = 1.0  # процесс проработал нормально - сбрасываем паузу
+            self.stream_stats['restarts'] += 1
+            logger.warning(f"{self.cmd_tool} завершился ({code}), перезапуск через {delay:.0f} с")
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def _read_metadata(self, stdout):
+        # --metadata-format json пишет массив объектов по кадру: "[{...},\\n{...}" -
+        # разбираем объекты по мере поступления, не дожидаясь конца массива
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder('utf-8')('replace')
+        buf = ''
+        while True:
+            chunk = stdout.read1(65536)
+            if not chunk:
+                return
+            buf += utf8.decode(chunk)
+            pos = 0
+            while True:
+                while pos < len(buf) and buf[pos] in ' \\t\\r\\n[],':
+                    pos += 1
+                if pos >= len(buf):
+                    break
+                try:
+                    frame, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if len(buf) - pos > 1 << 20:
+                        # Мусор вместо JSON - не копим бесконечно
+                        self.stream_stats['parse_errors'] += 1
+                        pos = len(buf)
+                    break
+                self._on_frame(frame)
+            buf = buf[pos:]
+
+    def _on_frame(self, frame):
+        detections = self._parse_detections(frame)
+        event_journal.record_frame(detections)
+        self.index.add(detections)
+        self._remember(detections)
+        with self._lock:
+            self._frame_seq += 1
+            self.stream_stats['frames'] += 1
+            self._frame_cond.notify_all()
+
+    def _wait_frame(self, timeout: float) -> List[Dict[str, Any]]:
+        # Следующий кадр после вызова (гарантированно свежий); по таймауту - последний известный,
+        # только если он не старше cache_max_age: старые объекты не выдаём за текущий кадр
+        with self._lock:
+            seq = self._frame_seq
+            if self._frame_cond.wait_for(lambda: self._frame_seq != seq, timeout):
+                return self._last_detections or []
+            age = time.monotonic() - self._last_time
+            if self._last_detections is not None and age <= self.cache_max_age:
+                return self._last_detections
+        logger.warning(f"Кадр от {self.cmd_tool} не пришёл за {timeout:.0f} с - поток завис, детекций нет")
+        return []
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        #Последние детекции, если они не старше max_age секунд, иначе None
+        max_age = self.cache_max_age if max_age is None else max_age
+        with self._lock:
+            if self._last_detections is not None and time.monotonic() - self._last_time <= max_age:
+                return self._last_detections
+        return None
+
+    def query(self, max_age: Optional[float] = None) -> Future:
+        #Асинхронный запрос детекций: Future с результатом из кэша, текущего или нового захвата
+        with self._lock:
+            self.stats['queries'] += 1
+        cached = self.latest(max_age)
+        if cached is not None:
+            with self._lock:
+                self.stats['cache_hits'] += 1
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._lock:
+            if self._inflight is not None and not self._inflight.done():
+                self.stats['coalesced'] += 1
+                return self._inflight
+            self._inflight = self.executor.submit(self.process_frame)
+            return self._inflight
+
+    def _remember(self, detections: List[Dict[str, Any]]):
+        with self._lock:
+            self._last_detections = detections
+            self._last_time = time.monotonic()
+            self.stats['captures'] += 1
+
     def process_frame(self) -> List[Dict[str, Any]]:
         if not self.model_config: return []
-        
+        if self.stream:
+            return self._wait_frame(timeout=max(2.0, 3.0 / self.fps))
+        return self._capture_once()
+
+    def _capture_once(self) -> List[Dict[str, Any]]:
         try:
             if os.path.exists(self.output_file):
                 os.remove(self.output_file)
@@ -211,23 +458,57 @@ class VisionEngine:
                     content = f.read()
                     if content:
                         try:
-                            data = json.loads(content)
-                            # Обработка разных форматов JSON от libcamera
-                            raw = data.get('detections', []) if isinstance(data, dict) else data
-                            
-                            for d in raw:
-                                conf = d.get('confidence', 0)
-                                if conf >= self.config['imx500']['confidence_threshold']:
-                                    label_raw = d.get('category', d.get('label', 0))
-                                    label_rus = self._translate(label_raw)
-                                    detections.append({'label': label_rus, 'conf': conf})
+                            detections = self._parse_detections(json.loads(content))
                         except json.JSONDecodeError:
                             pass
+            event_journal.record_frame(detections)
+            self.index.add(detections)
+            self._remember(detections)
             return detections
         except Exception as e:
             logger.error(f"Vision error: {e}")
             return []
 
+    def _parse_detections(self, data) -> List[Dict[str, Any]]:
+        # Обработка разных форматов JSON от libcamera
+        if isinstance(data, dict):
+            raw = data.get('detections', data.get('Detection', []))
+        else:
+            raw = data
+        threshold = self.config['imx500']['confidence_threshold']
+        detections = []
+        for d in raw or []:
+            if isinstance(d, dict):
+                conf = d.get('confidence', 0)
+                label_raw = d.get('category', d.get('label', 0))
+                box = d.get('bbox', d.get('box'))
+                if isinstance(box, dict):
+                    box = [box.get(k) for k in ('x', 'y', 'width', 'height')]
+            elif isinstance(d, (list, tuple)) and len(d) >= 2:
+                # Формат IMX500: [class_id, confidence, x, y, width, height]
+                label_raw, conf = int(d[0]), float(d[1])
+                box = d[2:6]
+            else:
+                continue
+            if conf >= threshold:
+                det = {'label': self._translate(label_raw), 'conf': conf}
+                bbox = self._bbox(box)
+                if bbox:
+                    det['bbox'] = bbox
+                detections.append(det)
+        return detections
+
+    def _bbox(self, values):
+        # [x, y, ширина, высота] в пикселях или долях кадра -> доли кадра (для индекса и журнала)
+        try:
+            x, y, w, h = (float(v) for v in values)
+        except (TypeError, ValueError):
+            return None
+        if max(x + w, y + h) > 1.5:
+            x, w = x / self.width, w / self.width
+            y, h = y / self.height, h / self.height
+        return {'x': x, 'y': y, 'width': w, 'height': h}
+
     def _translate(self, label):
         # Словарь COCO (упрощенный)
         d = {
@@ -262,22 +543,99 @@ class VisionEngine:
         return "Вижу: " + ", ".join(res)
 
     def cleanup(self):
-        pass
+        self.running = False
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        st = self.stats
+        logger.info(f"Зрение: запросов {st['queries']}, из кэша {st['cache_hits']}, "
+                    f"объединено {st['coalesced']}, захватов {st['captures']}")
+        if self.stream:
+            ss = self.stream_stats
+            logger.info(f"Поток камеры: кадров {ss['frames']}, перезапусков {ss['restarts']}, "
+                        f"ошибок разбора {ss['parse_errors']}")
 """
 
 # 5. VOICE_ASSISTANT.PY
 files['voice_assistant.py'] = """#!/usr/bin/env python3
+import os
+import gc
 import time
+import ctypes
 import queue
 import logging
 import json
 import threading
 from pathlib import Path
 import vosk
-import pyaudio
+from op_markers import marked, OP_VOSK
+from audio_capture import AudioRingBuffer, MicCapture
+from vad import VoiceActivityDetector
+from command_matcher import CommandMatcher
 
 logger = logging.getLogger(__name__)
 
+# Вопросы о прошлом: название объекта звучит после фразы команды, поэтому
+# выполняются только по итоговому тексту, не по промежуточной гипотезе
+HISTORY_INTENTS = ('last_seen', 'count_recent', 'where_usually')
+# Слова периода для "сколько ... за ..." -> секунды (voice.periods перекрывает)
+DEFAULT_PERIODS = {'минуту': 60, 'полчаса': 1800, 'час': 3600, 'день': 86400, 'сутки': 86400}
+
+def object_label(object_matcher, match):
+    # Метка зрения по словам реплики вне фразы команды
+    tokens = match.tokens or []
+    rest = tokens[:match.span[0]] + tokens[match.span[1]:]
+    found = object_matcher.match(' '.join(rest)) if rest else None
+    return found.intent if found else None
+
+def accept_history(match, object_matcher, periods):
+    # Фильтр для CommandMatcher.match (общий с voice_benchmark.py): одиночные "когда", "сколько",
+    # "где" - вопрос о прошлом, только если назван объект (для "сколько" - или период):
+    # "сколько заряда осталось" - заряд, "где ты" - не вопрос
+    if match.intent not in HISTORY_INTENTS or match.span[1] - match.span[0] > 1:
+        return True
+    if object_label(object_matcher, match) is not None:
+        return True
+    return match.intent == 'count_recent' and any(t in periods for t in match.tokens)
+
+def rss_bytes():
+    # Резидентная память процесса из /proc/self/statm
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+def release_heap():
+    # Вернуть освобождённую память malloc системе (иначе RSS после выгрузки модели не падает)
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def build_grammar(config):
+    # Закрытый словарь Vosk: триггеры + фразы команд, всё прочее -> [unk]
+    phrases = list(config['speech_recognition']['trigger_words'])
+    for variants in config['commands'].values():
+        phrases.extend(variants)
+    # Названия объектов и периоды для вопросов о прошлом
+    for variants in config.get('objects', {}).values():
+        phrases.extend(variants)
+    phrases.extend(config.get('periods', DEFAULT_PERIODS))
+    phrases.append('за')
+    grammar = sorted({p.lower().strip() for p in phrases if p.strip()})
+    return grammar + ['[unk]']
+
+def build_trigger_grammar(config):
+    # Первая ступень: только слова активации
+    triggers = config['speech_recognition']['trigger_words']
+    return sorted({t.lower().strip() for t in triggers if t.strip()}) + ['[unk]']
+
 class VoiceAssistant:
     def __init__(self, config, detection_queue, command_queue, audio_queue):
         self.config = config
@@ -288,7 +646,46 @@ class VoiceAssistant:
         self.vision_engine = None # Будет установлен из main.py
         self.running = False
         self.listening = False
-        self.rec = None
+        self.model = None
+        self.rec = None          # распознаватель команд
+        self.trigger_rec = None  # распознаватель слов активации
+        self._next_recs = None   # новые распознаватели после смены конфига
+
+        # Модель грузится при первой речи после VAD и выгружается после простоя
+        self.last_speech = time.monotonic()
+        self._evict_reason = None  # запрошенная выгрузка (нехватка памяти)
+        self.model_stats = {'loads': 0, 'unloads': 0, 'evictions': 0,
+                            'evictions_deferred': 0, 'reloads_deferred': 0,
+                            'load_s': 0.0, 'rss_mb': 0.0, 'resident_s': 0.0}
+        self._loaded_at = 0.0
+        self._evicted_at = float('-inf')
+        self.vad = VoiceActivityDetector(config['speech_recognition'])
+        self.vad_report_interval = config['speech_recognition'].get('vad', {}).get('report_interval', 300)
+
+        # Двухступенчатое распознавание: слово активации, затем окно команды
+        self.stage = None             # ступень текущего сегмента речи: 'trigger' | 'command'
+        self.segment = bytearray()    # аудио сегмента для повторной подачи после триггера
+        self.command_deadline = 0.0
+        self.segment_start = 0.0
+        self.woke = False             # слово активации принято в текущем сегменте
+        self.early = None             # намерение, уже выполненное по PartialResult в этой реплике
+        self.stats = {'segments': 0, 'triggers': 0, 'commands': 0, 'early': 0}
+
+        # Действия по командам (зрение, речь) выполняются отдельным потоком,
+        # чтобы захват и распознавание не ждали камеру
+        self.actions = queue.Queue(maxsize=4)
+        self.capture = None
+        self.on_dispatch = None  # callback(match) в момент решения о команде (бенчмарк)
+
+        self.handlers = {
+            'what_do_you_see': self._cmd_vision,
+            'stop_listening': self._cmd_stop,
+            'check_battery': self._cmd_battery,
+            'last_seen': self._cmd_last_seen,
+            'count_recent': self._cmd_count_recent,
+            'where_usually': self._cmd_where_usually,
+        }
+        self._build_matchers()
         
     def initialize(self) -> bool:
         try:
@@ -297,9 +694,8 @@ class VoiceAssistant:
                 logger.error(f"Модель Vosk не найдена: {model_path}")
                 return False
                 
-            logger.info("Загрузка модели Vosk...")
-            model = vosk.Model(model_path)
-            self.rec = vosk.KaldiRecognizer(model, 16000)
+            if not self.config['speech_recognition'].get('lazy_load', True):
+                self._load_model()
             self.running = True
             
             # Приветствие
@@ -309,64 +705,381 @@ class VoiceAssistant:
             logger.error(f"Ошибка Voice Init: {e}")
             return False
 
-    def process(self):
+    def _load_model(self):
+        rss_before = rss_bytes()
+        start = time.monotonic()
+        logger.info("Загрузка модели Vosk...")
+        self.model = vosk.Model(self.config['speech_recognition']['model_path'])
+        self.rec, self.trigger_rec = self._create_recognizers()
+        self._next_recs = None
+        load_s = time.monotonic() - start
+        rss_mb = (rss_bytes() - rss_before) / 2**20
+
+        self._loaded_at = time.monotonic()
+        self.model_stats['loads'] += 1
+        self.model_stats['load_s'] = load_s
+        self.model_stats['rss_mb'] = rss_mb
+        logger.info(f"Модель Vosk загружена за {load_s:.2f} с, +{rss_mb:.0f} МБ RSS")
+
+    def _unload_model(self, reason):
+        rss_before = rss_bytes()
+        self.rec = self.trigger_rec = self.model = None
+        self._next_recs = None
+        release_heap()
+        self.model_stats['unloads'] += 1
+        self.model_stats['resident_s'] += time.monotonic() - self._loaded_at
+        freed_mb = (rss_before - rss_bytes()) / 2**20
+        logger.info(f"Модель Vosk выгружена ({reason}), освобождено {freed_mb:.0f} МБ RSS")
+
+    def evict(self, reason="нехватка памяти"):
+        #Принудительная выгрузка модели (вызывается из main.py при нехватке памяти).
+        #Выполняется потоком распознавания между фразами
+        if self.model is not None:
+            self._evict_reason = reason
+
+    def _manage_model(self):
+        # Между сегментами речи: выгрузка по запросу или после простоя
+        if self.model is None or self.stage is not None:
+            return
+        sr = self.config['speech_recognition']
+        if self._evict_reason:
+            reason, self._evict_reason = self._evict_reason, None
+            if time.monotonic() - self._loaded_at < sr.get('min_resident', 60):
+                # Только что загружена: выгрузка сейчас - снова загрузка на следующей фразе,
+                # и при долгой нехватке памяти модель грузилась бы по кругу
+                self.model_stats['evictions_deferred'] += 1
+                return
+            self.model_stats['evictions'] += 1
+            self._evicted_at = time.monotonic()
+            self._unload_model(reason)
+            return
+        idle_unload = sr.get('idle_unload', 300)
+        if idle_unload and time.monotonic() - self.last_speech > idle_unload:
+            self._unload_model(f"простой {idle_unload} с")
+
+    def _create_recognizers(self):
+        #(команды, слова активации)
+        trigger_grammar = json.dumps(build_trigger_grammar(self.config), ensure_ascii=False)
+        trigger_rec = vosk.KaldiRecognizer(self.model, 16000, trigger_grammar)
+        if not self.config['speech_recognition'].get('grammar', True):
+            return vosk.KaldiRecognizer(self.model, 16000), trigger_rec
+        grammar = build_grammar(self.config)
+        logger.info(f"Грамматика Vosk: {len(grammar) - 1} фраз + [unk]")
+        return vosk.KaldiRecognizer(self.model, 16000, json.dumps(grammar, ensure_ascii=False)), trigger_rec
+
+    def _build_matchers(self):
+        # Индексы фраз собираются один раз, а не на каждую реплику
+        sr = self.config['speech_recognition']
+        options = {'max_distance': sr.get('fuzzy_distance', 1), 'min_score': sr.get('min_score', 0.75)}
+        self.matcher = CommandMatcher(self.config['commands'], **options)
+        self.trigger_matcher = CommandMatcher({'trigger': sr['trigger_words']}, **options)
+        # Формы названий объектов -> метка зрения
+        self.object_matcher = CommandMatcher(self.config.get('objects', {}), **options)
+
+    def add_intent(self, intent, phrases, handler=None):
+        #Новое намерение на ходу: индекс, грамматика Vosk и обработчик
+        self.config['commands'].setdefault(intent, [])
+        self.config['commands'][intent].extend(phrases)
+        self.matcher.add_intent(intent, phrases)
+        if handler:
+            self.handlers[intent] = handler
+        if self.model is not None:
+            self._next_recs = self._create_recognizers()
+
+    def update_config(self, config):
+        # Вызывается из main.py при изменении config.yaml
+        self.config = config
+        self._build_matchers()
+        if self.model is not None:
+            # Подменяем распознаватели между сегментами в потоке process
+            self._next_recs = self._create_recognizers()
+
+    def _awake(self):
+        if not self.config['speech_recognition'].get('wake_word', True):
+            return True
+        return time.monotonic() < self.command_deadline
+
+    def process(self, source=None):
+        #source - источник аудио из audio_capture.py (по умолчанию микрофон)
         if not self.running: return
         
-        # Слушаем микрофон
+        # Слушаем микрофон: callback PyAudio пишет в кольцевой буфер, этот поток декодирует
+        if source is None:
+            capture_cfg = self.config['speech_recognition'].get('capture', {})
+            ring = AudioRingBuffer(int(capture_cfg.get('buffer_seconds', 10) * 16000) * 2)
+            source = MicCapture(ring, 16000, capture_cfg.get('frames_per_buffer', 1600))
+        self.capture = source
+        ring = source.ring
+        action_worker = threading.Thread(target=self._action_loop, name='voice-actions', daemon=True)
+        action_worker.start()
         try:
-            p = pyaudio.PyAudio()
-            # Индекс устройства по умолчанию (Bluetooth гарнитура должна быть default)
-            stream = p.open(format=pyaudio.paInt16, channels=1, rate=16000, input=True, frames_per_buffer=4000)
-            stream.start_stream()
+            self.capture.start()
             
             self.listening = True
             logger.info("Ассистент слушает...")
+            last_report = time.monotonic()
             
             while self.running:
-                data = stream.read(4000, exception_on_overflow=False)
-                if self.rec.AcceptWaveform(data):
-                    res = json.loads(self.rec.Result())
-                    text = res.get('text', '')
-                    if text:
-                        logger.info(f"Распознано: {text}")
-                        self._handle_command(text)
-                        
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
+                if self._next_recs is not None and self.stage is None:
+                    (self.rec, self.trigger_rec), self._next_recs = self._next_recs, None
+                self._manage_model()
+                data = ring.read(4000 * 2, timeout=0.5)
+                if not data:
+                    if ring.closed:
+                        break  # источник исчерпан (файл) или остановлен
+                    continue
+                # В Vosk идут только сегменты речи (с предзаписью), тишина не декодируется
+                speech, ended = self.vad.process(data)
+                if speech or ended:
+                    self._feed(speech, ended)
+
+                if time.monotonic() - last_report >= self.vad_report_interval:
+                    self._report()
+                    last_report = time.monotonic()
             
         except Exception as e:
             logger.error(f"Ошибка аудиопотока: {e}")
             time.sleep(2)
+        finally:
+            source.stop()
+            self.actions.put(None)
+            action_worker.join(timeout=5)
+            self._report()
+
+    def _action_loop(self):
+        while True:
+            item = self.actions.get()
+            if item is None:
+                break
+            handler, match = item
+            try:
+                handler(match)
+            except Exception as e:
+                logger.error(f"Ошибка команды {match.intent}: {e}")
+
+    def _feed(self, speech, ended):
+        # Ступень выбирается в начале сегмента: вне окна команды работает только
+        # маленький распознаватель слов активации
+        self.last_speech = time.monotonic()
+        if self.stage is None:
+            if self.model is None:
+                if time.monotonic() - self._evicted_at < self.config['speech_recognition'].get('reload_cooldown', 30):
+                    # Модель только что выгружена из-за нехватки памяти: фраза пропускается
+                    if ended:
+                        self.model_stats['reloads_deferred'] += 1
+                    return
+                # Речь после простоя: грузим модель, звук тем временем копится в кольцевом буфере
+                self._load_model()
+            self.stage = 'command' if self._awake() else 'trigger'
+            self.stats['segments'] += 1
+            self.segment_start = time.monotonic()
+        self.segment += speech
+
+        if self.stage == 'trigger':
+            with marked(OP_VOSK, units=len(speech) / 2 / 16000):
+                accepted = self.trigger_rec.AcceptWaveform(speech)
+            if accepted or ended:
+                result = self.trigger_rec.Result() if accepted else self.trigger_rec.FinalResult()
+                if self._is_trigger(json.loads(result).get('text', '')):
+                    self.woke = self._wake_up()
+            speech = b''
+
+        if self.stage == 'command' and speech:
+            # units - секунды аудио в сегменте, для мДж на секунду распознавания
+            with marked(OP_VOSK, units=len(speech) / 2 / 16000):
+                accepted = self.rec.AcceptWaveform(speech)
+            if accepted:
+                self._on_result(self.rec.Result())
+            else:
+                self._check_partial()
+
+        if ended:
+            if self.stage == 'command':
+                # Конец фразы по VAD: забираем остаток гипотезы
+                handled = self._on_result(self.rec.FinalResult())
+                if self.woke and not handled and self.command_deadline:
+                    # Только слово активации - ждём команду в окне
+                    self.speak(self.config['responses']['ready'])
+            self.stage = None
+            self.woke = False
+            self.segment.clear()
+
+    def _is_trigger(self, text):
+        return self.trigger_matcher.match(text) is not None
+
+    def _wake_up(self):
+        # Слово активации: открываем окно команды и отдаём распознавателю команд весь сегмент,
+        # чтобы "ассистент что видишь" одной фразой не потеряло команду
+        self.stats['triggers'] += 1
+        window = self.config['speech_recognition'].get('command_window', 6)
+        self.command_deadline = time.monotonic() + window
+        logger.info(f"Слово активации, жду команду {window} с")
+        self.trigger_rec.Reset()
+        self.stage = 'command'
+        with marked(OP_VOSK, units=len(self.segment) / 2 / 16000):
+            accepted = self.rec.AcceptWaveform(bytes(self.segment))
+        if accepted:
+            self._on_result(self.rec.Result())
+        else:
+            self._check_partial()
+        return True
+
+    def _check_partial(self):
+        # Команда по промежуточной гипотезе, не дожидаясь тишины после фразы
+        if self.early is not None or not self.config['speech_recognition'].get('early_dispatch', True):
+            return
+        text = json.loads(self.rec.PartialResult()).get('partial', '')
+        match = self.matcher.match_partial(text) if text else None
+        if match is None or match.intent in HISTORY_INTENTS or not self._dispatch(match):
+            return
+        self.early = match.intent
+        self.stats['early'] += 1
+        self._command_done(f"Раннее выполнение: {text}")
+
+    def _on_result(self, result):
+        text = json.loads(result).get('text', '')
+        early, self.early = self.early, None
+        if not text or text == '[unk]':
+            return early is not None
+        logger.info(f"Распознано: {text}")
+
+        if early is not None:
+            match = self.matcher.match(text, self._accept)
+            if match is None or match.intent == early:
+                return True  # уже выполнено по промежуточной гипотезе
+            logger.warning(f"Итог '{text}' расходится с ранним выполнением ({early})")
+
+        if self._handle_command(text):
+            self._command_done(f"Команда: {text}")
+            return True
+        return False
+
+    def _command_done(self, what):
+        self.stats['commands'] += 1
+        # Команда выполнена - до следующей снова нужно слово активации
+        self.command_deadline = 0.0
+        logger.info(f"{what} ({(time.monotonic() - self.segment_start) * 1000:.0f} ms от начала фразы)")
 
     def _handle_command(self, text):
-        triggers = self.config['speech_recognition']['trigger_words']
-        cmds = self.config['commands']
-        
-        # Простая проверка на вхождение
-        is_trigger = any(t in text for t in triggers)
-        
-        if is_trigger or True: # Для теста реагируем на всё или только на триггеры
-            
-            if any(c in text for c in cmds['what_do_you_see']):
-                self.speak(self.config['responses']['processing'])
-                self._action_vision()
-                
-            elif any(c in text for c in cmds['stop_listening']):
-                self.speak("Останавливаюсь.")
-                
-            elif any(c in text for c in cmds['check_battery']):
-                # Это событие можно отправить в main через очередь, но для простоты
-                self.speak("Функция проверки заряда доступна в автоматическом режиме.")
+        match = self.matcher.match(text, self._accept)
+        if match is None:
+            return False
+        return self._dispatch(match)
+
+    def _dispatch(self, match):
+        handler = self.handlers.get(match.intent)
+        if handler is None:
+            logger.warning(f"Нет обработчика для намерения {match.intent}")
+            return False
+        if match.score < 1.0:
+            logger.info(f"Неточное совпадение '{match.phrase}' ({match.score:.2f})")
+        if self.on_dispatch:
+            self.on_dispatch(match)
+        try:
+            self.actions.put_nowait((handler, match))
+        except queue.Full:
+            logger.warning(f"Очередь действий занята, команда {match.intent} пропущена")
+        return True
+
+    def _cmd_vision(self, match):
+        self._action_vision()
+
+    def _cmd_stop(self, match):
+        self.speak("Останавливаюсь.")
+
+    def _cmd_battery(self, match):
+        # Это событие можно отправить в main через очередь, но для простоты
+        self.speak("Функция проверки заряда доступна в автоматическом режиме.")
+
+    def _history(self):
+        # Индекс недавних детекций (detection_index.py): ответ без нового захвата
+        if not self.vision_engine:
+            self.speak("Модуль зрения не подключен.")
+            return None
+        return self.vision_engine.index
+
+    def _object(self, match):
+        return object_label(self.object_matcher, match)
+
+    def _accept(self, match):
+        return accept_history(match, self.object_matcher, self.config.get('periods', DEFAULT_PERIODS))
+
+    def _period(self, match):
+        periods = self.config.get('periods', DEFAULT_PERIODS)
+        for token in match.tokens or []:
+            if token in periods:
+                return token, periods[token]
+        return 'час', 3600
+
+    def _cmd_last_seen(self, match):
+        index = self._history()
+        if index is None:
+            return
+        label = self._object(match)
+        if label is None:
+            self.speak(self.config['responses'].get('which_object', "Что именно?"))
+            return
+        self.speak(index.format_last_seen(label))
+
+    def _cmd_count_recent(self, match):
+        # Без объекта - сводка по всем классам за период
+        index = self._history()
+        if index is None:
+            return
+        word, seconds = self._period(match)
+        self.speak(index.format_count(self._object(match), seconds, word))
+
+    def _cmd_where_usually(self, match):
+        index = self._history()
+        if index is None:
+            return
+        label = self._object(match)
+        if label is None:
+            self.speak(self.config['responses'].get('which_object', "Что именно?"))
+            return
+        self.speak(index.format_where(label))
+
+    def capture_stats(self):
+        #Переполнения захвата и задержка захват -> декодер
+        return self.capture.stats() if self.capture else {}
+
+    def _report(self):
+        self.vad.report()
+        logger.info(f"Сегментов речи {self.stats['segments']}, "
+                    f"слов активации {self.stats['triggers']}, команд {self.stats['commands']} "
+                    f"(по промежуточной гипотезе {self.stats['early']})")
+        ms = self.model_stats
+        logger.info(f"Модель Vosk: {'в памяти' if self.model else 'выгружена'}, "
+                    f"загрузок {ms['loads']} (последняя {ms['load_s']:.2f} с, +{ms['rss_mb']:.0f} МБ), "
+                    f"выгрузок {ms['unloads']} (принудительных {ms['evictions']}, "
+                    f"отложенных {ms['evictions_deferred']}), пропущено фраз до перезагрузки {ms['reloads_deferred']}")
+        cs = self.capture_stats()
+        if cs:
+            overflows = f"PortAudio {cs['input_overflows']}, " if 'input_overflows' in cs else ""
+            logger.info(f"Захват: переполнений {overflows}"
+                        f"буфера {cs['ring_overruns']} ({cs['dropped_s']:.1f} с потеряно), "
+                        f"задержка {cs['lag_avg_ms']:.0f} ms (макс {cs['lag_max_ms']:.0f})")
 
     def _action_vision(self):
-        if self.vision_engine:
-            # Прямой вызов зрения
-            dets = self.vision_engine.process_frame()
-            text = self.vision_engine.format_detections_for_speech(dets)
-            self.speak(text)
-        else:
+        if not self.vision_engine:
             self.speak("Модуль зрения не подключен.")
+            return
+        # Запрос не блокирует поток действий: свежий кадр из кэша отвечает сразу,
+        # иначе ответ прозвучит по готовности захвата
+        future = self.vision_engine.query()
+        if not future.done():
+            self.speak(self.config['responses']['processing'])
+        future.add_done_callback(self._on_vision_done)
+
+    def _on_vision_done(self, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Ошибка зрения: {error}")
+            self.speak(self.config['responses']['error'])
+            return
+        self.speak(self.vision_engine.format_detections_for_speech(future.result()))
 
     def speak(self, text):
         if not text: return
@@ -385,6 +1098,8 @@ import subprocess
 import os
 import wave
 from pathlib import Path
+from op_markers import marked, OP_SYNTH, OP_PLAY
+import event_journal
 
 logger = logging.getLogger(__name__)
 
@@ -421,7 +1136,9 @@ class AudioProcessor:
             
             if type_ == 'tts':
                 text = item.get('text')
-                self._synthesize_and_play(text)
+                start = time.monotonic()
+                ok = self._synthesize_and_play(text)
+                event_journal.record_speech(text, ok, time.monotonic() - start)
             elif type_ == 'file':
                 path = item.get('path')
                 self._play_wav(path)
@@ -449,18 +1166,22 @@ class AudioProcessor:
                 # Piper выводит raw audio (pcm), нужно сконвертировать или играть как raw
                 # Проще сказать piper вывести wav
                 cmd = f"echo '{text}' | piper --model {self.model_path} --output_file {wav_file}"
-                os.system(cmd)
+                with marked(OP_SYNTH):
+                    os.system(cmd)
             
             # 2. Воспроизведение
             self._play_wav(wav_file)
+            return True
             
         except Exception as e:
             logger.error(f"TTS Error: {e}")
+            return False
 
     def _play_wav(self, path):
         if os.path.exists(path):
             # Используем paplay (PulseAudio Play) для Bluetooth совместимости
-            subprocess.run(['paplay', path], timeout=10)
+            with marked(OP_PLAY):
+                subprocess.run(['paplay', path], timeout=10)
 
     def cleanup(self):
         self.running = False
@@ -468,10 +1189,13 @@ class AudioProcessor:
 
 # 7. POWER_MANAGER.PY
 files['power_manager.py'] = """#!/usr/bin/env python3
+import os
 import time
 import logging
 import subprocess
-from smbus2 import SMBus
+from ina219_backend import open_bus
+from power_broker import PowerBrokerClient
+import event_journal
 
 logger = logging.getLogger(__name__)
 
@@ -480,14 +1204,27 @@ class PowerManager:
         self.config = config
         self.bus_id = config.get('i2c_bus', 1)
         self.address = config.get('i2c_address', 0x42)
+        # None -> AIVA_I2C_BACKEND или настоящая шина; "sim:..." для отладки без UPS HAT
+        self.backend = config.get('backend')
+        self.shutdown_command = config.get('shutdown_command', 'sudo shutdown -h now')
+        # Снимок power_broker.py: INA219 принадлежит брокеру, сами шину не трогаем
+        self.broker_snapshot = config.get('broker_snapshot')
+        self.broker = None
+        self.bus = None
         self.running = False
         self.last_warn = 0
+        self.last_voltage = 0.0
 
     def initialize(self) -> bool:
         try:
-            with SMBus(self.bus_id) as bus:
-                # Калибровка INA219
-                bus.write_word_data(self.address, 0x00, 0x399F)
+            if self.broker_snapshot:
+                self.broker = PowerBrokerClient(self.broker_snapshot,
+                                                max_age=self.config.get('broker_max_age', 10.0))
+                self.broker.snapshot()
+                self.running = True
+                logger.info("UPS Monitor: данные от брокера питания")
+                return True
+            self._open_bus()
             self.running = True
             logger.info("UPS Monitor (INA219) активен")
             return True
@@ -495,29 +1232,55 @@ class PowerManager:
             logger.error(f"UPS Monitor ошибка: {e}")
             return False
 
+    def _open_bus(self):
+        # Шина открыта на всё время работы (симулятор хранит состояние батареи)
+        self.bus = open_bus(self.backend, self.bus_id)
+        # Калибровка INA219
+        self.bus.write_word_data(self.address, 0x00, 0x399F)
+
+    def _broker_voltage(self):
+        # None - брокер остановлен или завис: читаем INA219 сами, пока он не вернётся
+        try:
+            voltage = self.broker.snapshot()['voltage']
+        except (OSError, ValueError, TimeoutError) as e:
+            if self.bus is None:
+                logger.warning(f"Брокер питания недоступен ({e}), читаю INA219 напрямую")
+                self._open_bus()
+            return None
+        if self.bus is not None:
+            logger.info("Брокер питания снова доступен")
+            self.bus.close()
+            self.bus = None
+        return voltage
+
     def check_status(self, voice_assistant=None):
         if not self.running: return
 
         try:
-            with SMBus(self.bus_id) as bus:
-                val = bus.read_word_data(self.address, 0x02)
+            voltage = self._broker_voltage() if self.broker else None
+            if voltage is None:
+                val = self.bus.read_word_data(self.address, 0x02)
                 val = ((val & 0xFF) << 8) | (val >> 8)
                 voltage = (val >> 3) * 0.004
                 
             if voltage < 0.1: return # Ошибка чтения
+            self.last_voltage = voltage
+            event_journal.record_power('sample', voltage)
             
             # Выключение
             if voltage < self.config['shutdown_voltage']:
                 logger.critical(f"Батарея {voltage:.2f}V. Выключение...")
+                event_journal.record_power('critical', voltage)
                 if voice_assistant:
                     voice_assistant.speak("Батарея разряжена. Выключаюсь.")
                     time.sleep(3)
-                os.system("sudo shutdown -h now")
+                os.system(self.shutdown_command)
                 
             # Предупреждение
             elif voltage < self.config['warning_voltage']:
                 if time.time() - self.last_warn > 300: # раз в 5 мин
                     logger.warning(f"Низкий заряд: {voltage:.2f}V")
+                    event_journal.record_power('warning', voltage)
                     if voice_assistant:
                         voice_assistant.speak("Низкий заряд батареи.")
                     self.last_warn = time.time()
@@ -527,172 +1290,1768 @@ class PowerManager:
 
     def cleanup(self):
         self.running = False
+        if self.bus:
+            self.bus.close()
+        if self.broker:
+            self.broker.close()
 """
 
 # 8. BLUETOOTH_MANAGER.PY
 files['bluetooth_manager.py'] = """#!/usr/bin/env python3
 import time
 import logging
+import threading
 import subprocess
+from op_markers import marked, OP_BT_RECONNECT
 
 logger = logging.getLogger(__name__)
 
+BLUEZ_SERVICE = 'org.bluez'
+DEVICE_IFACE = 'org.bluez.Device1'
+PROPS_IFACE = 'org.freedesktop.DBus.Properties'
+
+# Порядок предпочтения профилей гарнитуры (микрофон + звук)
+HEADSET_PROFILES = ['handsfree_head_unit', 'headset_head_unit']
+
 class BluetoothManager:
     def __init__(self, config):
         self.config = config
-        self.mac = config['headphones']['mac_address']
-        
+        headphones = config['headphones']
+        self.mac = headphones['mac_address']
+        self.max_attempts = headphones.get('reconnect_attempts', 5)
+        self.backoff_initial = headphones.get('reconnect_backoff', 2.0)
+        self.backoff_max = headphones.get('reconnect_backoff_max', 120.0)
+        self.auto_connect = headphones.get('auto_connect', True)
+        self.profile = config.get('audio', {}).get('profile', 'headset_head_unit')
+
+        # "session" - заглушка BlueZ (bluez_standin.py) на сессионной шине
+        self.bus_type = config.get('dbus_bus', 'system')
+        adapter = config.get('adapter', 'hci0')
+        self.device_path = f"/org/bluez/{adapter}/dev_{self.mac.replace(':', '_')}"
+        self.card_name = f"bluez_card.{self.mac.replace(':', '_')}"
+
+        self.bus = None
+        self.loop = None
+        self.pulse = None
+        self.running = False
+        self.connected = threading.Event()
+        self.on_state_change = None  # callback(connected: bool)
+        self._wake = threading.Event()
+        self._profile_ready = False
+        self.stats = {'disconnects': 0, 'reconnect_attempts': 0}
+
     def initialize(self):
-        # Перезапуск bluetooth службы для надежности
-        subprocess.run(['sudo', 'systemctl', 'restart', 'bluetooth'])
-        time.sleep(2)
-        
+        import dbus
+        import dbus.mainloop.glib
+        from gi.repository import GLib
+
+        if self.bus_type == 'system':
+            # Перезапуск bluetooth службы для надежности
+            subprocess.run(['sudo', 'systemctl', 'restart', 'bluetooth'])
+            time.sleep(2)
+
+        dbus.mainloop.glib.threads_init()
+        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+        self.bus = dbus.SessionBus() if self.bus_type == 'session' else dbus.SystemBus()
+
+        # Состояние гарнитуры приходит сигналом PropertiesChanged, без опроса bluetoothctl
+        self.bus.add_signal_receiver(
+            self._on_properties_changed,
+            signal_name='PropertiesChanged',
+            dbus_interface=PROPS_IFACE,
+            path=self.device_path,
+        )
+        self.loop = GLib.MainLoop()
+        threading.Thread(target=self.loop.run, name='bt-dbus', daemon=True).start()
+
+        try:
+            props = self._device_props()
+            props.Set(DEVICE_IFACE, 'Trusted', dbus.Boolean(True))
+            self._set_connected(bool(props.Get(DEVICE_IFACE, 'Connected')))
+        except dbus.DBusException as e:
+            logger.warning(f"Гарнитура {self.mac} недоступна в BlueZ: {e}")
+
+    def start(self):
+        # Переподключение в фоне: главный цикл больше не ждёт Bluetooth
+        self.running = True
+        threading.Thread(target=self._reconnect_loop, name='bt-reconnect', daemon=True).start()
+
+    def _device(self):
+        return self.bus.get_object(BLUEZ_SERVICE, self.device_path)
+
+    def _device_props(self):
+        import dbus
+        return dbus.Interface(self._device(), PROPS_IFACE)
+
+    def _on_properties_changed(self, interface, changed, invalidated):
+        if interface == DEVICE_IFACE and 'Connected' in changed:
+            self._set_connected(bool(changed['Connected']))
+
+    def _set_connected(self, connected):
+        if connected == self.connected.is_set():
+            return
+        if connected:
+            logger.info("Bluetooth подключен.")
+            self.connected.set()
+        else:
+            logger.warning("BT отключен. Реконнект в фоне...")
+            self.connected.clear()
+            self._profile_ready = False
+            self.stats['disconnects'] += 1
+        self._wake.set()
+        if self.on_state_change:
+            self.on_state_change(connected)
+
+    def _reconnect_loop(self):
+        delay = self.backoff_initial
+        attempts = 0
+        while self.running:
+            if self.connected.is_set():
+                if not self._profile_ready:
+                    self._profile_ready = self._set_profile()
+                delay = self.backoff_initial
+                attempts = 0
+                # Профиль не настроился - повторим через backoff_initial
+                self._wake.wait(None if self._profile_ready else self.backoff_initial)
+                self._wake.clear()
+                continue
+
+            if not self.auto_connect or (self.max_attempts and attempts >= self.max_attempts):
+                # Попытки исчерпаны: ждём, пока гарнитура подключится сама
+                self._wake.wait(self.backoff_max)
+                self._wake.clear()
+                attempts = 0
+                continue
+
+            attempts += 1
+            self.stats['reconnect_attempts'] += 1
+            if self.connect_headphones():
+                continue
+            logger.info(f"Повтор подключения через {delay:.1f} с (попытка {attempts})")
+            self._wake.wait(delay)
+            self._wake.clear()
+            delay = min(delay * 2, self.backoff_max)
+
     def connect_headphones(self):
+        with marked(OP_BT_RECONNECT):
+            return self._connect_headphones()
+
+    def _connect_headphones(self):
+        import dbus
         logger.info(f"Подключение к {self.mac}...")
         try:
-            # Trust
-            subprocess.run(['bluetoothctl', 'trust', self.mac], timeout=5)
-            # Connect
-            res = subprocess.run(['bluetoothctl', 'connect', self.mac], capture_output=True, text=True, timeout=15)
-            
-            if "Connection successful" in res.stdout:
-                logger.info("Bluetooth подключен.")
-                time.sleep(2)
-                self._set_profile()
-                return True
-            else:
-                logger.warning(f"Ошибка подключения: {res.stdout}")
-                return False
-        except Exception as e:
-            logger.error(f"BT Error: {e}")
+            dbus.Interface(self._device(), DEVICE_IFACE).Connect(timeout=15)
+            # Connected=True придёт сигналом; здесь только подтверждаем
+            self.connected.wait(5)
+            return self.connected.is_set()
+        except dbus.DBusException as e:
+            logger.warning(f"Ошибка подключения: {e.get_dbus_message()}")
             return False
 
+    def _pulse_conn(self):
+        import pulsectl
+        if self.pulse is None:
+            self.pulse = pulsectl.Pulse('aiva-bluetooth')
+        return self.pulse
+
     def _set_profile(self):
-        # Принудительно ставим профиль гарнитуры (микрофон + звук)
-        card = f"bluez_card.{self.mac.replace(':', '_')}"
+        # Профиль гарнитуры и устройства по умолчанию через постоянное соединение с PulseAudio
+        import pulsectl
         logger.info("Настройка аудио профиля...")
-        
-        # Пробуем Handsfree
-        subprocess.run(['pactl', 'set-card-profile', card, 'handsfree_head_unit'])
-        time.sleep(1)
-        # Пробуем Headset (если handsfree не сработал)
-        subprocess.run(['pactl', 'set-card-profile', card, 'headset_head_unit'])
-        
-        # Делаем дефолтным
-        self._set_default('sinks')
-        self._set_default('sources')
+        try:
+            pulse = self._pulse_conn()
+            card = self._wait_card(pulse, timeout=5.0)
+            if card is None:
+                logger.warning(f"Карта {self.card_name} не появилась в PulseAudio")
+                return False
 
-    def _set_default(self, type_):
-        res = subprocess.run(['pactl', 'list', 'short', type_], capture_output=True, text=True)
-        for line in res.stdout.splitlines():
-            if 'bluez' in line:
-                dev = line.split()[0]
-                subprocess.run(['pactl', 'set-default-' + type_[:-1], dev])
+            available = {p.name for p in card.profile_list if p.available}
+            preferred = [self.profile] + [p for p in HEADSET_PROFILES if p != self.profile]
+            for name in preferred:
+                if name in available:
+                    pulse.card_profile_set(card, name)
+                    break
+
+            for sink in pulse.sink_list():
+                if sink.card == card.index:
+                    pulse.default_set(sink)
+            for source in pulse.source_list():
+                if source.card == card.index and not source.name.endswith('.monitor'):
+                    pulse.default_set(source)
+            return True
+        except pulsectl.PulseError as e:
+            logger.error(f"PulseAudio: {e}")
+            self._close_pulse()
+            return False
+
+    def _wait_card(self, pulse, timeout):
+        # Карта появляется через доли секунды после Connected - ждём её, а не фиксированную паузу
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for card in pulse.card_list():
+                if card.name == self.card_name:
+                    return card
+            time.sleep(0.2)
+        return None
+
+    def _close_pulse(self):
+        if self.pulse is not None:
+            self.pulse.close()
+            self.pulse = None
 
     def is_connected(self):
-        res = subprocess.run(['bluetoothctl', 'info', self.mac], capture_output=True, text=True)
-        return "Connected: yes" in res.stdout
+        return self.connected.is_set()
 
     def cleanup(self):
-        pass
+        self.running = False
+        self._wake.set()
+        if self.loop:
+            self.loop.quit()
+        self._close_pulse()
 """
 
 # 9. MAIN.PY
 files['main.py'] = """#!/usr/bin/env python3
+import os
 import sys
 import time
-import threading
-import queue
+import signal
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import yaml
+import metrics
+import profiling
+import event_journal
+from log_setup import setup_logging
 from vision_engine import VisionEngine
 from voice_assistant import VoiceAssistant
 from bluetooth_manager import BluetoothManager
 from power_manager import PowerManager
 from audio_processor import AudioProcessor
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[logging.StreamHandler(), logging.FileHandler('system.log')]
-)
+# Потоки не пишут на SD сами: очередь -> пачки в tmpfs -> сжатые сегменты в logs/ (log_setup.py)
+with open("config.yaml") as f:
+    setup_logging('system', yaml.safe_load(f)['system'].get('logging', {}),
+                  fmt='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
 logger = logging.getLogger("System")
 
+class LoopQueue:
+    # asyncio.Queue, в которую потоки (голос, питание) кладут без блокировки:
+    # элемент передаётся в цикл событий, при переполнении выбрасывается самый старый
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, item, block=False, timeout=None):
+        self.loop.call_soon_threadsafe(self._offer, (time.monotonic(), item))
+
+    put_nowait = put
+
+    def _offer(self, entry):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(entry)
+
+    async def get(self):
+        #(monotonic постановки, элемент)
+        return await self.queue.get()
+
+class TaskStats:
+    # Длительность шагов задачи (и ожидание в очереди для audio)
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.errors = 0
+
+    def add(self, duration, wait=0.0):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def summary(self):
+        if not self.count:
+            return "нет вызовов"
+        text = f"n={self.count}, среднее {self.total / self.count * 1000:.1f} ms, макс {self.max * 1000:.1f} ms"
+        if self.wait_max:
+            text += f", в очереди ср. {self.wait_total / self.count * 1000:.1f} ms, макс {self.wait_max * 1000:.1f} ms"
+        if self.errors:
+            text += f", ошибок {self.errors}"
+        return text
+
 class System:
+    # Оркестратор на asyncio: каждая подсистема - своя задача, блокирующие вызовы (TTS, I2C, D-Bus)
+    # уходят в ограниченный пул потоков, поэтому проверка питания не ждёт ни TTS, ни Bluetooth
     def __init__(self):
-        with open("config.yaml") as f:
+        self.config_path = "config.yaml"
+        self.config_mtime = os.stat(self.config_path).st_mtime
+        with open(self.config_path) as f:
             self.config = yaml.safe_load(f)
-            
-        self.q_det = queue.Queue(maxsize=1)
-        self.q_cmd = queue.Queue(maxsize=5)
-        self.q_audio = queue.Queue(maxsize=5)
-        
+
+        self.loop = asyncio.get_running_loop()
+        system = self.config['system']
+        self.pool = ThreadPoolExecutor(max_workers=system.get('executor_workers', 3),
+                                       thread_name_prefix='aiva-io')
+        # Цикл распознавания живёт всё время работы - отдельный поток, чтобы не занимать пул
+        self.voice_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aiva-voice')
+        self.loop.set_default_executor(self.pool)
+
+        self.q_det = LoopQueue(self.loop, 1)
+        self.q_cmd = LoopQueue(self.loop, 5)
+        self.q_audio = LoopQueue(self.loop, 5)
+
         self.power = PowerManager(self.config['power'])
         self.bt = BluetoothManager(self.config['bluetooth'])
         self.vision = VisionEngine(self.config['vision'])
         self.audio = AudioProcessor(self.config['voice']) # Config voice contains TTS info
         self.voice = VoiceAssistant(self.config['voice'], self.q_det, self.q_cmd, self.q_audio)
-        
-        self.running = True
 
-    def run(self):
-        # 1. Hardware Init
-        self.power.initialize()
-        
-        # 2. Bluetooth (blocking)
-        self.bt.initialize()
-        if self.config['bluetooth']['headphones']['auto_connect']:
-            self.bt.connect_headphones()
-            
-        # 3. Engines
-        self.audio.initialize()
-        self.vision.initialize()
-        self.voice.initialize()
-        
+        self.stop_event = asyncio.Event()
+        self.stats = {}
+        self.report_interval = system.get('report_interval', 300)
+        self.metrics_config = system.get('metrics', {})
+        self.metrics_writer = None
+        self.gc_pauses = None
+        if self.metrics_config.get('enabled', False):
+            self.metrics_writer = metrics.TextfileWriter('aiva_v1', self.metrics_config.get('dir', metrics.DEFAULT_DIR))
+            self.gc_pauses = metrics.GcPauses()
+        # SIGUSR1 - сэмплер стеков, SIGUSR2 - разница tracemalloc (файлы в /dev/shm)
+        profiling.install('aiva_v1', system.get('profiling', {}))
+        # Кадры, фразы и события питания - в бинарный журнал (event_journal.py query/stats)
+        event_journal.configure(system.get('journal', {}), 'aiva_v1')
+
+    async def _blocking(self, name, func, *args):
+        # Блокирующий вызов в пуле с учётом длительности по имени задачи
+        start = time.monotonic()
+        try:
+            return await self.loop.run_in_executor(self.pool, func, *args)
+        finally:
+            self.stats.setdefault(name, TaskStats()).add(time.monotonic() - start)
+
+    async def run(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(sig, self.stop_event.set)
+
+        # Инициализация подсистем параллельно: Bluetooth (перезапуск службы) не задерживает остальные
+        names = ('power', 'bluetooth', 'audio', 'vision')
+        results = await asyncio.gather(
+            self._blocking('init.power', self.power.initialize),
+            self._blocking('init.bluetooth', self._init_bluetooth),
+            self._blocking('init.audio', self.audio.initialize),
+            self._blocking('init.vision', self.vision.initialize),
+            return_exceptions=True,
+        )
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка инициализации {name}: {result}")
+        # Голос последним: приветствие уходит в очередь audio
+        await self._blocking('init.voice', self.voice.initialize)
+
         # Связываем голос и зрение
         self.voice.vision_engine = self.vision
-        
-        # Запуск потоков
-        t_voice = threading.Thread(target=self.voice.process, daemon=True)
-        t_audio = threading.Thread(target=self._audio_loop, daemon=True)
-        
-        t_voice.start()
-        t_audio.start()
-        
+
         logger.info("Система запущена!")
-        
         try:
-            while self.running:
-                # Главный цикл мониторинга
-                self.power.check_status(self.voice)
-                
-                # Проверка BT
-                if not self.bt.is_connected():
-                    logger.warning("BT отключен. Реконнект...")
-                    self.bt.connect_headphones()
-                    
-                time.sleep(5)
-        except KeyboardInterrupt:
-            self.cleanup()
-
-    def _audio_loop(self):
-        while self.running:
+            async with asyncio.TaskGroup() as tg:
+                tasks = [
+                    tg.create_task(self._voice_task(), name='voice'),
+                    tg.create_task(self._audio_task(), name='audio'),
+                    tg.create_task(self._periodic('power', self.config['power'].get('check_interval', 5),
+                                                  self.power.check_status, self.voice), name='power'),
+                    tg.create_task(self._periodic('config', 5, self._check_config), name='config'),
+                    tg.create_task(self._periodic('memory', 5, self._check_memory), name='memory'),
+                    tg.create_task(self._lag_task(), name='lag'),
+                    tg.create_task(self._report_task(), name='report'),
+                ]
+                if self.metrics_writer is not None:
+                    tasks.append(tg.create_task(self._metrics_task(), name='metrics'))
+                await self.stop_event.wait()
+                logger.info("Остановка задач...")
+                # Отмена не прерывает поток распознавания - он выходит по флагу в cleanup()
+                self.voice.cleanup()
+                for task in tasks:
+                    task.cancel()
+        except* Exception as group:
+            for e in group.exceptions:
+                logger.error(f"Задача завершилась с ошибкой: {e!r}")
+        finally:
+            await self.cleanup()
+
+    def _init_bluetooth(self):
+        # Bluetooth: состояние по сигналам D-Bus, переподключение в своём потоке
+        self.bt.initialize()
+        self.bt.start()
+
+    async def _voice_task(self):
+        if not self.voice.running:
+            logger.warning("Голосовой ассистент не инициализирован, задача voice не запущена")
+            return
+        while not self.stop_event.is_set():
+            await self.loop.run_in_executor(self.voice_thread, self.voice.process)
+            if self.stop_event.is_set() or not self.voice.running:
+                break
+            logger.warning("Цикл распознавания завершился, перезапуск через 2 с")
+            await asyncio.sleep(2)
+
+    async def _audio_task(self):
+        stats = self.stats.setdefault('audio', TaskStats())
+        while True:
+            queued, item = await self.q_audio.get()
+            start = time.monotonic()
+            try:
+                await self.loop.run_in_executor(self.pool, self.audio.play_audio, item)
+            except Exception as e:
+                # Ошибка одного сообщения не должна отменять остальные задачи TaskGroup
+                stats.errors += 1
+                logger.error(f"Ошибка воспроизведения: {e!r}")
+            stats.add(time.monotonic() - start, start - queued)
+
+    async def _periodic(self, name, interval, func, *args):
+        # Шаг задачи - в пуле; интервал считается от начала шага, без накопления дрейфа.
+        # Ошибка шага считается и логируется, задача продолжает работу
+        next_run = self.loop.time()
+        while True:
+            try:
+                await self._blocking(name, func, *args)
+            except Exception as e:
+                self.stats[name].errors += 1
+                logger.error(f"Ошибка шага задачи {name}: {e!r}")
+            next_run = max(next_run + interval, self.loop.time())
+            await asyncio.sleep(next_run - self.loop.time())
+
+    async def _lag_task(self):
+        # Задержка цикла событий: насколько позже запланированного просыпается sleep
+        stats = self.stats.setdefault('loop_lag', TaskStats())
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(1.0)
+            stats.add(max(0.0, self.loop.time() - start - 1.0))
+
+    async def _report_task(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self._report()
+
+    def _report(self):
+        for name, st in sorted(self.stats.items()):
+            logger.info(f"Задача {name}: {st.summary()}")
+        if self.q_audio.dropped:
+            logger.info(f"Очередь audio: выброшено {self.q_audio.dropped} сообщений")
+
+    async def _metrics_task(self):
+        # Метрики для scripts/metrics_exporter.py: сбор - чтение счётчиков, запись - один файл в tmpfs
+        interval = self.metrics_config.get('interval', 5)
+        while True:
+            await asyncio.sleep(interval)
             try:
-                item = self.q_audio.get(timeout=1)
-                self.audio.play_audio(item)
-            except queue.Empty:
-                pass
+                self.metrics_writer.write(self._metrics())
+            except Exception as e:
+                self.stats.setdefault('metrics', TaskStats()).errors += 1
+                logger.error(f"Ошибка записи метрик: {e!r}")
+
+    def _metrics(self):
+        exp = metrics.Exposition()
+        vad = self.voice.vad
+        exp.gauge('aiva_vad_duty_cycle', vad.duty_cycle(), 'Доля аудио, ушедшая в Vosk')
+        exp.counter('aiva_vad_segments_total', vad.segments, 'Сегментов речи по VAD')
+        for key, value in self.voice.stats.items():
+            exp.counter('aiva_voice_events_total', value, 'Распознавание: сегменты, триггеры, команды', kind=key)
+        ms = self.voice.model_stats
+        exp.gauge('aiva_vosk_loaded', 1 if self.voice.model else 0, 'Модель Vosk в памяти')
+        exp.gauge('aiva_vosk_model_rss_bytes', int(ms['rss_mb'] * 1024 * 1024), 'Прирост RSS при загрузке модели')
+        for key in ('loads', 'unloads', 'evictions', 'evictions_deferred', 'reloads_deferred'):
+            exp.counter('aiva_vosk_model_events_total', ms[key], 'Загрузки и выгрузки модели Vosk', kind=key)
+        cs = self.voice.capture_stats()
+        if cs:
+            exp.gauge('aiva_capture_lag_seconds', cs['lag_avg_ms'] / 1000, 'Задержка захват -> декодер', stat='avg')
+            exp.gauge('aiva_capture_lag_seconds', cs['lag_max_ms'] / 1000, 'Задержка захват -> декодер', stat='max')
+            exp.counter('aiva_capture_overruns_total', cs['ring_overruns'], 'Переполнения захвата', kind='ring')
+            if 'input_overflows' in cs:
+                exp.counter('aiva_capture_overruns_total', cs['input_overflows'], 'Переполнения захвата', kind='portaudio')
+
+        for key, value in self.vision.stats.items():
+            exp.counter('aiva_vision_requests_total', value, 'Запросы к камере: захваты, кэш, объединённые', kind=key)
+        for key, value in self.vision.stream_stats.items():
+            exp.counter('aiva_vision_stream_total', value, 'Поток rpicam-vid: кадры, перезапуски, ошибки', kind=key)
+        queries = self.vision.stats['queries']
+        exp.gauge('aiva_vision_cache_hit_ratio', self.vision.stats['cache_hits'] / queries if queries else 0,
+                  'Доля запросов из кэша детекций')
+        if self.power.last_voltage:
+            exp.gauge('aiva_v1_battery_voltage', self.power.last_voltage, 'Напряжение при последней проверке, В')
+
+        for name, st in self.stats.items():
+            exp.counter('aiva_task_runs_total', st.count, 'Шагов задачи', task=name)
+            exp.counter('aiva_task_seconds_total', st.total, 'Время шагов задачи', task=name)
+            exp.gauge('aiva_task_max_seconds', st.max, 'Самый долгий шаг задачи', task=name)
+            exp.counter('aiva_task_errors_total', st.errors, 'Шагов задачи с ошибкой', task=name)
+        exp.gauge('aiva_queue_depth', self.q_audio.queue.qsize(), 'Сообщений в очереди', queue='audio')
+        exp.counter('aiva_queue_dropped_total', self.q_audio.dropped, 'Выброшено из переполненной очереди', queue='audio')
+        self.gc_pauses.export(exp, process='aiva_v1')
+        return exp
+
+    def _check_config(self):
+        # Перечитываем config.yaml при изменении: голосовые команды подхватываются без перезапуска
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+            if mtime == self.config_mtime:
+                return
+            self.config_mtime = mtime
+            with open(self.config_path) as f:
+                config = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError) as e:
+            logger.error(f"Ошибка чтения {self.config_path}: {e}")
+            return
+        if not isinstance(config, dict) or not isinstance(config.get('voice'), dict) or 'system' not in config:
+            # Пустой или недописанный файл (сохранение редактором не атомарно) - ждём следующей записи
+            logger.error(f"{self.config_path} без секций voice/system, изменения пропущены")
+            return
+
+        if config['voice'] != self.config['voice']:
+            logger.info("Конфигурация голоса изменена, перестраиваю распознаватель")
+            self.voice.update_config(config['voice'])
+        self.config = config
 
-    def cleanup(self):
-        self.running = False
+    def _check_memory(self):
+        # Нехватка памяти (MemAvailable или PSI) - выгружаем модель Vosk, она самая крупная
+        mem = self.config['system'].get('memory', {})
+        available_mb = None
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        available_mb = int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            return
+
+        pressure = None
+        try:
+            with open('/proc/pressure/memory') as f:
+                # some avg10=1.23 avg60=... - доля времени, когда задачи ждали память
+                pressure = float(f.readline().split()[1].split('=')[1])
+        except (OSError, IndexError, ValueError):
+            pass
+
+        if available_mb is not None and available_mb < mem.get('min_available_mb', 64):
+            self.voice.evict(f"MemAvailable {available_mb:.0f} МБ")
+        elif pressure is not None and pressure > mem.get('psi_some_avg10', 20.0):
+            self.voice.evict(f"PSI memory {pressure:.1f}%")
+
+    async def cleanup(self):
+        # Обратный порядок запуска: голос (ждём выхода цикла), зрение, звук, Bluetooth, питание
         self.voice.cleanup()
-        self.vision.cleanup()
-        self.audio.cleanup()
-        self.power.cleanup()
+        try:
+            await asyncio.wait_for(self.loop.run_in_executor(None, self.voice_thread.shutdown), 5)
+        except asyncio.TimeoutError:
+            logger.warning("Цикл распознавания не завершился за 5 с")
+        for name, part in (('vision', self.vision), ('audio', self.audio),
+                           ('bluetooth', self.bt), ('power', self.power)):
+            try:
+                await self._blocking(f'cleanup.{name}', part.cleanup)
+            except Exception as e:
+                logger.error(f"Ошибка остановки {name}: {e}")
+        self._report()
+        if self.metrics_writer is not None:
+            self.metrics_writer.remove()
+        event_journal.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
         logger.info("Остановка.")
 
+async def main():
+    await System().run()
+
 if __name__ == "__main__":
-    System().run()
+    asyncio.run(main())
+"""
+
+# 10. OP_MARKERS.PY (маркеры операций для scripts/energy_profiler.py)
+files['op_markers.py'] = shared_module('op_markers.py')
+
+# 11. INA219_BACKEND.PY (настоящая шина, симулятор батареи, воспроизведение трасс)
+files['ina219_backend.py'] = shared_module('ina219_backend.py')
+
+# 12. POWER_BROKER.PY + UPS_MONITOR.PY (единственный владелец INA219 и его клиент)
+files['power_broker.py'] = shared_module('power_broker.py')
+files['ups_monitor.py'] = shared_module('ups_monitor.py')
+files['power_trace.py'] = shared_module('power_trace.py')
+
+# 13. BLUEZ_STANDIN.PY (заглушка org.bluez на сессионной шине для проверки BluetoothManager)
+files['bluez_standin.py'] = """#!/usr/bin/env python3
+# Заглушка BlueZ на сессионной шине для проверки BluetoothManager без гарнитуры.
+#
+#   python3 bluez_standin.py --mac XX:XX:XX:XX:XX:XX --fail-first 2 --drop-every 30
+#   (в config.yaml: bluetooth.dbus_bus: "session")
+import sys
+import logging
+import argparse
+import dbus
+import dbus.service
+import dbus.mainloop.glib
+from gi.repository import GLib
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+logger = logging.getLogger("BlueZStandin")
+
+DEVICE_IFACE = 'org.bluez.Device1'
+PROPS_IFACE = 'org.freedesktop.DBus.Properties'
+
+class FakeDevice(dbus.service.Object):
+    def __init__(self, bus, path, mac, fail_first, connect_delay):
+        super().__init__(bus, path)
+        self.props = {
+            'Address': dbus.String(mac),
+            'Name': dbus.String('Standin Headset'),
+            'Paired': dbus.Boolean(True),
+            'Trusted': dbus.Boolean(False),
+            'Connected': dbus.Boolean(False),
+        }
+        self.fail_left = fail_first
+        self.connect_delay = connect_delay
+        self.connects = 0
+
+    def _update(self, name, value):
+        if self.props[name] == value:
+            return
+        self.props[name] = value
+        self.PropertiesChanged(DEVICE_IFACE, {name: value}, [])
+
+    @dbus.service.method(DEVICE_IFACE, in_signature='', out_signature='',
+                         async_callbacks=('reply', 'error'))
+    def Connect(self, reply, error):
+        self.connects += 1
+        if self.fail_left > 0:
+            self.fail_left -= 1
+            logger.info(f"Connect #{self.connects}: отказ")
+            error(dbus.DBusException('Page Timeout', name='org.bluez.Error.Failed'))
+            return
+
+        def done():
+            logger.info(f"Connect #{self.connects}: подключено")
+            self._update('Connected', dbus.Boolean(True))
+            reply()
+            return False
+        GLib.timeout_add(int(self.connect_delay * 1000), done)
+
+    @dbus.service.method(DEVICE_IFACE, in_signature='', out_signature='')
+    def Disconnect(self):
+        self._update('Connected', dbus.Boolean(False))
+
+    @dbus.service.method(PROPS_IFACE, in_signature='ss', out_signature='v')
+    def Get(self, interface, name):
+        return self.props[name]
+
+    @dbus.service.method(PROPS_IFACE, in_signature='s', out_signature='a{sv}')
+    def GetAll(self, interface):
+        return self.props
+
+    @dbus.service.method(PROPS_IFACE, in_signature='ssv', out_signature='')
+    def Set(self, interface, name, value):
+        self._update(name, value)
+
+    @dbus.service.signal(PROPS_IFACE, signature='sa{sv}as')
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+    def drop(self):
+        # Имитация обрыва связи с гарнитурой
+        if self.props['Connected']:
+            logger.info("Обрыв связи")
+            self._update('Connected', dbus.Boolean(False))
+        return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка org.bluez на сессионной шине")
+    parser.add_argument('--mac', default='XX:XX:XX:XX:XX:XX')
+    parser.add_argument('--adapter', default='hci0')
+    parser.add_argument('--fail-first', type=int, default=0, help="Сколько первых Connect отклонить")
+    parser.add_argument('--connect-delay', type=float, default=0.5, help="Задержка Connect, с")
+    parser.add_argument('--drop-every', type=float, default=0, help="Обрывать связь каждые N с (0 - нет)")
+    args = parser.parse_args()
+
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bus = dbus.SessionBus()
+    name = dbus.service.BusName('org.bluez', bus, do_not_queue=True)
+    path = f"/org/bluez/{args.adapter}/dev_{args.mac.replace(':', '_')}"
+    device = FakeDevice(bus, path, args.mac, args.fail_first, args.connect_delay)
+    if args.drop_every > 0:
+        GLib.timeout_add(int(args.drop_every * 1000), device.drop)
+
+    logger.info(f"org.bluez на сессионной шине: {path}")
+    try:
+        GLib.MainLoop().run()
+    except KeyboardInterrupt:
+        pass
+    del name
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+"""
+
+# 14. VAD.PY (детектор речи перед Vosk: энергия + ZCR, адаптивный шум)
+files['vad.py'] = """#!/usr/bin/env python3
+import logging
+from collections import deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class VoiceActivityDetector:
+    # Детектор речи перед Vosk: энергия (RMS) и частота переходов через ноль по кадрам,
+    # адаптивный уровень шума, удержание после речи и предзапись начала фразы
+    def __init__(self, config, sample_rate=16000):
+        vad = config.get('vad', {})
+        self.enabled = vad.get('enabled', True)
+        self.sample_rate = sample_rate
+        self.frame = int(sample_rate * vad.get('frame_ms', 25) / 1000)
+        frame_s = self.frame / sample_rate
+
+        # energy_threshold - минимальный RMS речи (int16), ниже него порог не опускается
+        self.min_threshold = float(config.get('energy_threshold', 300))
+        self.noise_ratio = vad.get('noise_ratio', 3.0)
+        self.zcr_max = vad.get('zcr_max', 0.35)
+        self.start_frames = max(1, int(vad.get('start_ms', 50) / 1000 / frame_s))
+        self.hangover_frames = int(vad.get('hangover_ms', 400) / 1000 / frame_s)
+        self.max_segment_frames = int(vad.get('max_segment_ms', 15000) / 1000 / frame_s)
+        self.preroll = deque(maxlen=max(1, int(vad.get('preroll_ms', 300) / 1000 / frame_s)))
+
+        self.noise_floor = self.min_threshold / self.noise_ratio
+        self.active = False
+        self.run = 0        # подряд речевых кадров до начала сегмента
+        self.silence = 0    # подряд тихих кадров внутри сегмента
+        self.length = 0     # кадров в текущем сегменте
+        self.pending = b''  # хвост чанка, не кратный кадру
+
+        self.frames_total = 0
+        self.frames_passed = 0
+        self.segments = 0
+
+    def threshold(self):
+        return max(self.min_threshold, self.noise_floor * self.noise_ratio)
+
+    def features(self, samples):
+        #RMS и доля переходов через ноль для каждого кадра (векторно)
+        frames = samples.reshape(-1, self.frame).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame - 1)
+        return rms, zcr
+
+    def process(self, data):
+        #Возвращает (аудио для распознавателя, закончился ли сегмент речи)
+        if not self.enabled:
+            return data, False
+
+        data = self.pending + data
+        usable = len(data) - len(data) % (self.frame * 2)
+        self.pending = data[usable:]
+        if not usable:
+            return b'', False
+
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        rms, zcr = self.features(samples)
+        threshold = self.threshold()
+        # Широкополосный шум (шипение, ветер) - высокая ZCR при умеренной энергии
+        speech = (rms > threshold) & ((zcr < self.zcr_max) | (rms > 2 * threshold))
+
+        out = []
+        step = self.frame * 2
+        for i in range(len(rms)):
+            frame = data[i * step:(i + 1) * step]
+            self.frames_total += 1
+
+            if not self.active:
+                if speech[i]:
+                    self.run += 1
+                    if self.run >= self.start_frames:
+                        self.active = True
+                        self.silence = 0
+                        self.length = 0
+                        self.segments += 1
+                        out.extend(self.preroll)
+                        self.frames_passed += len(self.preroll)
+                        self.preroll.clear()
+                else:
+                    self.run = 0
+                    # Шум отслеживаем только в паузах: вниз быстро, вверх медленно
+                    alpha = 0.2 if rms[i] < self.noise_floor else 0.02
+                    self.noise_floor += alpha * (rms[i] - self.noise_floor)
+                if not self.active:
+                    self.preroll.append(frame)
+                    continue
+
+            out.append(frame)
+            self.frames_passed += 1
+            self.length += 1
+            if speech[i]:
+                self.silence = 0
+            else:
+                self.silence += 1
+            if self.length >= self.max_segment_frames:
+                # Слишком длинная "речь" - скорее всего вырос фон: принимаем его за новый шум
+                self.noise_floor = max(self.noise_floor, float(rms[i]) / self.noise_ratio * 1.1)
+                self.silence = self.hangover_frames + 1
+            if self.silence > self.hangover_frames:
+                self.active = False
+                self.run = 0
+                # Остаток чанка - уже следующая фраза, разберём его при следующем вызове
+                self.pending = data[(i + 1) * step:usable] + self.pending
+                return b''.join(out), True
+
+        return b''.join(out), False
+
+    def duty_cycle(self):
+        return self.frames_passed / self.frames_total if self.frames_total else 1.0
+
+    def report(self):
+        duty = self.duty_cycle()
+        logger.info(f"VAD: в распознаватель {duty:.0%} аудио "
+                    f"(сэкономлено {1 - duty:.0%}), сегментов {self.segments}, "
+                    f"шум {self.noise_floor:.0f}, порог {self.threshold():.0f}")
+"""
+
+# 15. VOICE_BENCHMARK.PY (RTF и точность распознавания: грамматика против открытой модели)
+files['voice_benchmark.py'] = """#!/usr/bin/env python3
+# Бенчмарк голосового стека на записанных фразах, без микрофона и гарнитуры.
+#
+# Манифест - строки "файл.wav<TAB>ожидаемый текст" (WAV 16 кГц, моно, 16 бит):
+#   python3 voice_benchmark.py grammar samples/manifest.tsv   # грамматика против открытой модели
+#   python3 voice_benchmark.py pipeline samples/manifest.tsv  # VAD -> Vosk -> команды, как в VoiceAssistant
+import sys
+import json
+import time
+import wave
+import queue
+import logging
+import argparse
+import numpy as np
+import yaml
+import vosk
+from voice_assistant import VoiceAssistant, build_grammar, accept_history, DEFAULT_PERIODS
+from command_matcher import CommandMatcher
+from audio_capture import AudioRingBuffer, WavSource
+
+CHUNK = 4000
+
+def load_manifest(path):
+    items = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            wav, _, text = line.rstrip('\\n').partition('\\t')
+            items.append((wav, text.lower().strip()))
+    return items
+
+def detect_intent(text, matcher, accept=None):
+    # Тот же индекс команд и фильтр вопросов о прошлом, что и в VoiceAssistant._handle_command
+    match = matcher.match(text, accept)
+    return match.intent if match else None
+
+def word_errors(reference, hypothesis):
+    # Расстояние Левенштейна по словам
+    ref, hyp = reference.split(), hypothesis.split()
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+def recognize(rec, path):
+    #(текст, секунды аудио, секунды декодирования)
+    with wave.open(path, 'rb') as wf:
+        if wf.getframerate() != 16000 or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: нужен WAV 16 кГц моно 16 бит")
+        audio_s = wf.getnframes() / wf.getframerate()
+        parts = []
+        decode_s = 0.0
+        while True:
+            data = wf.readframes(CHUNK)
+            if not data:
+                break
+            start = time.perf_counter()
+            accepted = rec.AcceptWaveform(data)
+            decode_s += time.perf_counter() - start
+            if accepted:
+                parts.append(json.loads(rec.Result()).get('text', ''))
+        start = time.perf_counter()
+        parts.append(json.loads(rec.FinalResult()).get('text', ''))
+        decode_s += time.perf_counter() - start
+    text = ' '.join(p for p in parts if p).replace('[unk]', '').split()
+    return ' '.join(text), audio_s, decode_s
+
+def run(name, make_rec, items, matcher, accept, verbose):
+    audio_total = decode_total = 0.0
+    errors = words = intents_ok = 0
+    for path, expected in items:
+        text, audio_s, decode_s = recognize(make_rec(), path)
+        e, n = word_errors(expected, text)
+        errors += e
+        words += n
+        intent_ok = detect_intent(text, matcher, accept) == detect_intent(expected, matcher, accept)
+        intents_ok += intent_ok
+        audio_total += audio_s
+        decode_total += decode_s
+        if verbose:
+            print(f"  [{name}] {path}: '{text}' {'OK' if intent_ok else 'MISS'}")
+    return {
+        'rtf': decode_total / audio_total if audio_total else 0.0,
+        'wer': errors / words if words else 0.0,
+        'intent_accuracy': intents_ok / len(items) if items else 0.0,
+        'audio_s': audio_total,
+    }
+
+def speech_end(path, threshold, frame=400):
+    # Конец речи в файле: последний кадр 25 мс с RMS выше energy_threshold
+    with wave.open(path, 'rb') as wf:
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    n = len(samples) // frame
+    if not n:
+        return 0.0
+    frames = samples[:n * frame].reshape(n, frame).astype(np.float32)
+    loud = np.flatnonzero(np.sqrt(np.mean(frames * frames, axis=1)) > threshold)
+    return (loud[-1] + 1) * frame / 16000 if len(loud) else n * frame / 16000
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def run_pipeline(va, items, matcher, accept, speed, verbose):
+    # Каждая фраза проходит весь путь VoiceAssistant.process: кольцо -> VAD -> Vosk -> команды
+    threshold = va.config['speech_recognition'].get('energy_threshold', 300)
+    audio_total = wall_total = cpu_total = 0.0
+    correct = false_actions = 0
+    latency_audio, latency_wall = [], []
+
+    for path, expected in items:
+        events = []
+        source = WavSource(AudioRingBuffer(10 * 16000 * 2), path, speed=speed)
+        va.on_dispatch = lambda m: events.append((m.intent, source.ring.position(16000), time.monotonic()))
+        va.command_deadline = 0.0
+        end_s = speech_end(path, threshold)
+
+        cpu_start, wall_start = time.process_time(), time.monotonic()
+        va.process(source)
+        cpu_total += time.process_time() - cpu_start
+        wall_total += time.monotonic() - wall_start
+        audio_total += source.audio_s
+
+        expected_intent = detect_intent(expected, matcher, accept)
+        got = events[0][0] if events else None
+        correct += got == expected_intent
+        false_actions += max(0, len(events) - (1 if expected_intent else 0))
+        if events and got == expected_intent:
+            # Отрицательная задержка - команда выполнена раньше конца фразы (PartialResult)
+            latency_audio.append((events[0][1] - end_s) * 1000)
+            if speed > 0:
+                latency_wall.append((events[0][2] - (wall_start + end_s / speed)) * 1000)
+        if verbose:
+            print(f"  {path}: ожидалось {expected_intent}, получено {[e[0] for e in events]}")
+
+    return {
+        'files': len(items),
+        'audio_s': audio_total,
+        'rtf': wall_total / audio_total if audio_total else 0.0,
+        'cpu_per_audio_s': cpu_total / audio_total if audio_total else 0.0,
+        'accuracy': correct / len(items) if items else 0.0,
+        'false_actions': false_actions,
+        'latency_audio_ms': {'p50': percentile(latency_audio, 50), 'p90': percentile(latency_audio, 90)},
+        'latency_wall_ms': {'p50': percentile(latency_wall, 50), 'p90': percentile(latency_wall, 90)},
+    }
+
+def make_matcher(config):
+    #(индекс команд, фильтр совпадений) - как в VoiceAssistant._build_matchers
+    sr = config['speech_recognition']
+    options = {'max_distance': sr.get('fuzzy_distance', 1), 'min_score': sr.get('min_score', 0.75)}
+    objects = CommandMatcher(config.get('objects', {}), **options)
+    periods = config.get('periods', DEFAULT_PERIODS)
+    return CommandMatcher(config['commands'], **options), lambda match: accept_history(match, objects, periods)
+
+def bench_grammar(config, items, args):
+    model = vosk.Model(config['speech_recognition']['model_path'])
+    grammar = json.dumps(build_grammar(config), ensure_ascii=False)
+    matcher, accept = make_matcher(config)
+    results = {
+        'grammar': run('grammar', lambda: vosk.KaldiRecognizer(model, 16000, grammar), items, matcher, accept,
+                       args.verbose),
+        'open': run('open', lambda: vosk.KaldiRecognizer(model, 16000), items, matcher, accept, args.verbose),
+    }
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+        return 0
+
+    print(f"Фраз: {len(items)}, аудио {results['open']['audio_s']:.1f} с")
+    print(f"{'режим':<10}{'RTF':>8}{'WER':>8}{'команды':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['rtf']:>8.3f}{r['wer']:>8.1%}{r['intent_accuracy']:>10.1%}")
+    return 0
+
+def bench_pipeline(config, items, args):
+    sr = config['speech_recognition']
+    sr['lazy_load'] = False  # загрузка модели не должна попасть в первую фразу
+    sr['idle_unload'] = 0
+    if args.no_wake:
+        sr['wake_word'] = False
+
+    va = VoiceAssistant(config, queue.Queue(), queue.Queue(), queue.Queue())
+    if not va.initialize():
+        return 1
+    # Действия не выполняем: меряем только решение о команде
+    va.handlers = {intent: (lambda match: None) for intent in va.handlers}
+    matcher, accept = make_matcher(config)
+    result = run_pipeline(va, items, matcher, accept, args.speed, args.verbose)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    la, lw = result['latency_audio_ms'], result['latency_wall_ms']
+    print(f"Фраз: {result['files']}, аудио {result['audio_s']:.1f} с, скорость подачи "
+          f"{'без пауз' if args.speed <= 0 else f'x{args.speed:g}'}")
+    print(f"RTF:                    {result['rtf']:.3f}")
+    print(f"CPU на секунду аудио:   {result['cpu_per_audio_s']:.3f} с")
+    print(f"Точность команд:        {result['accuracy']:.1%}, лишних действий {result['false_actions']}")
+    print(f"Задержка от конца речи: p50 {la['p50']:.0f} ms, p90 {la['p90']:.0f} ms (по аудио)")
+    if args.speed > 0:
+        print(f"                        p50 {lw['p50']:.0f} ms, p90 {lw['p90']:.0f} ms (по часам)")
+    return 0
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('manifest', help="TSV: файл.wav<TAB>ожидаемый текст")
+    common.add_argument('--config', default='config.yaml')
+    common.add_argument('--json', action='store_true', help="Результат в JSON")
+    common.add_argument('-v', '--verbose', action='store_true')
+
+    parser = argparse.ArgumentParser(description="Бенчмарк голосового стека на записанных фразах")
+    sub = parser.add_subparsers(dest='mode', required=True)
+    sub.add_parser('grammar', parents=[common], help="RTF и точность: грамматика против открытой модели")
+    pipeline = sub.add_parser('pipeline', parents=[common], help="Весь конвейер VoiceAssistant на файлах")
+    pipeline.add_argument('--speed', type=float, default=0, help="Темп подачи (1 - реальное время, 0 - без пауз)")
+    pipeline.add_argument('--no-wake', action='store_true', help="Без слова активации (фразы - только команды)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    with open(args.config) as f:
+        config = yaml.safe_load(f)['voice']
+    items = load_manifest(args.manifest)
+    if not items:
+        print("Пустой манифест", file=sys.stderr)
+        return 1
+
+    vosk.SetLogLevel(-1)
+    if args.mode == 'grammar':
+        return bench_grammar(config, items, args)
+    return bench_pipeline(config, items, args)
+
+if __name__ == "__main__":
+    sys.exit(main())
+"""
+
+# 16. COMMAND_MATCHER.PY (индекс команд: Aho-Corasick по токенам + исправление опечаток)
+files['command_matcher.py'] = """#!/usr/bin/env python3
+import re
+import logging
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# span - (первый токен, токен после последнего) во фразе пользователя,
+# tokens - токены фразы пользователя (после исправления опечаток): остаток вне span -
+# параметры команды ("когда последний раз была машина")
+Match = namedtuple('Match', ['intent', 'span', 'score', 'phrase', 'tokens'])
+
+TOKEN_RE = re.compile(r"[\\w']+")
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+def edit_distance(a, b, limit):
+    # Левенштейн с отсечкой: больше limit -> limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        prev, row[0] = row[0], i
+        best = row[0]
+        for j, cb in enumerate(b, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+            best = min(best, row[j])
+        if best > limit:
+            return limit + 1
+    return row[-1]
+
+class _Node:
+    __slots__ = ('next', 'fail', 'out', 'reach')
+
+    def __init__(self):
+        self.next = {}
+        self.fail = None
+        self.out = []       # (intent, число токенов, фраза)
+        self.reach = set()  # намерения фраз, которые ещё могут закончиться ниже этого узла
+
+class CommandMatcher:
+    # Индекс команд: Aho-Corasick по токенам + исправление опечаток Vosk по словарю удалений
+    # (стоимость поиска не зависит от числа фраз)
+    def __init__(self, commands=None, max_distance=1, min_score=0.75, min_fuzzy_len=4):
+        self.max_distance = max_distance
+        self.min_score = min_score
+        self.min_fuzzy_len = min_fuzzy_len  # короткие слова только точно
+        self.root = _Node()
+        self.vocabulary = set()
+        self.deletes = {}  # вариант с удалёнными буквами -> слова словаря
+        for intent, phrases in (commands or {}).items():
+            self._insert(intent, phrases)
+        self._build_links()
+
+    def add_intent(self, intent, phrases):
+        #Добавить намерение на ходу (автомат перестраивается целиком - это редкая операция)
+        self._insert(intent, phrases)
+        self._build_links()
+
+    def _insert(self, intent, phrases):
+        for phrase in phrases:
+            tokens = tokenize(phrase)
+            if not tokens:
+                continue
+            node = self.root
+            for token in tokens:
+                node = node.next.setdefault(token, _Node())
+                self._index_word(token)
+            node.out.append((intent, len(tokens), phrase))
+
+    def _index_word(self, word):
+        if word in self.vocabulary:
+            return
+        self.vocabulary.add(word)
+        if len(word) >= self.min_fuzzy_len:
+            for variant in self._deletions(word):
+                self.deletes.setdefault(variant, set()).add(word)
+
+    def _deletions(self, word):
+        variants = {word}
+        frontier = {word}
+        for _ in range(self.max_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+    def _build_links(self):
+        # Ссылки неудач обходом в ширину
+        self.root.fail = self.root
+        order = []
+        queue = deque()
+        for child in self.root.next.values():
+            child.fail = self.root
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for token, child in node.next.items():
+                fail = node.fail
+                while fail is not self.root and token not in fail.next:
+                    fail = fail.fail
+                child.fail = fail.next.get(token, self.root)
+                child.out = child.out + [o for o in child.fail.out if o not in child.out]
+                queue.append(child)
+
+        # Продолжения снизу вверх: нужны, чтобы решать по неполной фразе (match_partial)
+        for node in reversed(order):
+            node.reach = {o[0] for o in node.out}
+            for child in node.next.values():
+                node.reach |= child.reach
+
+    def _correct(self, token):
+        #(слово словаря, число правок) или (token, 0), если исправлять нечего
+        if token in self.vocabulary or len(token) < self.min_fuzzy_len:
+            return token, 0
+        best, best_cost = token, self.max_distance + 1
+        for variant in self._deletions(token):
+            for word in self.deletes.get(variant, ()):
+                cost = edit_distance(token, word, self.max_distance)
+                if cost < best_cost or (cost == best_cost and word < best):
+                    best, best_cost = word, cost
+        if best_cost > self.max_distance:
+            return token, 0
+        return best, best_cost
+
+    def _scan(self, tokens, costs, state=None):
+        matches = []
+        node = self.root
+        for end, token in enumerate(tokens, 1):
+            while node is not self.root and token not in node.next:
+                node = node.fail
+            node = node.next.get(token, self.root)
+            for intent, length, phrase in node.out:
+                start = end - length
+                edits = sum(costs[start:end])
+                chars = sum(len(t) for t in tokens[start:end])
+                score = 1.0 - edits / chars if chars else 0.0
+                if score >= self.min_score:
+                    matches.append(Match(intent, (start, end), score, phrase, tokens))
+        if state is not None:
+            state.append(node)
+        return matches
+
+    def match_all(self, text, accept=None):
+        #accept(match) -> False отбрасывает совпадение (не хватает параметров команды);
+        #если точных не осталось, пробуем исправление опечаток
+        tokens = tokenize(text)
+        matches = [m for m in self._scan(tokens, [0] * len(tokens)) if accept is None or accept(m)]
+        if not matches and self.max_distance > 0:
+            corrected = [self._correct(t) for t in tokens]
+            if any(cost for _, cost in corrected):
+                matches = [m for m in self._scan([w for w, _ in corrected], [c for _, c in corrected])
+                           if accept is None or accept(m)]
+        return matches
+
+    def match_partial(self, text):
+        #Совпадение по промежуточной гипотезе - только точное и однозначное:
+        #одно намерение во фразе и никакая более длинная фраза другого намерения ещё не начата
+        tokens = tokenize(text)
+        state = []
+        matches = self._scan(tokens, [0] * len(tokens), state)
+        # Фраза внутри более длинной ("стоп" в "стоп машина") не считается отдельной
+        matches = [m for m in matches
+                   if not any(o is not m and o.span[0] <= m.span[0] and m.span[1] <= o.span[1]
+                              for o in matches)]
+        intents = {m.intent for m in matches}
+        if len(intents) != 1:
+            return None
+        node = state[0]
+        while node is not self.root:
+            # Продолжения текущего суффикса и всех его более коротких суффиксов
+            if node.reach - intents:
+                return None
+            node = node.fail
+        return max(matches, key=lambda m: (m.span[1] - m.span[0], -m.span[0]))
+
+    def match(self, text, accept=None):
+        #Лучшее совпадение: выше score, затем длиннее фраза, затем раньше во фразе
+        matches = self.match_all(text, accept)
+        if not matches:
+            return None
+        return max(matches, key=lambda m: (m.score, m.span[1] - m.span[0], -m.span[0]))
+"""
+
+# 17. AUDIO_CAPTURE.PY (захват микрофона в кольцевой буфер, callback PyAudio)
+files['audio_capture.py'] = """#!/usr/bin/env python3
+import time
+import wave
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class AudioRingBuffer:
+    # Кольцевой буфер PCM с заранее выделенной памятью: пишет callback PyAudio, читает декодер.
+    # При переполнении затираются самые старые данные (задержка не растёт бесконечно)
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.written = 0   # всего записано байт
+        self.read_pos = 0  # всего прочитано байт
+        self.cond = threading.Condition()
+        self.stamps = deque()  # (начало, конец чанка в байтах от старта, monotonic захвата)
+        self.closed = False
+
+        self.overruns = 0       # раз, когда декодер не успел и данные затёрты
+        self.dropped_bytes = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+        self.lag_count = 0
+
+    def write(self, data, t_capture=None, block=False):
+        #block=True - ждать места вместо затирания (источники из файлов, где терять нечего)
+        n = len(data)
+        if n > self.capacity:
+            data = data[-self.capacity:]
+            n = self.capacity
+        with self.cond:
+            if block:
+                self.cond.wait_for(lambda: self.capacity - (self.written - self.read_pos) >= n or self.closed)
+                if self.closed:
+                    return
+            pos = self.written % self.capacity
+            first = min(n, self.capacity - pos)
+            self.view[pos:pos + first] = data[:first]
+            if first < n:
+                self.view[:n - first] = data[first:]
+            self.stamps.append((self.written, self.written + n, t_capture or time.monotonic()))
+            self.written += n
+
+            lost = self.written - self.read_pos - self.capacity
+            if lost > 0:
+                self.overruns += 1
+                self.dropped_bytes += lost
+                self.read_pos += lost
+                while self.stamps[0][1] <= self.read_pos:
+                    self.stamps.popleft()
+            self.cond.notify_all()
+
+    def read(self, size, timeout=None):
+        #До size байт (кратно 2) из самого старого; b'' по таймауту или после close()
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.written - self.read_pos >= size or self.closed, timeout):
+                return b''
+            n = min(size, self.written - self.read_pos)
+            n -= n % 2
+            pos = self.read_pos % self.capacity
+            first = min(n, self.capacity - pos)
+            data = bytes(self.view[pos:pos + first])
+            if first < n:
+                data += bytes(self.view[:n - first])
+            self.read_pos += n
+            self._track_lag()
+            self.cond.notify_all()
+            return data
+
+    def _track_lag(self):
+        # Задержка захват -> декодер по метке чанка, которому принадлежит последний прочитанный байт
+        t = None
+        while self.stamps and self.stamps[0][1] <= self.read_pos:
+            t = self.stamps.popleft()[2]
+        if self.stamps and self.stamps[0][0] < self.read_pos:
+            t = self.stamps[0][2]  # чанк прочитан частично
+        if t is None:
+            return
+        lag = time.monotonic() - t
+        self.lag_last = lag
+        self.lag_max = max(self.lag_max, lag)
+        self.lag_sum += lag
+        self.lag_count += 1
+
+    def pending(self):
+        with self.cond:
+            return self.written - self.read_pos
+
+    def position(self, rate):
+        #Секунды аудио, отданные декодеру
+        return self.read_pos / 2 / rate
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+def ring_stats(ring, rate):
+    return {
+        'ring_overruns': ring.overruns,
+        'dropped_s': ring.dropped_bytes / 2 / rate,
+        'lag_last_ms': ring.lag_last * 1000,
+        'lag_avg_ms': ring.lag_sum / ring.lag_count * 1000 if ring.lag_count else 0.0,
+        'lag_max_ms': ring.lag_max * 1000,
+    }
+
+# Источник аудио для VoiceAssistant.process: ring, start(), stop(), stats().
+# Когда источник исчерпан, он закрывает кольцо и цикл распознавания завершается.
+
+class MicCapture:
+    # Захват микрофона в режиме callback: поток PortAudio только копирует данные в кольцо
+    def __init__(self, ring, rate=16000, frames_per_buffer=1600, device_index=None):
+        self.ring = ring
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.device_index = device_index
+        self.pa = None
+        self.stream = None
+        self.input_overflows = 0  # переполнения на стороне PortAudio
+        self.callbacks = 0
+
+    def start(self):
+        import pyaudio
+        self._overflow_flag = pyaudio.paInputOverflow
+        self._continue = pyaudio.paContinue
+        self.pa = pyaudio.PyAudio()
+        # Индекс устройства по умолчанию (Bluetooth гарнитура должна быть default)
+        self.stream = self.pa.open(format=pyaudio.paInt16, channels=1, rate=self.rate, input=True,
+                                   input_device_index=self.device_index,
+                                   frames_per_buffer=self.frames_per_buffer,
+                                   stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.callbacks += 1
+        if status & self._overflow_flag:
+            self.input_overflows += 1
+        self.ring.write(in_data)
+        return None, self._continue
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
+        self.ring.close()
+
+    def stats(self):
+        return dict(ring_stats(self.ring, self.rate), input_overflows=self.input_overflows)
+
+class WavSource:
+    # WAV (16 кГц, моно, 16 бит) или сырой PCM s16le вместо микрофона.
+    # speed=1 - темп реального времени, 2 - вдвое быстрее, 0 - без пауз (насколько успевает декодер)
+    def __init__(self, ring, paths, rate=16000, speed=0.0, chunk_frames=1600, pad_silence=1.0):
+        self.ring = ring
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.rate = rate
+        self.speed = speed
+        self.chunk_frames = chunk_frames
+        self.pad_silence = pad_silence  # тишина после каждого файла, чтобы VAD закрыл фразу
+        self.thread = None
+        self.running = False
+        self.audio_s = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='wav-source', daemon=True)
+        self.thread.start()
+
+    def _chunks(self, path):
+        silence = bytes(int(self.pad_silence * self.rate) * 2)
+        if path.endswith('.wav'):
+            with wave.open(path, 'rb') as wf:
+                if wf.getframerate() != self.rate or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+                    raise ValueError(f"{path}: нужен WAV {self.rate} Гц моно 16 бит")
+                while True:
+                    data = wf.readframes(self.chunk_frames)
+                    if not data:
+                        break
+                    yield data
+        else:
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(self.chunk_frames * 2)
+                    if not data:
+                        break
+                    yield data
+        for i in range(0, len(silence), self.chunk_frames * 2):
+            yield silence[i:i + self.chunk_frames * 2]
+
+    def _run(self):
+        start = time.monotonic()
+        try:
+            for path in self.paths:
+                for data in self._chunks(path):
+                    if not self.running:
+                        return
+                    chunk_s = len(data) / 2 / self.rate
+                    if self.speed > 0:
+                        # Как у микрофона: чанк отдаётся, когда он "прозвучал"
+                        delay = start + (self.audio_s + chunk_s) / self.speed - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    self.ring.write(data, block=True)
+                    self.audio_s += chunk_s
+        except (OSError, ValueError, wave.Error) as e:
+            logger.error(f"Источник WAV: {e}")
+        finally:
+            self.ring.close()
+
+    def stop(self):
+        self.running = False
+        self.ring.close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self):
+        return ring_stats(self.ring, self.rate)
+"""
+
+# 18. METRICS.PY + METRICS_EXPORTER.PY (метрики Prometheus на localhost)
+files['metrics.py'] = shared_module('metrics.py')
+files['metrics_exporter.py'] = shared_module('metrics_exporter.py')
+
+# 19. PROFILING.PY (сэмплер стеков и tracemalloc по SIGUSR1/SIGUSR2)
+files['profiling.py'] = shared_module('profiling.py')
+
+# 20. LOG_SETUP.PY (логирование пачками в tmpfs, сжатые сегменты на SD)
+files['log_setup.py'] = shared_module('log_setup.py')
+
+# 21. EVENT_JOURNAL.PY (бинарный журнал детекций, фраз и событий питания)
+files['event_journal.py'] = shared_module('event_journal.py')
+
+# 22. DETECTION_INDEX.PY (недавние детекции в памяти: когда, сколько, где)
+files['detection_index.py'] = """#!/usr/bin/env python3
+# Недавние детекции в памяти для вопросов о прошлом без нового захвата:
+# "когда последний раз была машина", "сколько людей за час", "где обычно человек".
+#
+#   - счётчики по классам в кольце корзин по bucket_seconds на horizon секунд:
+#     новых треков (появлений), кадров с классом, пик одновременно в кадре
+#   - треки: объекты класса связываются между кадрами по ближайшему центру bbox
+#     (не дальше match_distance доли кадра); трек без подтверждения track_timeout
+#     секунд закрывается и остаётся в max_tracks последних
+#   - занятость: сетка grid x grid по классу; когда сумма класса превышает
+#     occupancy_cap, счётчики делятся пополам - недавнее весит больше
+#
+# Память ограничена: корзин horizon / bucket_seconds, закрытых треков max_tracks,
+# классов - сколько различает модель. Запросы - словари и короткие циклы под одним
+# замком, единицы-десятки микросекунд. Окно счёта выровнено по корзинам.
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+ROWS = ('вверху', 'посередине', 'внизу')
+COLUMNS = ('слева', 'по центру', 'справа')
+
+def plural(n, forms):
+    # forms: (1 минута, 2 минуты, 5 минут)
+    n = abs(int(n)) % 100
+    if 11 <= n <= 19:
+        return forms[2]
+    n %= 10
+    return forms[0] if n == 1 else forms[1] if 2 <= n <= 4 else forms[2]
+
+def ago(seconds):
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds} {plural(seconds, ('секунду', 'секунды', 'секунд'))} назад"
+    if seconds < 3600:
+        m = seconds // 60
+        return f"{m} {plural(m, ('минуту', 'минуты', 'минут'))} назад"
+    if seconds < 86400:
+        h = seconds // 3600
+        return f"{h} {plural(h, ('час', 'часа', 'часов'))} назад"
+    d = seconds // 86400
+    return f"{d} {plural(d, ('день', 'дня', 'дней'))} назад"
+
+def _center(det):
+    box = det.get('bbox')
+    if not box:
+        return None
+    return box['x'] + box['width'] / 2, box['y'] + box['height'] / 2
+
+class _Track:
+    __slots__ = ('id', 'label', 'first', 'last', 'cx', 'cy')
+
+    def __init__(self, track_id, label, t, center):
+        self.id = track_id
+        self.label = label
+        self.first = self.last = t
+        self.cx, self.cy = center if center else (None, None)
+
+class _Bucket:
+    __slots__ = ('epoch', 'new', 'frames', 'peak')
+
+    def __init__(self):
+        self.epoch = -1
+        self.new = {}     # метка -> новых треков
+        self.frames = {}  # метка -> кадров с меткой
+        self.peak = {}    # метка -> максимум объектов в одном кадре
+
+class DetectionIndex:
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.bucket_s = float(config.get('bucket_seconds', 60))
+        self.horizon = float(config.get('horizon', 86400))
+        self.buckets = [_Bucket() for _ in range(max(1, int(self.horizon // self.bucket_s)))]
+        self.track_timeout = float(config.get('track_timeout', 5.0))
+        self.match_distance = float(config.get('match_distance', 0.2))
+        self.grid = int(config.get('grid', 3))
+        self.occupancy_cap = int(config.get('occupancy_cap', 10000))
+
+        self.lock = threading.Lock()
+        self.active: Dict[str, List[_Track]] = {}
+        self.closed = deque(maxlen=int(config.get('max_tracks', 256)))
+        self.last_seen: Dict[str, float] = {}
+        self.occupancy: Dict[str, List[int]] = {}
+        self.occupancy_total: Dict[str, int] = {}
+        self.next_id = 1
+        self.frames = 0
+
+    def add(self, detections: List[Dict[str, Any]], t: Optional[float] = None):
+        #Кадр после фильтра; t - time.time() кадра
+        t = time.time() if t is None else t
+        by_label: Dict[str, list] = {}
+        for det in detections:
+            by_label.setdefault(det['label'], []).append(_center(det))
+        with self.lock:
+            self.frames += 1
+            bucket = self._bucket(t)
+            for label, centers in by_label.items():
+                bucket.new[label] = bucket.new.get(label, 0) + self._match(label, centers, t)
+                bucket.frames[label] = bucket.frames.get(label, 0) + 1
+                if len(centers) > bucket.peak.get(label, 0):
+                    bucket.peak[label] = len(centers)
+                self.last_seen[label] = t
+                self._occupy(label, centers)
+            self._expire(t)
+
+    def _bucket(self, t):
+        epoch = int(t // self.bucket_s)
+        bucket = self.buckets[epoch % len(self.buckets)]
+        if bucket.epoch != epoch:
+            # Корзина прошлого круга кольца
+            bucket.epoch = epoch
+            bucket.new.clear()
+            bucket.frames.clear()
+            bucket.peak.clear()
+        return bucket
+
+    def _match(self, label, centers, t):
+        # Жадно: каждому центру ближайший свободный трек класса; без bbox - любой свободный
+        tracks = self.active.setdefault(label, [])
+        free = list(tracks)
+        new = 0
+        for center in centers:
+            best, best_d = None, self.match_distance
+            for track in free:
+                if center is None or track.cx is None:
+                    best = track
+                    break
+                d = max(abs(center[0] - track.cx), abs(center[1] - track.cy))
+                if d <= best_d:
+                    best, best_d = track, d
+            if best is None:
+                tracks.append(_Track(self.next_id, label, t, center))
+                self.next_id += 1
+                new += 1
+                continue
+            free.remove(best)
+            best.last = t
+            if center is not None:
+                best.cx, best.cy = center
+        return new
+
+    def _expire(self, t):
+        for label, tracks in self.active.items():
+            if any(t - track.last > self.track_timeout for track in tracks):
+                self.closed.extend(track for track in tracks if t - track.last > self.track_timeout)
+                self.active[label] = [track for track in tracks if t - track.last <= self.track_timeout]
+
+    def _occupy(self, label, centers):
+        cells = self.occupancy.get(label)
+        if cells is None:
+            cells = self.occupancy[label] = [0] * (self.grid * self.grid)
+        for center in centers:
+            if center is None:
+                continue
+            col = min(max(int(center[0] * self.grid), 0), self.grid - 1)
+            row = min(max(int(center[1] * self.grid), 0), self.grid - 1)
+            cells[row * self.grid + col] += 1
+            self.occupancy_total[label] = self.occupancy_total.get(label, 0) + 1
+        if self.occupancy_total.get(label, 0) > self.occupancy_cap:
+            for i, n in enumerate(cells):
+                cells[i] = n // 2
+            self.occupancy_total[label] = sum(cells)
+
+    # === Запросы ===
+
+    def labels(self) -> List[str]:
+        with self.lock:
+            return list(self.last_seen)
+
+    def last(self, label: str) -> Optional[float]:
+        #Время последнего кадра с меткой (time.time()) или None
+        with self.lock:
+            return self.last_seen.get(label)
+
+    def visible(self, label: str, now: Optional[float] = None) -> int:
+        #Треков метки, подтверждённых в последние track_timeout секунд
+        now = time.time() if now is None else now
+        with self.lock:
+            return sum(1 for track in self.active.get(label, ()) if now - track.last <= self.track_timeout)
+
+    def count(self, label: Optional[str], seconds: float, now: Optional[float] = None) -> Dict[str, Dict[str, int]]:
+        #За seconds до now: {метка: {'tracks', 'frames', 'peak'}}; label=None - все метки
+        now = time.time() if now is None else now
+        last = int(now // self.bucket_s)
+        first = max(int((now - seconds) // self.bucket_s) + 1, last - len(self.buckets) + 1)
+        result: Dict[str, Dict[str, int]] = {}
+        with self.lock:
+            for epoch in range(first, last + 1):
+                bucket = self.buckets[epoch % len(self.buckets)]
+                if bucket.epoch != epoch:
+                    continue
+                for name, n in bucket.frames.items():
+                    if label is not None and name != label:
+                        continue
+                    entry = result.setdefault(name, {'tracks': 0, 'frames': 0, 'peak': 0})
+                    entry['tracks'] += bucket.new.get(name, 0)
+                    entry['frames'] += n
+                    entry['peak'] = max(entry['peak'], bucket.peak.get(name, 0))
+        return result
+
+    def where(self, label: str) -> Optional[Tuple[int, int, float]]:
+        #Самая занятая клетка сетки: (строка, столбец, доля появлений) или None
+        with self.lock:
+            cells = self.occupancy.get(label)
+            total = sum(cells) if cells else 0
+            if not total:
+                return None
+            i = max(range(len(cells)), key=cells.__getitem__)
+            return i // self.grid, i % self.grid, cells[i] / total
+
+    def tracks(self, label: Optional[str] = None) -> List[Dict[str, Any]]:
+        #Открытые и последние закрытые треки, новые первыми
+        with self.lock:
+            items = [t for tracks in self.active.values() for t in tracks] + list(self.closed)
+        items = [t for t in items if label is None or t.label == label]
+        items.sort(key=lambda t: t.last, reverse=True)
+        return [{'id': t.id, 'label': t.label, 'first': t.first, 'last': t.last} for t in items]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'frames': self.frames, 'labels': len(self.last_seen), 'next_track': self.next_id,
+                    'active_tracks': sum(len(t) for t in self.active.values()), 'closed_tracks': len(self.closed)}
+
+    # === Фразы для ответа голосом ===
+
+    def region(self, row: int, col: int) -> str:
+        row, col = row * 3 // self.grid, col * 3 // self.grid
+        if row == 1 and col == 1:
+            return 'в центре'
+        if row == 1:
+            return COLUMNS[col]
+        if col == 1:
+            return ROWS[row]
+        return f"{COLUMNS[col]} {ROWS[row]}"
+
+    def format_last_seen(self, label: str) -> str:
+        now = time.time()
+        if self.visible(label, now):
+            return f"{label.capitalize()} в кадре сейчас."
+        t = self.last(label)
+        if t is None:
+            return f"{label.capitalize()}: не видел с момента запуска."
+        return f"{label.capitalize()}: последний раз {ago(now - t)}, в {time.strftime('%H:%M', time.localtime(t))}."
+
+    def format_count(self, label: Optional[str], seconds: float, period: str) -> str:
+        counts = self.count(label, seconds)
+        if label is not None:
+            entry = counts.get(label)
+            if not entry:
+                return f"За {period} не видел: {label}."
+            n = entry['tracks']
+            return (f"За {period} {label}: {n} {plural(n, ('появление', 'появления', 'появлений'))}, "
+                    f"одновременно до {entry['peak']}.")
+        if not counts:
+            return f"За {period} ничего не видел."
+        ranked = sorted(counts.items(), key=lambda item: item[1]['tracks'], reverse=True)
+        return f"За {period}: " + ", ".join(f"{name} {entry['tracks']}" for name, entry in ranked[:5]) + "."
+
+    def format_where(self, label: str) -> str:
+        cell = self.where(label)
+        if cell is None:
+            return f"{label.capitalize()}: не видел с момента запуска."
+        row, col, share = cell
+        percent = round(share * 100)
+        return (f"{label.capitalize()} чаще всего {self.region(row, col)}, "
+                f"{percent} {plural(percent, ('процент', 'процента', 'процентов'))} появлений.")
 """
 
 # === ГЕНЕРАЦИЯ ФАЙЛОВ ===
@@ -43,6 +43,7 @@ sudo apt install -y \
     python3-pip \
     python3-picamera2 \
     python3-smbus2 \
+    python3-numpy \
     i2c-tools \
     libasound2-dev \
     alsa-utils \
@@ -132,12 +133,33 @@ echo "⏰ Это займет 30-60 минут на Pi Zero 2W..."
 export CARGO_BUILD_JOBS=1
 cargo build --release
 
-# Systemd сервис
-echo "⚙️  Создание systemd сервиса..."
+# Systemd сервисы
+echo "⚙️  Создание systemd сервисов..."
+
+# Брокер питания - единственный процесс, работающий с INA219
+sudo tee /etc/systemd/system/aiva-power.service > /dev/null << EOF
+[Unit]
+Description=AIVA Power Broker (UPS HAT C / INA219)
+After=local-fs.target
+
+[Service]
+Type=simple
+User=$USER
+WorkingDirectory=$(pwd)
+ExecStart=/usr/bin/python3 $(pwd)/scripts/power_broker.py --config $(pwd)/config.toml
+Restart=always
+RestartSec=5
+MemoryMax=40M
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 sudo tee /etc/systemd/system/aiva.service > /dev/null << EOF
 [Unit]
 Description=AIVA AI Camera Service
-After=network.target
+After=network.target aiva-power.service
+Wants=aiva-power.service
 
 [Service]
 Type=simple
@@ -157,10 +179,30 @@ CPUQuota=90%
 WantedBy=multi-user.target
 EOF
 
+# Экспортёр метрик Prometheus (только localhost)
+sudo tee /etc/systemd/system/aiva-metrics.service > /dev/null << EOF
+[Unit]
+Description=AIVA Metrics Exporter
+After=local-fs.target
+
+[Service]
+Type=simple
+User=$USER
+WorkingDirectory=$(pwd)
+ExecStart=/usr/bin/python3 $(pwd)/scripts/metrics_exporter.py --config $(pwd)/config.toml
+Restart=always
+RestartSec=10
+MemoryMax=30M
+Nice=10
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 sudo systemctl daemon-reload
 
 # Тестовый скрипт для UPS
-chmod +x scripts/ups_monitor.py
+chmod +x scripts/ups_monitor.py scripts/power_broker.py scripts/aiva_worker.py scripts/metrics_exporter.py
 
 echo ""
 echo "╔════════════════════════════════════════════════╗"
@@ -177,13 +219,16 @@ echo "   - Камеру: libcamera-hello --list-cameras"
 echo "   - I2C: i2cdetect -y 1"
 echo "   - UPS: python3 scripts/ups_monitor.py"
 echo ""
-echo "3. Запуск сервиса:"
+echo "3. Запуск сервисов:"
+echo "   sudo systemctl enable --now aiva-power"
 echo "   sudo systemctl start aiva"
 echo "   sudo systemctl enable aiva"
 echo ""
 echo "4. Мониторинг:"
 echo "   sudo systemctl status aiva"
 echo "   journalctl -u aiva -f"
+echo "   sudo systemctl enable --now aiva-metrics"
+echo "   curl -s http://127.0.0.1:9101/metrics"
 echo ""
 echo "⚠️  ВАЖНО:"
 echo "   - Используйте качественное питание 5V/3A"
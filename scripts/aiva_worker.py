@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Хост воркеров: один интерпретатор Python вместо camera_worker.py, запускаемого
+на всё время работы, и нового tts_worker.py на каждую фразу.
+Сервисы (camera, tts, power) загружаются как модули, у каждого свой поток и
+очередь, так что долгий синтез речи не задерживает детекцию.
+
+Протокол (stdin/stdout, JSON по строке, запросы мультиплексируются по id):
+    -> {"id": 7, "service": "camera", "op": "detect", "args": {}}
+    <- {"id": 7, "ok": true, "result": [...]}
+    <- {"id": 8, "ok": false, "error": "..."}
+Служебные запросы: service "host", op "stats" | "exit".
+Метрики (очереди, стадии, кадры, GC) - раз в metrics.interval в <metrics.dir>/worker.prom.
+SIGUSR1 / SIGUSR2 - сэмплер стеков и разница tracemalloc (scripts/profiling.py).
+
+Сравнение памяти с раздельными процессами:
+    python3 scripts/aiva_worker.py memory
+"""
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+import subprocess
+from typing import Dict, Any, List
+
+import metrics
+import profiling
+import event_journal
+import trace_spans
+from log_setup import setup_logging
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SERVICES = ("camera", "tts")
+
+# Лог - пачками в tmpfs, на SD только сжатые сегменты (scripts/log_setup.py)
+setup_logging("aiva_worker", fmt='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+logger = logging.getLogger("aiva_worker")
+
+
+def load_config(path: str) -> Dict[str, Any]:
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except (ImportError, OSError) as e:
+        logger.warning(f"Конфигурация {path} не прочитана ({e}), значения по умолчанию")
+        return {}
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    #Rss и Pss процесса (Pss делит общие страницы libpython между процессами)
+    result = {"rss_kb": 0, "pss_kb": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    result[key.lower() + "_kb"] = int(value.split()[0])
+    except OSError:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    result["rss_kb"] = result["pss_kb"] = int(line.split()[1])
+    return result
+
+
+class Service:
+    # Сервис хоста: объект создаётся в главном потоке (модули воркеров ставят обработчики
+    # сигналов), инициализация и запросы - в потоке сервиса по очереди
+    name = ""
+    serialize_ops = ()  # операции, время ответа которых идёт в стадию serialize воркера
+
+    def __init__(self, host: "WorkerHost", config: Dict[str, Any]):
+        self.host = host
+        self.config = config
+        self.queue: "queue.Queue" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"svc-{self.name}", daemon=True)
+        self.requests = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.ready = False
+        self.latency = None  # StageLatency воркера, если он её ведёт
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, request_id: int, op: str, args: Dict[str, Any]):
+        self.queue.put((request_id, op, args, trace_spans.now_us()))
+
+    def stop(self, timeout: float = 10.0):
+        self.queue.put(None)
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def _run(self):
+        try:
+            self.setup()
+            self.ready = True
+        except Exception as e:
+            logger.error(f"Сервис {self.name} не запущен: {e}")
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                request_id, op, args, queued_us = item
+                trace = args.get("trace")
+                trace_spans.span(f"host.queue.{self.name}", trace, queued_us, trace_spans.now_us())
+                start = time.monotonic()
+                self.requests += 1
+                try:
+                    if not self.ready:
+                        raise RuntimeError(f"сервис {self.name} не инициализирован")
+                    result = self.handle(op, args)
+                    t_reply = time.perf_counter()
+                    self.host.reply(request_id, result=result, trace=trace)
+                    if op in self.serialize_ops and self.latency is not None:
+                        self.latency.record("serialize", time.perf_counter() - t_reply)
+                except Exception as e:
+                    self.errors += 1
+                    self.host.reply(request_id, error=str(e), trace=trace)
+                self.busy_s += time.monotonic() - start
+        finally:
+            self.teardown()
+
+    def setup(self):
+        pass
+
+    def handle(self, op: str, args: Dict[str, Any]) -> Any:
+        raise ValueError(f"неизвестная операция {self.name}.{op}")
+
+    def teardown(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"ready": self.ready, "requests": self.requests, "errors": self.errors,
+                 "busy_ms": round(self.busy_s * 1000), "queued": self.queue.qsize()}
+        if self.latency is not None:
+            stats["latency"] = self.latency.stats()
+        return stats
+
+    def export(self, exp: metrics.Exposition):
+        #Метрики сервиса для worker.prom (вызывается из потока метрик)
+        exp.gauge("aiva_worker_queue_depth", self.queue.qsize(), "Запросов в очереди сервиса", service=self.name)
+        exp.counter("aiva_worker_requests_total", self.requests, "Запросов к сервису", service=self.name)
+        exp.counter("aiva_worker_errors_total", self.errors, "Запросов с ошибкой", service=self.name)
+        exp.counter("aiva_worker_busy_seconds_total", self.busy_s, "Время обработки запросов", service=self.name)
+        if self.latency is not None:
+            for stage, histogram in list(self.latency.stages.items()):
+                exp.histogram("aiva_stage_latency_seconds", metrics.from_hdr(histogram),
+                              "Задержки стадий воркеров", worker=self.latency.name, stage=stage)
+
+
+class CameraService(Service):
+    name = "camera"
+    serialize_ops = ("detect",)
+
+    def __init__(self, host, config):
+        super().__init__(host, config)
+        from camera_worker import CameraWorker
+        self.worker = CameraWorker(host.config_path)
+        self.latency = self.worker.latency
+        self.server = None
+        self.fps_mark = (time.monotonic(), 0)
+
+    def setup(self):
+        # IMX500 с прогревом; запросы, пришедшие раньше, ждут в очереди
+        self.worker.initialize_camera()
+        if self.worker.socket_path:
+            # Другие клиенты (CLI, голосовой ассистент) получают те же захваты, что и Rust
+            from camera_worker import CameraServer
+            self.server = CameraServer(self.worker, self.worker.socket_path)
+            self.server.start()
+
+    def handle(self, op, args):
+        if op == "start":
+            return {"ready": True}
+        if op == "detect":
+            return self.worker.detect_shared(float(args.get("max_age", self.worker.cache_max_age)),
+                                             args.get("trace"))
+        if op == "stats":
+            return self.worker.stats()
+        return super().handle(op, args)
+
+    def export(self, exp):
+        super().export(exp)
+        stats = self.worker.stats()
+        for key in ("captures", "coalesced", "cache_hits", "snapshots"):
+            exp.counter("aiva_camera_requests_total", stats[key], "Детекции: захваты, объединённые, из кэша",
+                        kind=key)
+        exp.counter("aiva_camera_frames_total", stats["frames"], "Кадров с IMX500")
+        now = time.monotonic()
+        t, frames = self.fps_mark
+        self.fps_mark = (now, stats["frames"])
+        exp.gauge("aiva_camera_fps", (stats["frames"] - frames) / max(now - t, 1e-3),
+                  "Частота кадров за последний интервал")
+        served = stats["captures"] + stats["coalesced"] + stats["cache_hits"]
+        exp.gauge("aiva_camera_cache_hit_ratio", stats["cache_hits"] / served if served else 0,
+                  "Доля детекций из кэша")
+
+    def teardown(self):
+        if self.server is not None:
+            self.server.stop()
+        self.worker.shutdown()
+
+
+class TtsService(Service):
+    name = "tts"
+
+    def __init__(self, host, config):
+        super().__init__(host, config)
+        from tts_worker import TtsWorker
+        tts = config.get("tts", {})
+        self.worker_class = TtsWorker
+        self.model_path = tts.get("model_path", "voice_models/piper/ru_RU-dmitri-low.onnx")
+        self.sample_rate = tts.get("sample_rate", 16000)
+        self.worker = None
+
+    def setup(self):
+        self.worker = self.worker_class(self.model_path, self.sample_rate)
+        self.latency = self.worker.latency
+
+    def handle(self, op, args):
+        if op == "speak":
+            if not self.worker.speak(args["text"], args.get("trace")):
+                raise RuntimeError("синтез не удался")
+            return {"spoken": True}
+        if op == "stats":
+            return self.latency.stats()
+        return super().handle(op, args)
+
+    def teardown(self):
+        if self.worker is not None:
+            self.worker.shutdown()
+
+
+class PowerService(Service):
+    # Брокер питания в потоке хоста вместо отдельного сервиса aiva-power
+    name = "power"
+
+    def __init__(self, host, config):
+        super().__init__(host, config)
+        from power_broker import PowerBroker
+        self.broker = PowerBroker(config.get("power", {}))
+        self.broker_thread = threading.Thread(target=self.broker.run, name="power-broker", daemon=True)
+
+    def setup(self):
+        self.broker_thread.start()
+
+    def handle(self, op, args):
+        if op == "status":
+            return self.broker.stats()
+        return super().handle(op, args)
+
+    def teardown(self):
+        self.broker.running = False
+        self.broker_thread.join(timeout=5)
+
+
+SERVICES = {cls.name: cls for cls in (CameraService, TtsService, PowerService)}
+
+
+class WorkerHost:
+    def __init__(self, config: Dict[str, Any], names: List[str], config_path: str = "config.toml"):
+        self.running = True
+        self.config_path = config_path  # сервисы, читающие конфигурацию сами (камера)
+        self.out_lock = threading.Lock()
+        self.services: Dict[str, Service] = {}
+        for name in names:
+            self.services[name] = SERVICES[name](self, config)
+
+        # После модулей воркеров: их обработчики сигналов заменяем своими
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        signal.signal(signal.SIGINT, self.signal_handler)
+
+        settings = config.get("metrics", {})
+        self.metrics_interval = float(settings.get("interval", 5))
+        self.metrics_stop = threading.Event()
+        self.metrics_writer = None
+        if settings.get("enabled", False):
+            try:
+                self.metrics_writer = metrics.TextfileWriter("worker", settings.get("dir", metrics.DEFAULT_DIR))
+                self.gc_pauses = metrics.GcPauses()
+            except OSError as e:
+                logger.warning(f"Метрики отключены: {e}")
+
+    def signal_handler(self, signum, frame):
+        logger.info(f"Получен сигнал {signum}, завершение работы...")
+        if self.running:
+            self.running = False
+            raise SystemExit(0)
+
+    def reply(self, request_id: int, result: Any = None, error: str = None, trace: int = None):
+        if error is None:
+            message = {"id": request_id, "ok": True, "result": result}
+        else:
+            message = {"id": request_id, "ok": False, "error": error}
+        if trace is not None:
+            message["trace"] = trace
+        line = json.dumps(message, ensure_ascii=False) + "\n"
+        # Ответы сервисов из разных потоков не должны перемешиваться внутри строки
+        with self.out_lock:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(memory_kb(os.getpid()), pid=os.getpid(),
+                    services={name: svc.stats() for name, svc in self.services.items()})
+
+    def metrics_loop(self):
+        # Один проход - доли миллисекунды: гистограммы уже накоплены воркерами
+        while not self.metrics_stop.wait(self.metrics_interval):
+            exp = metrics.Exposition()
+            self.gc_pauses.export(exp, process="aiva_worker")
+            for svc in self.services.values():
+                try:
+                    svc.export(exp)
+                except Exception as e:
+                    logger.debug(f"Метрики сервиса {svc.name}: {e}")
+            self.metrics_writer.write(exp)
+
+    def dispatch(self, line: str):
+        try:
+            request = json.loads(line)
+            request_id = request["id"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Некорректный запрос: {line.strip()}")
+            return
+        service, op = request.get("service"), request.get("op")
+        if service == "host":
+            if op == "stats":
+                self.reply(request_id, result=self.stats())
+            elif op == "exit":
+                logger.info("Получена команда выхода")
+                self.running = False
+                self.reply(request_id, result={})
+            else:
+                self.reply(request_id, error=f"неизвестная операция host.{op}")
+        elif service in self.services:
+            self.services[service].submit(request_id, op, request.get("args") or {})
+        else:
+            self.reply(request_id, error=f"сервис {service} не запущен")
+
+    def run(self):
+        for svc in self.services.values():
+            svc.start()
+        if self.metrics_writer is not None:
+            threading.Thread(target=self.metrics_loop, name="metrics", daemon=True).start()
+        logger.info(f"Хост воркеров готов: {', '.join(self.services)} (pid {os.getpid()})")
+        try:
+            for line in sys.stdin:
+                if line.strip():
+                    self.dispatch(line)
+                if not self.running:
+                    break
+        except SystemExit:
+            pass
+        finally:
+            self.running = False
+            self.metrics_stop.set()
+            for svc in self.services.values():
+                svc.stop()
+            if self.metrics_writer is not None:
+                self.metrics_writer.remove()
+            trace_spans.close()
+            event_journal.close()
+            logger.info("✓ Хост воркеров остановлен")
+
+
+def compare_memory(args) -> int:
+    # Интерпретатор с импортированными модулями воркеров - то, что экономит объединение.
+    # Железо не трогаем: измерение работает и без камеры и UPS HAT
+    idle = "import sys; sys.path.insert(0, {!r}); {}; sys.stdin.read()"
+    layouts = {
+        "раздельные процессы": [f"import {m}" for m in ("camera_worker", "tts_worker", "power_broker")],
+        "aiva_worker.py": ["import aiva_worker, camera_worker, tts_worker, power_broker"],
+    }
+    os.makedirs("logs", exist_ok=True)
+    totals = {}
+    for layout, imports in layouts.items():
+        procs = [subprocess.Popen([sys.executable, "-c", idle.format(SCRIPTS_DIR, stmt)],
+                                  stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                 for stmt in imports]
+        try:
+            time.sleep(args.settle)
+            usage = [memory_kb(p.pid) for p in procs]
+        finally:
+            for p in procs:
+                p.stdin.close()
+                p.wait()
+        totals[layout] = {"processes": len(procs),
+                          "rss_kb": sum(u["rss_kb"] for u in usage),
+                          "pss_kb": sum(u["pss_kb"] for u in usage)}
+
+    if args.json:
+        print(json.dumps(totals, ensure_ascii=False))
+        return 0
+    print(f"{'схема':<22}{'процессов':>10}{'RSS, МБ':>10}{'PSS, МБ':>10}")
+    for layout, t in totals.items():
+        print(f"{layout:<22}{t['processes']:>10}{t['rss_kb'] / 1024:>10.1f}{t['pss_kb'] / 1024:>10.1f}")
+    multi, single = totals.values()
+    print(f"Экономия PSS: {(multi['pss_kb'] - single['pss_kb']) / 1024:.1f} МБ "
+          f"(tts_worker.py в старой схеме живёт только во время фразы - это разница в пике)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Хост воркеров AIVA (камера, TTS, питание)')
+    parser.add_argument('--config', default='config.toml', help='Путь к файлу конфигурации')
+    parser.add_argument('--services', default=None,
+                        help='Сервисы через запятую (по умолчанию system.worker_services)')
+    sub = parser.add_subparsers(dest='command')
+    memory = sub.add_parser('memory', help='Сравнить память с раздельными процессами')
+    memory.add_argument('--settle', type=float, default=2.0, help='Пауза перед замером, с')
+    memory.add_argument('--json', action='store_true', help='Результат в JSON')
+    args = parser.parse_args()
+
+    if args.command == 'memory':
+        return compare_memory(args)
+
+    config = load_config(args.config)
+    trace_spans.configure(config.get("trace", {}))
+    event_journal.configure(config.get("journal", {}), "aiva_worker")
+    if args.services:
+        names = [s.strip() for s in args.services.split(",") if s.strip()]
+    else:
+        names = config.get("system", {}).get("worker_services", list(DEFAULT_SERVICES))
+    unknown = [n for n in names if n not in SERVICES]
+    if unknown:
+        parser.error(f"неизвестные сервисы: {', '.join(unknown)}")
+
+    host = WorkerHost(config, names, args.config)
+    profiling.install("aiva_worker", config.get("profiling", {}))
+    host.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,36 @@
 #!/usr/bin/env python3
+import os
 import sys
 import json
+import time
 import argparse
 import signal
 import logging
+import threading
+import socketserver
 import gc
-from typing import List, Dict, Any
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('logs/camera_worker.log'),
-        logging.StreamHandler(sys.stderr)
-    ]
-)
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator
+
+from op_markers import marked, OP_DETECT
+from latency import StageLatency
+import trace_spans
+import profiling
+import event_journal
+from log_setup import setup_logging
+
+# Лог - пачками в tmpfs, на SD только сжатые сегменты (scripts/log_setup.py)
+setup_logging("camera_worker")
 logger = logging.getLogger(__name__)
 
 sys.stdout.reconfigure(line_buffering=True)
 
+DEFAULT_SOCKET = "/dev/shm/aiva_camera.sock"
+# Параметры, которые клиенты могут менять командой config
+RUNTIME_KEYS = ("publish_interval", "cache_max_age")
+LATENCY_DUMP = "logs/latency_camera.json"
+
 # COCO labels для IMX500 MobileNet SSD
 COCO_LABELS = [
     "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train",
@@ -35,11 +47,35 @@ COCO_LABELS = [
     "vase", "scissors", "teddy bear", "hair drier", "toothbrush"
 ]
 
+def load_camera_config(path: str, section: str = "camera") -> Dict[str, Any]:
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f).get(section, {})
+    except (ImportError, OSError):
+        return {}
+
 class CameraWorker:
     def __init__(self, config_path: str = "config.toml"):
         self.running = True
         self.picam2 = None
         self.frame_count = 0
+        self.config = load_camera_config(config_path)
+        self.socket_path = self.config.get("socket", DEFAULT_SOCKET)
+        self.publish_interval = float(self.config.get("publish_interval", 1.0))
+        self.cache_max_age = float(self.config.get("cache_max_age", 0.5))
+        self.min_confidence = float(self.config.get("detection_threshold", 0.0))
+        self.latency = StageLatency("camera", ("capture", "parse", "filter", "serialize", "total"))
+
+        # Общий результат детекции для всех клиентов (stdin, сокет, хост воркеров)
+        self.capture_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.capturing = False
+        self.seq = 0
+        self.latest_t = 0.0
+        self.latest: List[Dict[str, Any]] = []
+        self.listeners = []  # вызываются после каждого захвата: (seq, detections)
+        self.counters = {"captures": 0, "coalesced": 0, "cache_hits": 0, "snapshots": 0}
         
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -79,7 +115,6 @@ class CameraWorker:
             self.picam2.start()
             
             # Прогрев
-            import time
             time.sleep(2)
             
             logger.info("✓ IMX500 инициализирована")
@@ -93,13 +128,16 @@ class CameraWorker:
             logger.error(f"Ошибка инициализации камеры: {e}")
             raise
             
-    def detect_objects(self) -> List[Dict[str, Any]]:
-        #Выполнение детекции объектов через IMX500
+    def detect_objects(self, trace: int = None) -> List[Dict[str, Any]]:
+        #Выполнение детекции объектов через IMX500 (trace - id сквозной трассы от Rust)
         try:
             # Захват кадра с метаданными
-            metadata = self.picam2.capture_metadata()
+            t_start = time.perf_counter()
+            with marked(OP_DETECT):
+                metadata = self.picam2.capture_metadata()
+            t_capture = time.perf_counter()
             
-            detections = []
+            parsed = []
             
             # Парсинг результатов IMX500
             if "Detection" in metadata:
@@ -118,7 +156,7 @@ class CameraWorker:
                         # Получаем метку класса
                         label = COCO_LABELS[class_id] if class_id < len(COCO_LABELS) else f"class_{class_id}"
                         
-                        detections.append({
+                        parsed.append({
                             "label": label,
                             "confidence": confidence,
                             "bbox": {
@@ -128,6 +166,23 @@ class CameraWorker:
                                 "height": height
                             }
                         })
+            t_parse = time.perf_counter()
+
+            # Слабые детекции не сериализуем и не отправляем клиентам
+            detections = [d for d in parsed if d["confidence"] >= self.min_confidence]
+            t_filter = time.perf_counter()
+
+            latency = self.latency
+            latency.record("capture", t_capture - t_start)
+            latency.record("parse", t_parse - t_capture)
+            latency.record("filter", t_filter - t_parse)
+            latency.record("total", t_filter - t_start)
+            if trace is not None:
+                us = [trace_spans.perf_to_us(t) for t in (t_start, t_capture, t_parse, t_filter)]
+                trace_spans.span("camera.capture", trace, us[0], us[1])
+                trace_spans.span("camera.parse", trace, us[1], us[2], raw=len(parsed))
+                trace_spans.span("camera.filter", trace, us[2], us[3], kept=len(detections))
+            event_journal.record_frame(detections, len(parsed), t_filter - t_start, trace)
             
             # Периодическая очистка памяти
             self.frame_count += 1
@@ -140,13 +195,78 @@ class CameraWorker:
             logger.error(f"Ошибка детекции: {e}")
             return []
             
-    def run(self):
+    def detect_shared(self, max_age: float = 0.0, trace: int = None) -> List[Dict[str, Any]]:
+        #Детекция для нескольких клиентов: результат не старше max_age из кэша,
+        #иначе присоединяемся к идущему захвату или запускаем новый
+        with self.cond:
+            if self.seq and time.monotonic() - self.latest_t <= max_age:
+                self.counters["cache_hits"] += 1
+                t = trace_spans.now_us()
+                trace_spans.span("camera.cache", trace, t, t)
+                return self.latest
+            if self.capturing:
+                self.counters["coalesced"] += 1
+                seq = self.seq
+                t = trace_spans.now_us()
+                self.cond.wait_for(lambda: self.seq != seq)
+                trace_spans.span("camera.wait", trace, t, trace_spans.now_us())
+                return self.latest
+            self.capturing = True
+
+        detections: List[Dict[str, Any]] = []
+        try:
+            with self.capture_lock:
+                detections = self.detect_objects(trace)
+        finally:
+            with self.cond:
+                self.capturing = False
+                self.seq += 1
+                self.latest_t = time.monotonic()
+                self.latest = detections
+                self.counters["captures"] += 1
+                seq = self.seq
+                self.cond.notify_all()
+
+        for listener in list(self.listeners):
+            listener(seq, detections)
+        return detections
+
+    def snapshot(self, path: str) -> Dict[str, Any]:
+        #Кадр в файл (JPEG/PNG по расширению) между захватами метаданных
+        with self.capture_lock:
+            self.picam2.capture_file(path)
+        self.counters["snapshots"] += 1
+        return {"path": path}
+
+    def configure(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        for key, value in values.items():
+            if key not in RUNTIME_KEYS:
+                raise ValueError(f"параметр {key} не меняется на ходу")
+            setattr(self, key, float(value))
+        return {key: getattr(self, key) for key in RUNTIME_KEYS}
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            age = time.monotonic() - self.latest_t if self.seq else None
+            return dict(self.counters, frames=self.frame_count, seq=self.seq,
+                        latest_age_s=age, latest_count=len(self.latest), latency=self.latency.stats())
+
+    def run(self, use_stdin: bool = True):
         #Основной цикл обработки команд
+        server = None
         try:
             self.initialize_camera()
+            if self.socket_path:
+                server = CameraServer(self, self.socket_path)
+                server.start()
             
             logger.info("Камера готова к работе. Ожидание команд...")
             
+            if not use_stdin:
+                while self.running:
+                    time.sleep(0.5)
+                return
+
             for line in sys.stdin:
                 if not self.running:
                     break
@@ -154,8 +274,13 @@ class CameraWorker:
                 command = line.strip()
                 
                 if command == "detect":
-                    detections = self.detect_objects()
+                    detections = self.detect_shared(self.cache_max_age)
+                    t_start = time.perf_counter()
                     print(json.dumps(detections), flush=True)
+                    self.latency.record("serialize", time.perf_counter() - t_start)
+
+                elif command == "stats":
+                    print(json.dumps(self.stats()), flush=True)
                     
                 elif command == "exit":
                     logger.info("Получена команда выхода")
@@ -171,6 +296,8 @@ class CameraWorker:
             print(json.dumps({"error": str(e)}), flush=True)
             
         finally:
+            if server is not None:
+                server.stop()
             self.shutdown()
             
     def shutdown(self):
@@ -183,15 +310,235 @@ class CameraWorker:
             except Exception as e:
                 logger.error(f"Ошибка при остановке камеры: {e}")
         
+        self.latency.dump(LATENCY_DUMP)
         gc.collect()
 
+class _Connection:
+    # Клиент сокета: ответы и события пишутся под общей блокировкой целыми строками
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=32)  # медленный подписчик теряет старые события
+        self.wake = threading.Event()
+        self.closed = False
+
+    def send(self, message: Dict[str, Any]):
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode()
+        with self.lock:
+            if self.closed:
+                return  # handle() завершился, finish() закрывает wfile
+            self.wfile.write(line)
+            self.wfile.flush()
+
+
+class CameraServer:
+    #Unix-сокет камеры: JSON-строки с id, команды выполняются параллельно
+    #(медленный detect не задерживает stats), подписчики получают каждую детекцию.
+    #  -> {"id": 1, "cmd": "detect", "args": {"max_age": 0.5}}
+    #  <- {"id": 1, "ok": true, "result": [...]}
+    #  -> {"id": 2, "cmd": "subscribe"}
+    #  <- {"event": "detections", "seq": 42, "t_wall": ..., "detections": [...]}
+    def __init__(self, worker: CameraWorker, path: str):
+        self.worker = worker
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="camera-req")
+        self.subscribers: List[_Connection] = []
+        self.clients = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.server = None
+        worker.listeners.append(self.publish)
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, _make_handler(self))
+        self.server.daemon_threads = True
+        self.running = True
+        threading.Thread(target=self.server.serve_forever, name="camera-socket", daemon=True).start()
+        threading.Thread(target=self._publish_loop, name="camera-publish", daemon=True).start()
+        logger.info(f"✓ Сокет камеры: {self.path}")
+
+    def stop(self):
+        self.running = False
+        self.worker.listeners.remove(self.publish)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _publish_loop(self):
+        # Пока есть подписчики, камера опрашивается с publish_interval; свежий результат
+        # другого клиента засчитывается, лишнего захвата не будет
+        while self.running:
+            interval = self.worker.publish_interval
+            if self.subscribers:
+                self.worker.detect_shared(max_age=interval)
+            time.sleep(interval)
+
+    def publish(self, seq: int, detections: List[Dict[str, Any]]):
+        event = {"event": "detections", "seq": seq, "t_wall": time.time(), "detections": detections}
+        with self.lock:
+            for conn in self.subscribers:
+                conn.events.append(event)
+                conn.wake.set()
+
+    def execute(self, conn: _Connection, request: Dict[str, Any]):
+        request_id = request.get("id")
+        cmd = request.get("cmd")
+        try:
+            result = self._command(conn, cmd, request.get("args") or {})
+            message = {"id": request_id, "ok": True, "result": result}
+        except Exception as e:
+            message = {"id": request_id, "ok": False, "error": str(e)}
+        try:
+            t_start = time.perf_counter()
+            conn.send(message)
+            if cmd == "detect":
+                self.worker.latency.record("serialize", time.perf_counter() - t_start)
+        except (OSError, ValueError):
+            pass  # клиент отключился, не дождавшись ответа (ValueError - wfile уже закрыт)
+
+    def _command(self, conn: _Connection, cmd: str, args: Dict[str, Any]) -> Any:
+        if cmd == "detect":
+            return self.worker.detect_shared(float(args.get("max_age", self.worker.cache_max_age)))
+        if cmd == "stats":
+            with self.lock:
+                return dict(self.worker.stats(), clients=self.clients, subscribers=len(self.subscribers))
+        if cmd == "snapshot":
+            return self.worker.snapshot(args.get("path", "/dev/shm/aiva_snapshot.jpg"))
+        if cmd == "config":
+            return self.worker.configure(args)
+        if cmd == "subscribe":
+            with self.lock:
+                if conn not in self.subscribers:
+                    self.subscribers.append(conn)
+            return {"subscribed": True}
+        if cmd == "unsubscribe":
+            self._unsubscribe(conn)
+            return {"subscribed": False}
+        raise ValueError(f"неизвестная команда: {cmd}")
+
+    def _unsubscribe(self, conn: _Connection):
+        with self.lock:
+            if conn in self.subscribers:
+                self.subscribers.remove(conn)
+
+
+def _make_handler(server: CameraServer):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            conn = _Connection(self.wfile)
+            sender = threading.Thread(target=self._send_events, args=(conn,), daemon=True)
+            sender.start()
+            with server.lock:
+                server.clients += 1
+            try:
+                for raw in self.rfile:
+                    try:
+                        request = json.loads(raw)
+                    except ValueError:
+                        conn.send({"id": None, "ok": False, "error": "некорректный JSON"})
+                        continue
+                    # Каждый запрос - в пул, ответ придёт с тем же id
+                    server.executor.submit(server.execute, conn, request)
+            except OSError:
+                pass
+            finally:
+                server._unsubscribe(conn)
+                conn.closed = True
+                conn.wake.set()
+                with server.lock:
+                    server.clients -= 1
+
+        def _send_events(self, conn: _Connection):
+            while not conn.closed:
+                conn.wake.wait(1.0)
+                conn.wake.clear()
+                try:
+                    while conn.events:
+                        conn.send(conn.events.popleft())
+                except (OSError, ValueError):
+                    return
+
+    return Handler
+
+
+class CameraClient:
+    #Клиент сокета камеры: синхронные запросы и поток событий детекции
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.path = path
+        self.next_id = 0
+
+    def request(self, cmd: str, **args) -> Any:
+        import socket
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            self.next_id += 1
+            sock.sendall((json.dumps({"id": self.next_id, "cmd": cmd, "args": args}) + "\n").encode())
+            reply = json.loads(sock.makefile().readline())
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply["result"]
+
+    def subscribe(self) -> Iterator[Dict[str, Any]]:
+        import socket
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(b'{"id": 1, "cmd": "subscribe"}\n')
+            for line in sock.makefile():
+                message = json.loads(line)
+                if message.get("event"):
+                    yield message
+
+
+def client_main(args) -> int:
+    client = CameraClient(args.socket or load_camera_config(args.config).get("socket", DEFAULT_SOCKET))
+    if args.cmd == "subscribe":
+        try:
+            for event in client.subscribe():
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    params: Dict[str, Any] = {}
+    if args.cmd == "detect":
+        params["max_age"] = args.max_age
+    elif args.cmd == "snapshot" and args.path:
+        params["path"] = args.path
+    elif args.cmd == "config":
+        for item in args.set or []:
+            key, _, value = item.partition("=")
+            params[key] = value
+    print(json.dumps(client.request(args.cmd, **params), ensure_ascii=False, indent=2))
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(description='Camera Worker для IMX500')
     parser.add_argument('--config', default='config.toml', help='Путь к файлу конфигурации')
+    parser.add_argument('--socket-only', action='store_true',
+                        help='Только Unix-сокет, без команд через stdin (для systemd)')
+    sub = parser.add_subparsers(dest='mode')
+    client = sub.add_parser('client', help='Запрос к запущенному воркеру через сокет')
+    client.add_argument('cmd', choices=['detect', 'stats', 'snapshot', 'config', 'subscribe'])
+    client.add_argument('--socket', default=None, help='Путь к сокету (по умолчанию camera.socket)')
+    client.add_argument('--max-age', type=float, default=0.0, help='detect: допустимый возраст результата, с')
+    client.add_argument('--path', default=None, help='snapshot: файл для кадра')
+    client.add_argument('--set', action='append', help='config: ключ=значение')
     args = parser.parse_args()
+
+    if args.mode == 'client':
+        sys.exit(client_main(args))
     
     worker = CameraWorker(args.config)
-    worker.run()
+    profiling.install("camera_worker", load_camera_config(args.config, "profiling"))
+    event_journal.configure(load_camera_config(args.config, "journal"), "camera_worker")
+    worker.run(use_stdin=not args.socket_only)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
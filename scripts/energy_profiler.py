@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Энергопрофилировщик операций AIVA
+Интегрирует отсчёты INA219 (V*I) по окнам start/end из файла маркеров
+(см. op_markers.py) и строит гистограммы мДж на операцию.
+
+Отсчёты берутся из потока power_broker.py (частоту задаёт power.broker_rate).
+
+Пример:
+    export AIVA_ENERGY_MARKERS=/dev/shm/aiva_markers.log
+    python3 scripts/energy_profiler.py run --duration 600 --save /dev/shm/samples.csv
+    python3 scripts/energy_profiler.py analyze /dev/shm/samples.csv
+"""
+import os
+import sys
+import csv
+import json
+import time
+import bisect
+import argparse
+from collections import defaultdict
+from typing import List, Dict, Tuple
+
+from op_markers import MARKERS_ENV
+
+DEFAULT_MARKERS = "/dev/shm/aiva_markers.log"
+
+
+class SampleSeries:
+    #Отсчёты мощности с накопленной энергией для O(log n) интегрирования окон
+    def __init__(self, t_ns: List[int], power_mw: List[float]):
+        self.t = [t / 1e9 for t in t_ns]
+        self.p = power_mw
+        # Накопленная энергия (мДж) методом трапеций
+        self.cum = [0.0] * len(self.t)
+        for i in range(1, len(self.t)):
+            dt = self.t[i] - self.t[i - 1]
+            self.cum[i] = self.cum[i - 1] + 0.5 * (self.p[i] + self.p[i - 1]) * dt
+
+    def __len__(self):
+        return len(self.t)
+
+    def _energy_at(self, t: float) -> float:
+        # Накопленная энергия в момент t с линейной интерполяцией мощности
+        i = bisect.bisect_right(self.t, t) - 1
+        if i < 0:
+            return 0.0
+        if i >= len(self.t) - 1:
+            return self.cum[-1]
+        t0, t1 = self.t[i], self.t[i + 1]
+        p0, p1 = self.p[i], self.p[i + 1]
+        pt = p0 + (p1 - p0) * (t - t0) / (t1 - t0) if t1 > t0 else p0
+        return self.cum[i] + 0.5 * (p0 + pt) * (t - t0)
+
+    def energy(self, t_start: float, t_end: float) -> float:
+        return self._energy_at(t_end) - self._energy_at(t_start)
+
+    def covers(self, t_start: float, t_end: float) -> bool:
+        return bool(self.t) and self.t[0] <= t_start and t_end <= self.t[-1]
+
+    def baseline_power(self, windows: List[Tuple[float, float]]) -> float:
+        # Медиана мощности вне всех окон операций = фон системы
+        idle = []
+        spans = sorted(windows)
+        j = 0
+        for t, p in zip(self.t, self.p):
+            while j < len(spans) and spans[j][1] < t:
+                j += 1
+            if j < len(spans) and spans[j][0] <= t:
+                continue
+            idle.append(p)
+        if not idle:
+            return 0.0
+        idle.sort()
+        return idle[len(idle) // 2]
+
+
+def read_markers(path: str) -> Dict[str, List[Tuple[float, float, float]]]:
+    #Разбор файла маркеров в окна {op: [(start, end, units), ...]}
+    open_ops = {}
+    windows = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            t_ns, pid, op_id, op, phase = parts[:5]
+            key = (pid, op_id, op)
+            if phase == "start":
+                open_ops[key] = int(t_ns) / 1e9
+            elif phase == "end" and key in open_ops:
+                units = float(parts[5]) if len(parts) > 5 else 1.0
+                windows[op].append((open_ops.pop(key), int(t_ns) / 1e9, units))
+    return windows
+
+
+def sample_live(bus, duration: float, rate: float) -> Tuple[List[int], List[float]]:
+    #Опрос INA219 с частотой rate до истечения duration или Ctrl+C
+    from ups_monitor import read_voltage, read_current
+
+    t_ns, power = [], []
+    period = 1.0 / rate
+    deadline = time.monotonic() + duration if duration > 0 else float("inf")
+    next_tick = time.monotonic()
+    try:
+        while time.monotonic() < deadline:
+            voltage = read_voltage(bus)
+            current = read_current(bus)
+            t_ns.append(time.monotonic_ns())
+            power.append(voltage * abs(current))
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    return t_ns, power
+
+
+def sample_broker(client, duration: float) -> Tuple[List[int], List[float]]:
+    #Отсчёты из потока брокера питания (он опрашивает INA219 с broker_rate)
+    t_ns, power = [], []
+    deadline = time.monotonic() + duration if duration > 0 else float("inf")
+    try:
+        for t, voltage, current in client.stream():
+            t_ns.append(t)
+            power.append(voltage * abs(current))
+            if time.monotonic() >= deadline:
+                break
+    except KeyboardInterrupt:
+        pass
+    return t_ns, power
+
+
+def save_samples(path: str, t_ns: List[int], power: List[float]):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["t_ns", "power_mw"])
+        writer.writerows(zip(t_ns, power))
+
+
+def load_samples(path: str) -> Tuple[List[int], List[float]]:
+    # CSV от --save или запись ups_monitor.py record
+    from power_trace import PowerTraceReader, is_power_trace
+    if is_power_trace(path):
+        reader = PowerTraceReader(path)
+        records = [(t, v * abs(i)) for t, v, i in reader.iter_records()]
+        reader.close()
+        return [r[0] for r in records], [r[1] for r in records]
+
+    t_ns, power = [], []
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            t_ns.append(int(row[0]))
+            power.append(float(row[1]))
+    return t_ns, power
+
+
+def profile(series: SampleSeries, windows: Dict[str, List[Tuple[float, float, float]]]) -> Dict[str, Dict]:
+    #Энергия на операцию: полная и сверх фонового потребления
+    all_spans = [(s, e) for spans in windows.values() for s, e, _ in spans]
+    baseline = series.baseline_power(all_spans)
+
+    result = {}
+    for op, spans in sorted(windows.items()):
+        total, delta, durations = [], [], []
+        for start, end, units in spans:
+            if not series.covers(start, end) or units <= 0:
+                continue
+            energy = series.energy(start, end)
+            total.append(energy / units)
+            delta.append((energy - baseline * (end - start)) / units)
+            durations.append((end - start) / units)
+        if total:
+            result[op] = {"total_mj": total, "delta_mj": delta, "duration_s": durations}
+    return {"baseline_mw": baseline, "ops": result}
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def print_report(report: Dict, bins: int = 10, width: int = 40):
+    print(f"Фоновая мощность: {report['baseline_mw']:.0f} mW")
+    for op, data in report["ops"].items():
+        values = data["delta_mj"]
+        print()
+        print(f"■ {op}: n={len(values)}, "
+              f"среднее {sum(values) / len(values):.1f} mJ сверх фона "
+              f"({sum(data['total_mj']) / len(values):.1f} mJ всего), "
+              f"p50 {percentile(values, 0.5):.1f}, p90 {percentile(values, 0.9):.1f}, "
+              f"длительность {sum(data['duration_s']) / len(values) * 1000:.0f} ms")
+
+        lo, hi = min(values), max(values)
+        step = (hi - lo) / bins or 1.0
+        counts = [0] * bins
+        for v in values:
+            counts[min(bins - 1, int((v - lo) / step))] += 1
+        peak = max(counts)
+        for i, count in enumerate(counts):
+            bar = "█" * (count * width // peak) if peak else ""
+            print(f"  {lo + i * step:9.1f} mJ | {bar} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Энергопрофилировщик операций")
+    parser.add_argument("--markers", default=os.environ.get(MARKERS_ENV, DEFAULT_MARKERS),
+                        help="Файл маркеров операций")
+    parser.add_argument("--json", action="store_true", help="Вывод отчёта в JSON")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    run = sub.add_parser("run", help="Запись отсчётов брокера питания и отчёт")
+    run.add_argument("--duration", type=float, default=0, help="Секунды (0 - до Ctrl+C)")
+    run.add_argument("--config", default="config.toml", help="Конфигурация (секция [power])")
+    run.add_argument("--direct", action="store_true", help="Опрашивать INA219 самому, без брокера")
+    run.add_argument("--rate", type=float, default=200, help="Частота опроса для --direct, Гц")
+    run.add_argument("--i2c-bus", type=int, default=1)
+    run.add_argument("--backend", default=None, help="I2C бэкенд для --direct (см. ina219_backend.py)")
+    run.add_argument("--save", help="Сохранить отсчёты в CSV")
+
+    analyze = sub.add_parser("analyze", help="Отчёт по сохранённым отсчётам")
+    analyze.add_argument("samples", help="CSV с отсчётами (t_ns, power_mw) или запись ups_monitor.py")
+
+    args = parser.parse_args()
+
+    if args.mode == "run":
+        print(f"Запись отсчётов, маркеры: {args.markers} (Ctrl+C - стоп)", file=sys.stderr)
+        if args.direct:
+            from ina219_backend import open_bus
+            t_ns, power = sample_live(open_bus(args.backend, args.i2c_bus), args.duration, args.rate)
+        else:
+            from ina219_backend import load_power_config
+            from power_broker import PowerBrokerClient
+            client = PowerBrokerClient.from_config(load_power_config(args.config))
+            t_ns, power = sample_broker(client, args.duration)
+        if args.save:
+            save_samples(args.save, t_ns, power)
+    else:
+        t_ns, power = load_samples(args.samples)
+
+    if len(t_ns) < 2:
+        print("Недостаточно отсчётов", file=sys.stderr)
+        sys.exit(1)
+
+    report = profile(SampleSeries(t_ns, power), read_markers(args.markers))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
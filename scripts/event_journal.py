@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+"""
+Журнал событий: детекции после фильтра, сказанные фразы и события питания в
+компактном бинарном виде, отдельно от текстовых логов. Основа для офлайн-анализа
+вместо grep по camera_worker.log.
+
+Каждый процесс (источник) пишет свои файлы суток, все только дописываются:
+    <dir>/<источник>.<ГГГГММДД>.evj  заголовок "<8sHHIq": magic AIVAEVJ1, версия,
+                                     размер записи, записей на элемент индекса,
+                                     время создания; затем записи EVENT
+    <dir>/<источник>.<ГГГГММДД>.str  таблица строк: "<H" длина + UTF-8;
+                                     метка N - N-я строка, 0 - без метки
+    <dir>/<источник>.<ГГГГММДД>.idx  разреженный индекс: INDEX_ENTRY на каждые
+                                     index_every записей - мин. и макс. время,
+                                     первая запись, число записей, маски меток и видов
+
+Запись EVENT "<qQBBHf4f", 40 байт: t_us (UNIX, мкс), trace id (0 - нет), вид,
+флаги, метка, value, a, b, c, d:
+    frame      value - детекций после фильтра, a - до фильтра, b - время кадра, мс
+    detection  метка - класс, value - уверенность, a..d - bbox x, y, ширина, высота
+    speech     метка - фраза, value - длительность, с, a - синтез, с; флаг 1 - сказано
+    power      метка - событие (sample, normal, warning, critical, charging,
+               discharging, i2c_error), value - напряжение, a - ток мА,
+               b - мощность мВт, c - процент
+
+Запись i лежит по смещению HEADER.size + i * EVENT.size: читатель отображает файл
+в память (mmap), находит начало диапазона бинарным поиском по индексу и пропускает
+блоки без нужного класса по маске меток. Хвост после последнего элемента индекса
+просматривается целиком. Строки пишутся раньше записей, записи раньше индекса,
+поэтому оборванная запись файла (сбой питания) теряет только хвост.
+Пачка дописывается раз в flush_interval секунд, события warning/critical - сразу.
+Пустой кадр пишется только первым после кадра с детекциями: поток камеры без
+объектов не растит журнал на SD.
+
+    python3 scripts/event_journal.py query --since 2h --label person
+    python3 scripts/event_journal.py query --since 2026-10-19 --kind speech --json
+    python3 scripts/event_journal.py stats --since 1d
+"""
+import os
+import sys
+import json
+import glob
+import mmap
+import time
+import heapq
+import fcntl
+import atexit
+import bisect
+import struct
+import logging
+import argparse
+import datetime
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Iterator, Iterable, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AIVAEVJ1"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIq")
+EVENT = struct.Struct("<qQBBHf4f")
+STRING_LEN = struct.Struct("<H")
+INDEX_ENTRY = struct.Struct("<qqIIQI")
+
+DEFAULT_DIR = "logs/journal"
+DEFAULT_INDEX_EVERY = 64
+DEFAULT_FLUSH_INTERVAL = 10.0
+DEFAULT_KEEP_DAYS = 30
+BATCH_BYTES = 4096
+MAX_STRING = 512  # Байт UTF-8; длинная фраза обрезается
+
+KIND_FRAME = 1
+KIND_DETECTION = 2
+KIND_SPEECH = 3
+KIND_POWER = 4
+KIND_NAMES = {KIND_FRAME: "frame", KIND_DETECTION: "detection", KIND_SPEECH: "speech", KIND_POWER: "power"}
+KINDS = {name: kind for kind, name in KIND_NAMES.items()}
+# Имена value, a, b, c, d по видам
+FIELDS = {
+    "frame": ("kept", "raw", "frame_ms"),
+    "detection": ("confidence", "x", "y", "width", "height"),
+    "speech": ("duration_s", "synth_s"),
+    "power": ("voltage", "current_ma", "power_mw", "percentage"),
+}
+
+FLAG_OK = 1
+URGENT_POWER = ("warning", "critical")
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def _day(t_us: int) -> str:
+    return time.strftime("%Y%m%d", time.localtime(t_us / 1e6))
+
+
+def _next_midnight_us(t_us: int) -> int:
+    day = datetime.date.fromtimestamp(t_us / 1e6) + datetime.timedelta(days=1)
+    return int(time.mktime(day.timetuple()) * 1e6)
+
+
+def _split_name(path: str) -> Tuple[str, str]:
+    #<dir>/<источник>.<ГГГГММДД>.evj -> (источник, ГГГГММДД)
+    source, _, day = os.path.basename(path)[:-len(".evj")].rpartition(".")
+    return source, day
+
+
+def _load_strings(data: bytes) -> Tuple[List[str], int]:
+    #Строки таблицы и длина её целой части (без оборванной последней строки)
+    strings = []
+    offset = 0
+    while offset + STRING_LEN.size <= len(data):
+        n = STRING_LEN.unpack_from(data, offset)[0]
+        end = offset + STRING_LEN.size + n
+        if end > len(data):
+            break
+        strings.append(data[offset + STRING_LEN.size:end].decode("utf-8", "replace"))
+        offset = end
+    return strings, offset
+
+
+class Event(NamedTuple):
+    t_us: int
+    kind: str
+    label: str
+    value: float
+    a: float
+    b: float
+    c: float
+    d: float
+    trace: int
+    flags: int
+    source: str
+
+    def fields(self) -> Dict[str, float]:
+        names = FIELDS.get(self.kind, ("value", "a", "b", "c", "d"))
+        return dict(zip(names, (self.value, self.a, self.b, self.c, self.d)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {"t_us": self.t_us, "source": self.source, "kind": self.kind, "label": self.label}
+        result.update(self.fields())
+        if self.kind == "speech":
+            result["ok"] = bool(self.flags & FLAG_OK)
+        if self.trace:
+            result["trace"] = self.trace
+        return result
+
+
+class JournalWriter:
+    #Файлы суток источника под flock, как активный сегмент логов (log_setup.py)
+    def __init__(self, directory: str, source: str, index_every: int = DEFAULT_INDEX_EVERY,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, keep_days: int = DEFAULT_KEEP_DAYS):
+        self.directory = directory
+        self.source = source
+        self.index_every = index_every
+        self.flush_interval = flush_interval
+        self.keep_days = keep_days
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.files = None  # (записи, строки, индекс) текущих суток; открываются первой записью
+        self.day_end_us = 0
+        self.labels: Dict[str, int] = {}
+        self.count = 0
+        self.pending = bytearray()
+        self.pending_strings = bytearray()
+        self.pending_index = bytearray()
+        self._reset_block()
+        self.last_empty = False
+        self.closed = False
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._flush_loop, name=f"journal-{source}", daemon=True)
+        self.thread.start()
+
+    def _reset_block(self):
+        self.block_first = self.count
+        self.block_count = 0
+        self.block_min = self.block_max = 0
+        self.block_labels = 0
+        self.block_kinds = 0
+
+    def _block_add(self, t_us: int, kind: int, label: int):
+        if not self.block_count:
+            self.block_min = self.block_max = t_us
+        else:
+            self.block_min = min(self.block_min, t_us)
+            self.block_max = max(self.block_max, t_us)
+        self.block_count += 1
+        self.block_labels |= 1 << (label & 63)
+        self.block_kinds |= 1 << kind
+        self.count += 1
+        if self.block_count >= self.index_every:
+            self.pending_index += INDEX_ENTRY.pack(self.block_min, self.block_max, self.block_first,
+                                                   self.block_count, self.block_labels, self.block_kinds)
+            self._reset_block()
+
+    def _open(self, t_us: int):
+        day = _day(t_us)
+        for source in (self.source, f"{self.source}-{os.getpid()}"):
+            base = os.path.join(self.directory, f"{source}.{day}")
+            records = open(base + ".evj", "a+b")
+            try:
+                fcntl.flock(records.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                # Файл суток занят живым процессом с тем же источником
+                records.close()
+        else:
+            raise OSError(f"журнал {self.source}.{day} занят")
+        strings = open(base + ".str", "a+b")
+        index = open(base + ".idx", "a+b")
+        self.day_end_us = _next_midnight_us(t_us)
+
+        # Продолжение файла суток после перезапуска; оборванные хвосты отрезаются
+        size = os.fstat(records.fileno()).st_size
+        if size < HEADER.size:
+            records.truncate(0)
+            records.write(HEADER.pack(MAGIC, VERSION, EVENT.size, self.index_every, t_us))
+            records.flush()
+            count = 0
+        else:
+            records.seek(0)
+            magic, _, record_size, index_every, _ = HEADER.unpack(records.read(HEADER.size))
+            if magic != MAGIC or record_size != EVENT.size:
+                raise OSError(f"не журнал событий: {base}.evj")
+            self.index_every = index_every
+            count = (size - HEADER.size) // EVENT.size
+            records.truncate(HEADER.size + count * EVENT.size)
+
+        strings.seek(0)
+        names, valid = _load_strings(strings.read())
+        strings.truncate(valid)
+        self.labels = {name: i + 1 for i, name in enumerate(names)}
+
+        index.seek(0)
+        data = index.read()
+        entries = len(data) // INDEX_ENTRY.size
+        index.truncate(entries * INDEX_ENTRY.size)
+        indexed = 0
+        if entries:
+            _, _, first, n, _, _ = INDEX_ENTRY.unpack_from(data, (entries - 1) * INDEX_ENTRY.size)
+            indexed = min(first + n, count)
+
+        self.files = (records, strings, index)
+        self.count = indexed
+        self._reset_block()
+        if indexed < count:
+            # Записи после последнего элемента индекса (процесс упал до его записи)
+            records.seek(HEADER.size + indexed * EVENT.size)
+            tail = records.read((count - indexed) * EVENT.size)
+            for t, _, kind, _, label, *_ in EVENT.iter_unpack(tail):
+                self._block_add(t, kind, label)
+        self._prune(day)
+
+    def _prune(self, today: str):
+        if self.keep_days <= 0:
+            return
+        oldest = (datetime.datetime.strptime(today, "%Y%m%d")
+                  - datetime.timedelta(days=self.keep_days)).strftime("%Y%m%d")
+        for path in glob.glob(os.path.join(self.directory, "*.evj")):
+            _, day = _split_name(path)
+            if day < oldest:
+                for ext in (".evj", ".str", ".idx"):
+                    try:
+                        os.unlink(path[:-len(".evj")] + ext)
+                    except OSError:
+                        pass
+
+    def _close_files(self):
+        if self.files is not None:
+            for f in self.files:
+                f.close()
+            self.files = None
+
+    def _label(self, name: str) -> int:
+        label = self.labels.get(name)
+        if label is None:
+            encoded = name.encode("utf-8")[:MAX_STRING]
+            if len(self.labels) >= 0xFFFF:
+                return 0
+            label = self.labels[name] = len(self.labels) + 1
+            self.pending_strings += STRING_LEN.pack(len(encoded)) + encoded
+        return label
+
+    def write(self, records: Iterable[tuple], urgent: bool = False):
+        #records: (t_us, вид, метка, value, a, b, c, d, trace, флаги)
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                for t_us, kind, name, value, a, b, c, d, trace, flags in records:
+                    if t_us >= self.day_end_us:
+                        self._write()
+                        self._close_files()
+                        self._open(t_us)
+                    label = self._label(name) if name else 0
+                    self.pending += EVENT.pack(t_us, trace or 0, kind, flags, label,
+                                               value, a, b, c, d)
+                    self._block_add(t_us, kind, label)
+                if urgent or len(self.pending) >= BATCH_BYTES:
+                    self._write()
+            except (OSError, struct.error) as e:
+                logger.error(f"Журнал событий: {e}")
+
+    def _write(self):
+        # Вызывается под self.lock; порядок - строки, записи, индекс
+        if not self.pending:
+            return
+        if self.files is None:
+            # Файл суток не открылся - ошибка уже в логе, записи не копим
+            self.pending.clear()
+            self.pending_strings.clear()
+            self.pending_index.clear()
+            return
+        records, strings, index = self.files
+        try:
+            for f, data in ((strings, self.pending_strings), (records, self.pending),
+                            (index, self.pending_index)):
+                if data:
+                    f.write(data)
+                    f.flush()
+        except OSError as e:
+            logger.error(f"Журнал событий: ошибка записи {records.name}: {e}")
+        self.pending_strings.clear()
+        self.pending.clear()
+        self.pending_index.clear()
+
+    def flush(self):
+        with self.lock:
+            self._write()
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self.stop_event.set()
+        with self.lock:
+            if not self.closed:
+                self._write()
+                self._close_files()
+                self.closed = True
+
+
+class JournalReader:
+    def __init__(self, path: str):
+        self.path = path
+        self.source, self.day = _split_name(path)
+        base = path[:-len(".evj")]
+        self.f = open(path, "rb")
+        size = os.fstat(self.f.fileno()).st_size
+        if size < HEADER.size:
+            self.f.close()
+            raise ValueError(f"Пустой журнал событий: {path}")
+        self.mm = mmap.mmap(self.f.fileno(), size, access=mmap.ACCESS_READ)
+        magic, _, record_size, self.index_every, self.created_us = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or record_size != EVENT.size:
+            self.close()
+            raise ValueError(f"Не журнал событий: {path}")
+        self.count = (size - HEADER.size) // EVENT.size
+
+        # Строки и индекс читаются после записей: они дописываются раньше, значит не отстают
+        try:
+            with open(base + ".str", "rb") as f:
+                strings, _ = _load_strings(f.read())
+        except OSError:
+            strings = []
+        self.strings = [""] + strings
+        self.ids = {name: i for i, name in enumerate(self.strings) if i}
+        self.blocks = self._load_index(base + ".idx")
+        # Записи разных потоков могут прийти чуть не по порядку: ищем по накопленному
+        # максимуму конца блока, останавливаемся по минимуму начала оставшихся блоков
+        self.max_end = []
+        for block in self.blocks:
+            self.max_end.append(max(block[1], self.max_end[-1]) if self.max_end else block[1])
+        self.min_start = [0] * len(self.blocks)
+        lowest = None
+        for i in range(len(self.blocks) - 1, -1, -1):
+            lowest = self.blocks[i][0] if lowest is None else min(lowest, self.blocks[i][0])
+            self.min_start[i] = lowest
+
+    def _load_index(self, path: str) -> List[Tuple[int, int, int, int, int, int]]:
+        blocks = []
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        for entry in INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]):
+            if entry[2] + entry[3] > self.count:
+                break
+            blocks.append(entry)
+        indexed = blocks[-1][2] + blocks[-1][3] if blocks else 0
+        if indexed < self.count:
+            # Хвост без индекса (текущий блок пишущего процесса): один блок с точными масками
+            t_min = t_max = None
+            labels = kinds = 0
+            for t, _, kind, _, label, *_ in EVENT.iter_unpack(self._slice(indexed, self.count - indexed)):
+                t_min = t if t_min is None else min(t_min, t)
+                t_max = t if t_max is None else max(t_max, t)
+                labels |= 1 << (label & 63)
+                kinds |= 1 << kind
+            blocks.append((t_min, t_max, indexed, self.count - indexed, labels, kinds))
+        return blocks
+
+    def _slice(self, first: int, count: int):
+        offset = HEADER.size + first * EVENT.size
+        return self.mm[offset:offset + count * EVENT.size]
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def time_range(self) -> Tuple[int, int]:
+        if not self.blocks:
+            return 0, 0
+        return self.min_start[0], self.max_end[-1]
+
+    def label(self, label_id: int) -> str:
+        return self.strings[label_id] if label_id < len(self.strings) else f"#{label_id}"
+
+    def events(self, since_us: Optional[int] = None, until_us: Optional[int] = None,
+               kinds: Optional[Iterable[str]] = None,
+               labels: Optional[Iterable[str]] = None) -> Iterator[Event]:
+        #События диапазона [since_us, until_us] по времени; kinds и labels - фильтры по имени
+        kind_ids = {KINDS[k] for k in kinds} if kinds else None
+        kind_mask = sum(1 << k for k in kind_ids) if kind_ids else 0
+        label_ids = None
+        label_mask = 0
+        if labels:
+            label_ids = {self.ids[name] for name in labels if name in self.ids}
+            if not label_ids:
+                return
+            for label in label_ids:
+                label_mask |= 1 << (label & 63)
+
+        # Фраза пишется с временем начала: блоки перекрываются по времени. События копятся
+        # в куче и выдаются, когда раньше них уже не может начаться ни один следующий блок
+        pending: List[tuple] = []
+        start = bisect.bisect_left(self.max_end, since_us) if since_us is not None else 0
+        for i in range(start, len(self.blocks)):
+            while pending and pending[0][0] < self.min_start[i]:
+                yield self._event(heapq.heappop(pending))
+            if until_us is not None and self.min_start[i] > until_us:
+                break
+            t_min, t_max, first, count, block_labels, block_kinds = self.blocks[i]
+            if since_us is not None and t_max < since_us:
+                continue
+            if until_us is not None and t_min > until_us:
+                continue
+            if kind_mask and not block_kinds & kind_mask:
+                continue
+            if label_mask and not block_labels & label_mask:
+                continue
+            for record in EVENT.iter_unpack(self._slice(first, count)):
+                t, _, kind, _, label = record[:5]
+                if since_us is not None and t < since_us:
+                    continue
+                if until_us is not None and t > until_us:
+                    continue
+                if kind_ids is not None and kind not in kind_ids:
+                    continue
+                if label_ids is not None and label not in label_ids:
+                    continue
+                heapq.heappush(pending, record)
+        while pending:
+            yield self._event(heapq.heappop(pending))
+
+    def _event(self, record: tuple) -> Event:
+        t, trace, kind, flags, label, value, a, b, c, d = record
+        return Event(t, KIND_NAMES.get(kind, str(kind)), self.label(label), value, a, b, c, d,
+                     trace, flags, self.source)
+
+    def close(self):
+        if getattr(self, "mm", None) is not None:
+            self.mm.close()
+            self.mm = None
+        self.f.close()
+
+
+def open_journals(directory: str = DEFAULT_DIR, since_us: Optional[int] = None,
+                  until_us: Optional[int] = None, sources: Optional[Iterable[str]] = None) -> List[JournalReader]:
+    #Читатели файлов суток, которые могут пересекаться с диапазоном
+    first = _day(since_us - 86400_000_000) if since_us is not None else ""
+    last = _day(until_us + 86400_000_000) if until_us is not None else "99999999"
+    readers = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.evj"))):
+        source, day = _split_name(path)
+        if not first <= day <= last:
+            continue
+        if sources and source not in sources and source.rsplit("-", 1)[0] not in sources:
+            continue
+        try:
+            readers.append(JournalReader(path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"{path}: {e}")
+    return readers
+
+
+def query(directory: str = DEFAULT_DIR, since_us: Optional[int] = None, until_us: Optional[int] = None,
+          kinds: Optional[Iterable[str]] = None, labels: Optional[Iterable[str]] = None,
+          sources: Optional[Iterable[str]] = None) -> Iterator[Event]:
+    #События всех источников по времени
+    readers = open_journals(directory, since_us, until_us, sources)
+    try:
+        yield from heapq.merge(*(r.events(since_us, until_us, kinds, labels) for r in readers),
+                               key=lambda e: e.t_us)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+_writer: Optional[JournalWriter] = None
+
+
+def configure(config: Dict[str, Any], source: str):
+    #Секция [journal]; без enabled запись событий ничего не стоит
+    global _writer
+    if _writer is not None or not config.get("enabled", False):
+        return
+    try:
+        _writer = JournalWriter(config.get("dir", DEFAULT_DIR), source,
+                                int(config.get("index_every", DEFAULT_INDEX_EVERY)),
+                                float(config.get("flush_interval", DEFAULT_FLUSH_INTERVAL)),
+                                int(config.get("keep_days", DEFAULT_KEEP_DAYS)))
+    except OSError as e:
+        logger.warning(f"Журнал событий отключён: {e}")
+        return
+    atexit.register(close)
+
+
+def enabled() -> bool:
+    return _writer is not None
+
+
+def record_frame(detections: List[Dict[str, Any]], raw: Optional[int] = None,
+                 elapsed: float = 0.0, trace: Optional[int] = None):
+    #Кадр после фильтра: запись frame и по записи detection на объект
+    writer = _writer
+    if writer is None:
+        return
+    if not detections and writer.last_empty:
+        return
+    writer.last_empty = not detections
+    t = now_us()
+    records = [(t, KIND_FRAME, "", len(detections), len(detections) if raw is None else raw,
+                elapsed * 1000.0, 0.0, 0.0, trace, 0)]
+    for det in detections:
+        box = det.get("bbox") or {}
+        records.append((t, KIND_DETECTION, str(det.get("label", "")),
+                        float(det.get("confidence", det.get("conf", 0.0))),
+                        box.get("x", 0.0), box.get("y", 0.0), box.get("width", 0.0), box.get("height", 0.0),
+                        trace, 0))
+    writer.write(records)
+
+
+def record_speech(text: str, ok: bool, duration: float, synth: float = 0.0, trace: Optional[int] = None):
+    #Фраза; время записи - начало фразы
+    writer = _writer
+    if writer is None:
+        return
+    t = now_us() - int(duration * 1e6)
+    writer.write([(t, KIND_SPEECH, text, duration, synth, 0.0, 0.0, 0.0, trace, FLAG_OK if ok else 0)])
+
+
+def record_power(event: str, voltage: float, current_ma: float = 0.0, power_mw: float = 0.0,
+                 percentage: float = 0.0):
+    writer = _writer
+    if writer is None:
+        return
+    writer.write([(now_us(), KIND_POWER, event, voltage, current_ma, power_mw, percentage, 0.0, None, 0)],
+                  urgent=event in URGENT_POWER)
+
+
+def close():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def parse_time(text: str) -> int:
+    #"2h", "-30m", "1d" назад; "ГГГГ-ММ-ДД[ ЧЧ:ММ[:СС]]"; "ЧЧ:ММ[:СС]" сегодня; секунды UNIX -> мкс
+    text = text.strip()
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text[-1:] in units:
+        try:
+            return now_us() - int(abs(float(text[:-1])) * units[text[-1]] * 1e6)
+        except ValueError:
+            pass
+    try:
+        return int(float(text) * 1e6)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%H:%M:%S", "%H:%M"):
+        try:
+            parsed = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if not fmt.startswith("%Y"):
+            parsed = datetime.datetime.combine(datetime.date.today(), parsed.time())
+        return int(parsed.timestamp() * 1e6)
+    raise argparse.ArgumentTypeError(f"не время: {text}")
+
+
+def _format_time(t_us: int) -> str:
+    return datetime.datetime.fromtimestamp(t_us / 1e6).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _events(args) -> Iterator[Event]:
+    return query(args.dir, args.since, args.until, args.kind, args.label, args.source)
+
+
+def print_events(args) -> int:
+    shown = 0
+    for event in _events(args):
+        if args.json:
+            print(json.dumps(event.to_dict(), ensure_ascii=False))
+        else:
+            fields = " ".join(f"{name}={value:.4g}" for name, value in event.fields().items())
+            if event.kind == "speech" and not event.flags & FLAG_OK:
+                fields += " ошибка"
+            print(f"{_format_time(event.t_us)}  {event.source:<14}{event.kind:<10}{event.label[:40]:<42}{fields}")
+        shown += 1
+        if args.limit and shown >= args.limit:
+            break
+    if not shown and not args.json:
+        print("Событий нет", file=sys.stderr)
+    return 0
+
+
+def stats(args) -> int:
+    kinds: Counter = Counter()
+    classes: Counter = Counter()
+    confidence: Dict[str, float] = defaultdict(float)
+    power: Counter = Counter()
+    failed = 0
+    first = last = None
+    for event in _events(args):
+        first = event.t_us if first is None else first
+        last = event.t_us
+        kinds[event.kind] += 1
+        if event.kind == "detection":
+            classes[event.label] += 1
+            confidence[event.label] += event.value
+        elif event.kind == "speech" and not event.flags & FLAG_OK:
+            failed += 1
+        elif event.kind == "power":
+            power[event.label] += 1
+    if first is None:
+        print("Событий нет", file=sys.stderr)
+        return 1
+
+    result = {"from": _format_time(first), "to": _format_time(last), "kinds": dict(kinds),
+              "classes": {name: {"count": n, "mean_confidence": confidence[name] / n}
+                          for name, n in classes.most_common()},
+              "speech_failed": failed, "power": dict(power)}
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+    print(f"{result['from']} - {result['to']}")
+    print("Виды: " + ", ".join(f"{name} {n}" for name, n in kinds.most_common()))
+    if classes:
+        print(f"{'класс':<20}{'детекций':>10}{'ср. уверенность':>18}")
+        for name, s in result["classes"].items():
+            print(f"{name:<20}{s['count']:>10}{s['mean_confidence']:>18.2f}")
+    if kinds["speech"]:
+        print(f"Фраз: {kinds['speech']}, не сказано: {failed}")
+    if power:
+        print("Питание: " + ", ".join(f"{name} {n}" for name, n in power.most_common()))
+    return 0
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--dir', default=DEFAULT_DIR, help='Каталог журнала (journal.dir)')
+    common.add_argument('--since', type=parse_time, default=None, help='Начало: 2h, 2026-10-19 10:00, 10:00')
+    common.add_argument('--until', type=parse_time, default=None, help='Конец, в тех же форматах')
+    common.add_argument('--kind', action='append', choices=sorted(KINDS), help='Вид событий (можно несколько)')
+    common.add_argument('--label', action='append', help='Класс, фраза или событие питания (можно несколько)')
+    common.add_argument('--source', action='append', help='Источник: aiva_worker, power_broker, ...')
+    common.add_argument('--json', action='store_true', help='Результат в JSON')
+
+    parser = argparse.ArgumentParser(description='Журнал событий AIVA')
+    sub = parser.add_subparsers(dest='command', required=True)
+    q = sub.add_parser('query', parents=[common], help='События диапазона по времени')
+    q.add_argument('-n', '--limit', type=int, default=0, help='Не больше N событий')
+    sub.add_parser('stats', parents=[common], help='Сводка: виды, классы, фразы, питание')
+    args = parser.parse_args()
+
+    if args.command == 'query':
+        return print_events(args)
+    return stats(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Подключаемые I2C бэкенды для INA219 (UPS HAT C)
+    smbus              - настоящая шина (smbus2)
+    sim[:k=v,...]      - симулятор регистров INA219 + модель батареи 2x18650
+                         (load=30:450/5:900,capacity=3000,speed=1000,...)
+    trace:<файл>[:k=v] - воспроизведение записи ups_monitor.py record или CSV
+                         (speed=1000,loop=1)
+
+Бэкенд выбирается строкой (--backend или AIVA_I2C_BACKEND) и отдаёт
+объект с интерфейсом smbus2: read_i2c_block_data, read_word_data, ...
+
+Прогон логики порогов на симуляторе:
+    python3 scripts/ina219_backend.py simulate --load 30:450,5:900 --hours 10
+"""
+import os
+import abc
+import csv
+import time
+import bisect
+import random
+import argparse
+from typing import List, Tuple, Dict, Any
+
+BACKEND_ENV = "AIVA_I2C_BACKEND"
+
+INA219_ADDRESS = 0x42
+INA219_REG_CONFIG = 0x00
+INA219_REG_SHUNTVOLTAGE = 0x01
+INA219_REG_BUSVOLTAGE = 0x02
+INA219_REG_POWER = 0x03
+INA219_REG_CURRENT = 0x04
+INA219_REG_CALIBRATION = 0x05
+
+# Калибровка для шунта 0.1 Ом: ток 0.1mA/LSB, мощность 2mW/LSB
+DEFAULT_CALIBRATION = 4096
+SHUNT_OHMS = 0.1
+
+# OCV одной Li-ion ячейки 18650 от SoC (разряд при комнатной температуре)
+DEFAULT_CELL_CURVE = [
+    (0.00, 3.00), (0.05, 3.30), (0.10, 3.45), (0.20, 3.60), (0.30, 3.68),
+    (0.40, 3.74), (0.50, 3.80), (0.60, 3.87), (0.70, 3.95), (0.80, 4.03),
+    (0.90, 4.10), (1.00, 4.20),
+]
+
+
+class SimClock:
+    #Время симуляции: ускоренные настенные часы (speed > 0) или ручной шаг (speed = 0)
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self._origin = time.monotonic()
+        self._manual = 0.0
+
+    def now(self) -> float:
+        if self.speed > 0:
+            return (time.monotonic() - self._origin) * self.speed
+        return self._manual
+
+    def advance(self, seconds: float):
+        if self.speed > 0:
+            self._origin -= seconds / self.speed
+        else:
+            self._manual += seconds
+
+
+class BatteryModel:
+    #Батарея из последовательных ячеек: кривая разряда + внутреннее сопротивление
+    def __init__(self, cells: int = 2, capacity_mah: float = 3000.0, soc: float = 1.0,
+                 internal_resistance: float = 0.15, curve: List[Tuple[float, float]] = None):
+        self.cells = cells
+        self.capacity_mah = capacity_mah
+        self.soc = soc
+        self.internal_resistance = internal_resistance
+        self.curve = sorted(curve or DEFAULT_CELL_CURVE)
+        self._soc_points = [p[0] for p in self.curve]
+
+    def open_circuit_voltage(self) -> float:
+        i = bisect.bisect_right(self._soc_points, self.soc) - 1
+        i = max(0, min(i, len(self.curve) - 2))
+        (s0, v0), (s1, v1) = self.curve[i], self.curve[i + 1]
+        cell = v0 + (v1 - v0) * (min(max(self.soc, s0), s1) - s0) / (s1 - s0)
+        return cell * self.cells
+
+    def terminal_voltage(self, load_ma: float) -> float:
+        # load_ma > 0 - разряд, < 0 - зарядка
+        return self.open_circuit_voltage() - load_ma / 1000.0 * self.internal_resistance
+
+    def step(self, dt_s: float, load_ma: float):
+        self.soc -= load_ma * dt_s / 3600.0 / self.capacity_mah
+        self.soc = max(0.0, min(1.0, self.soc))
+
+
+class LoadProfile:
+    #Циклический профиль нагрузки: [(длительность_с, ток_мА), ...]
+    def __init__(self, segments: List[Tuple[float, float]]):
+        self.segments = segments or [(1.0, 450.0)]
+        self.period = sum(d for d, _ in self.segments)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LoadProfile":
+        # "30:450,5:900" или просто "450"
+        segments = []
+        for part in str(spec).replace("/", ",").split(","):
+            if ":" in part:
+                duration, current = part.split(":")
+                segments.append((float(duration), float(current)))
+            elif part.strip():
+                segments.append((1.0, float(part)))
+        return cls(segments)
+
+    def current_at(self, t: float) -> float:
+        t %= self.period
+        for duration, current in self.segments:
+            if t < duration:
+                return current
+            t -= duration
+        return self.segments[-1][1]
+
+
+class _Ina219RegisterMap(abc.ABC):
+    #Общая часть: кодирование измерений в регистры INA219 и интерфейс smbus2
+    def __init__(self, address: int = INA219_ADDRESS, calibration: int = DEFAULT_CALIBRATION):
+        self.address = address
+        self.registers = {INA219_REG_CONFIG: 0x399F, INA219_REG_CALIBRATION: calibration}
+        self.reads = 0
+
+    @abc.abstractmethod
+    def _measure(self) -> Tuple[float, float]:
+        # -> (напряжение шины, В; ток, мА со знаком: + зарядка, - разряд)
+        ...
+
+    def _register(self, reg: int) -> int:
+        if reg in (INA219_REG_CONFIG, INA219_REG_CALIBRATION):
+            return self.registers.get(reg, 0)
+
+        voltage, current_ma = self._measure()
+        calibration = self.registers.get(INA219_REG_CALIBRATION, 0)
+        current_lsb_ma = 40.96 / (calibration * SHUNT_OHMS) if calibration else 0.0
+
+        if reg == INA219_REG_BUSVOLTAGE:
+            # Биты 15..3 - напряжение (4mV/LSB), бит 1 - CNVR
+            return (max(0, int(voltage / 0.004)) << 3 | 0x02) & 0xFFFF
+        if reg == INA219_REG_SHUNTVOLTAGE:
+            return int(current_ma / 1000.0 * SHUNT_OHMS / 10e-6) & 0xFFFF
+        if not calibration:
+            return 0
+        if reg == INA219_REG_CURRENT:
+            raw = max(-32768, min(32767, int(current_ma / current_lsb_ma)))
+            return raw & 0xFFFF
+        if reg == INA219_REG_POWER:
+            return min(0xFFFF, int(voltage * abs(current_ma) / (20 * current_lsb_ma)))
+        raise OSError(5, f"INA219: нет регистра 0x{reg:02x}")
+
+    def _check_address(self, addr: int):
+        if addr != self.address:
+            raise OSError(121, "Remote I/O error")
+
+    def read_i2c_block_data(self, addr: int, reg: int, length: int) -> List[int]:
+        self._check_address(addr)
+        self.reads += 1
+        value = self._register(reg)
+        return [value >> 8, value & 0xFF][:length]
+
+    def write_i2c_block_data(self, addr: int, reg: int, data: List[int]):
+        self._check_address(addr)
+        self.registers[reg] = (data[0] << 8) | data[1]
+
+    def read_word_data(self, addr: int, reg: int) -> int:
+        # SMBus word - младший байт первым, INA219 отдаёт старший первым
+        hi, lo = self.read_i2c_block_data(addr, reg, 2)
+        return (lo << 8) | hi
+
+    def write_word_data(self, addr: int, reg: int, value: int):
+        self.write_i2c_block_data(addr, reg, [value & 0xFF, value >> 8])
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SimulatedINA219(_Ina219RegisterMap):
+    #INA219, подключённый к модели батареи с профилем нагрузки и шумом
+    def __init__(self, battery: BatteryModel = None, load: LoadProfile = None,
+                 clock: SimClock = None, noise_mv: float = 4.0, noise_ma: float = 5.0,
+                 seed: int = None, max_step: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.battery = battery or BatteryModel()
+        self.load = load or LoadProfile([(1.0, 450.0)])
+        self.clock = clock or SimClock()
+        self.noise_mv = noise_mv
+        self.noise_ma = noise_ma
+        self.max_step = max_step
+        self._rng = random.Random(seed)
+        self._t = self.clock.now()
+
+    def _update(self):
+        # Интегрируем разряд шагами не крупнее max_step до текущего времени
+        now = self.clock.now()
+        while self._t < now:
+            dt = min(self.max_step, now - self._t)
+            self.battery.step(dt, self.load.current_at(self._t))
+            self._t += dt
+
+    def _measure(self) -> Tuple[float, float]:
+        self._update()
+        load_ma = self.load.current_at(self._t)
+        voltage = self.battery.terminal_voltage(load_ma) + self._rng.gauss(0, self.noise_mv / 1000.0)
+        current = -load_ma + self._rng.gauss(0, self.noise_ma)
+        return voltage, current
+
+
+class TraceReplayINA219(_Ina219RegisterMap):
+    #Воспроизведение записанной трассы (ups_monitor.py record или CSV) с ускорением
+    def __init__(self, path: str, clock: SimClock = None, loop: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.clock = clock or SimClock()
+        self.loop = loop
+        self.t, self.voltage, self.current = load_trace(path)
+        if not self.t:
+            raise ValueError(f"Пустая трасса: {path}")
+        self._offset = self.clock.now() - self.t[0]
+
+    @property
+    def finished(self) -> bool:
+        return not self.loop and self.clock.now() - self._offset > self.t[-1]
+
+    def _measure(self) -> Tuple[float, float]:
+        t = self.clock.now() - self._offset
+        if self.loop:
+            t = self.t[0] + (t - self.t[0]) % max(self.t[-1] - self.t[0], 1e-9)
+        i = bisect.bisect_right(self.t, t) - 1
+        i = max(0, min(i, len(self.t) - 1))
+        return self.voltage[i], self.current[i]
+
+
+def load_trace(path: str) -> Tuple[List[float], List[float], List[float]]:
+    # Запись ups_monitor.py record или CSV (t_s, voltage, current_ma)
+    from power_trace import PowerTraceReader, is_power_trace
+    if is_power_trace(path):
+        reader = PowerTraceReader(path)
+        t, voltage, current = [], [], []
+        for t_ns, v, i in reader.iter_records():
+            t.append(t_ns / 1e9)
+            voltage.append(v)
+            current.append(i)
+        reader.close()
+        return t, voltage, current
+
+    t, voltage, current = [], [], []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            try:
+                t.append(float(row[0]))
+                voltage.append(float(row[1]))
+                current.append(float(row[2]))
+            except (ValueError, IndexError):
+                continue  # заголовок/мусор
+    return t, voltage, current
+
+
+def parse_options(text: str) -> Dict[str, str]:
+    options = {}
+    for part in text.split(","):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            options[key.strip()] = value.strip()
+    return options
+
+
+def simulator_from_options(opts: Dict[str, str], clock: SimClock = None) -> SimulatedINA219:
+    # Ключи: cells, capacity, soc, resistance, load (30:450/5:900), speed, noise_mv, noise_ma, seed
+    battery = BatteryModel(
+        cells=int(opts.get("cells", 2)),
+        capacity_mah=float(opts.get("capacity", 3000)),
+        soc=float(opts.get("soc", 1.0)),
+        internal_resistance=float(opts.get("resistance", 0.15)),
+    )
+    return SimulatedINA219(
+        battery=battery,
+        load=LoadProfile.parse(opts.get("load", "450")),
+        clock=clock or SimClock(float(opts.get("speed", 1.0))),
+        noise_mv=float(opts.get("noise_mv", 4.0)),
+        noise_ma=float(opts.get("noise_ma", 5.0)),
+        seed=int(opts["seed"]) if "seed" in opts else None,
+    )
+
+
+def open_bus(spec: str = None, i2c_bus: int = 1, clock: SimClock = None):
+    #Открыть шину по строке бэкенда (по умолчанию из AIVA_I2C_BACKEND или smbus)
+    spec = spec or os.environ.get(BACKEND_ENV, "smbus")
+    kind, _, rest = spec.partition(":")
+
+    if kind == "smbus":
+        import smbus2
+        return smbus2.SMBus(i2c_bus)
+
+    if kind == "sim":
+        return simulator_from_options(parse_options(rest), clock)
+
+    if kind == "trace":
+        path, _, opt_text = rest.partition(":")
+        opts = parse_options(opt_text)
+        return TraceReplayINA219(
+            path,
+            clock=clock or SimClock(float(opts.get("speed", 1.0))),
+            loop=opts.get("loop", "0") in ("1", "true", "yes"),
+        )
+
+    raise ValueError(f"Неизвестный I2C бэкенд: {spec}")
+
+
+def load_power_config(path: str) -> Dict[str, Any]:
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f).get("power", {})
+    except (ImportError, OSError):
+        return {}
+
+
+def simulate(args):
+    #Полный разряд на симуляторе с ручными часами: пороги, SoC, скорость
+    from ups_monitor import read_voltage, read_current, calculate_percentage
+
+    cfg = load_power_config(args.config)
+    shutdown_v = cfg.get("shutdown_voltage", 6.4)
+    warning_v = cfg.get("warning_voltage", 6.8)
+    full_v = cfg.get("full_voltage", 8.4)
+    interval = args.interval or cfg.get("check_interval", 30)
+
+    opts = parse_options(args.sim)
+    opts["load"] = args.load
+    clock = SimClock(speed=0)
+    bus = simulator_from_options(opts, clock)
+    battery = bus.battery
+
+    events = []
+    soc_errors = []
+    started = time.perf_counter()
+    while clock.now() < args.hours * 3600:
+        clock.advance(interval)
+        voltage = read_voltage(bus)
+        read_current(bus)
+        estimate = calculate_percentage(voltage, shutdown_v, full_v)
+        soc_errors.append(estimate - battery.soc * 100.0)
+
+        if voltage < warning_v and not any(e[0] == "warning" for e in events):
+            events.append(("warning", clock.now(), voltage, battery.soc))
+        if voltage < shutdown_v:
+            events.append(("shutdown", clock.now(), voltage, battery.soc))
+            break
+    wall = time.perf_counter() - started
+
+    print(f"Нагрузка: {args.load} мА, интервал проверки {interval} с")
+    for name, t, voltage, soc in events:
+        print(f"  {name:9s} через {t / 3600:5.2f} ч: {voltage:.2f}V, истинный SoC {soc * 100:4.1f}%")
+    if not any(e[0] == "shutdown" for e in events):
+        print(f"  до выключения не дошло за {args.hours} ч (SoC {battery.soc * 100:.1f}%)")
+    mean_abs = sum(abs(e) for e in soc_errors) / len(soc_errors)
+    print(f"Ошибка оценки SoC по напряжению: средняя |{mean_abs:.1f}|%, "
+          f"макс {max(soc_errors, key=abs):+.1f}%")
+    print(f"Скорость: {clock.now() / wall:,.0f}× реального времени, {bus.reads / wall:,.0f} чтений/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэкенды INA219 и симуляция разряда")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    sim = sub.add_parser("simulate", help="Прогон разряда с логикой порогов")
+    sim.add_argument("--config", default="config.toml")
+    sim.add_argument("--load", default="450", help="Профиль нагрузки: 30:450,5:900")
+    sim.add_argument("--sim", default="", help="Параметры модели: capacity=3000,soc=1,noise_mv=4")
+    sim.add_argument("--hours", type=float, default=24)
+    sim.add_argument("--interval", type=float, default=0, help="Интервал проверки, с")
+    args = parser.parse_args()
+
+    if args.mode == "simulate":
+        simulate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Задержки по стадиям воркеров (камера: capture, parse, filter, serialize;
+TTS: synth, first_audio, play_end) в гистограммах с фиксированными корзинами
+в духе HdrHistogram: 32 линейные корзины на каждую степень двойки микросекунд,
+относительная погрешность до ~3%, память не растёт, запись - O(1) без аллокаций.
+
+    python3 scripts/latency.py bench   # стоимость записи отсчёта
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Dict, Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+SUB_BITS = 5
+SUB_COUNT = 1 << SUB_BITS
+MAX_BITS = 27                    # 2^27 мкс ~ 134 с, дольше - в последнюю корзину
+MAX_VALUE = (1 << MAX_BITS) - 1
+BUCKETS = (MAX_BITS - SUB_BITS + 1) * SUB_COUNT
+
+
+def bucket_index(us: int) -> int:
+    if us < SUB_COUNT:
+        return us
+    shift = us.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_COUNT + (us >> shift) - SUB_COUNT
+
+
+def bucket_bounds(index: int):
+    #[нижняя, верхняя) граница корзины в микросекундах
+    if index < 2 * SUB_COUNT:
+        return index, index + 1
+    shift = index // SUB_COUNT - 1
+    low = (index - shift * SUB_COUNT) << shift
+    return low, low + (1 << shift)
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total_us", "min_us", "max_us")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total_us = 0
+        self.min_us = MAX_VALUE
+        self.max_us = 0
+
+    def record(self, seconds: float):
+        us = int(seconds * 1e6)
+        if us < 0:
+            us = 0
+        elif us > MAX_VALUE:
+            us = MAX_VALUE
+        self.counts[bucket_index(us)] += 1
+        self.count += 1
+        self.total_us += us
+        if us < self.min_us:
+            self.min_us = us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, q: float) -> float:
+        #Значение в мс (середина корзины), ниже которого q% отсчётов
+        if not self.count:
+            return 0.0
+        rank = max(1, int(q / 100.0 * self.count + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min(max((low + high) / 2, self.min_us), self.max_us) / 1000.0
+        return self.max_us / 1000.0
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "min_ms": self.min_us / 1000.0,
+            "mean_ms": self.total_us / self.count / 1000.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_us / 1000.0,
+        }
+
+
+class StageLatency:
+    #Гистограммы по стадиям одного воркера; отсчёты - секунды time.perf_counter()
+    def __init__(self, name: str, stages: Iterable[str]):
+        self.name = name
+        self.started = time.time()
+        self.stages: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in stages}
+
+    def record(self, stage: str, seconds: float):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {stage: h.summary() for stage, h in self.stages.items()}
+
+    def dump(self, path: str = None):
+        #Сводка в лог и (если указан path) JSON в файл - вызывается при выходе воркера
+        for stage, s in self.stats().items():
+            if s["count"]:
+                logger.info(f"⏱ {self.name}.{stage}: n={s['count']} p50 {s['p50_ms']:.2f} ms, "
+                            f"p90 {s['p90_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms, макс {s['max_ms']:.2f} ms")
+        if path:
+            try:
+                with open(path, "w") as f:
+                    json.dump({"worker": self.name, "started": self.started, "ended": time.time(),
+                               "stages": self.stats()}, f, ensure_ascii=False, indent=2)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить задержки в {path}: {e}")
+
+
+def bench(args):
+    # Стоимость одной стадии: два perf_counter() и record() против кадра камеры
+    latency = StageLatency("bench", ("capture",))
+    values = [0.00005 * (i % 4000) for i in range(args.samples)]
+    start = time.perf_counter()
+    for value in values:
+        t0 = time.perf_counter()
+        latency.record("capture", value + (time.perf_counter() - t0))
+    per_record = (time.perf_counter() - start) / args.samples
+    frame_s = args.frame_ms / 1000.0
+    overhead = per_record * args.stages / frame_s
+    print(f"Запись отсчёта: {per_record * 1e6:.2f} мкс, {args.stages} стадий на кадр "
+          f"{args.frame_ms:.0f} ms -> {overhead:.4%} времени кадра")
+    print(json.dumps(latency.stats()["capture"], ensure_ascii=False))
+    return 0 if overhead < 0.01 else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Гистограммы задержек воркеров')
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('bench', help='Накладные расходы записи (цель - меньше 1% кадра)')
+    b.add_argument('--samples', type=int, default=200000)
+    b.add_argument('--stages', type=int, default=5, help='Стадий на кадр')
+    b.add_argument('--frame-ms', type=float, default=33.0, help='Длительность кадра, мс')
+    args = parser.parse_args()
+    return bench(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
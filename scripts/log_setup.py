@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Логирование воркеров без синхронной записи на SD-карту.
+
+Потоки только кладут запись в очередь (QueueHandler), один поток QueueListener
+форматирует её и копит строки в памяти. Пачка дописывается в активный сегмент
+<dir>/<имя>.log в tmpfs, когда набралось batch_kb, прошло flush_interval секунд
+или пришла запись уровня WARNING и выше. Сегмент больше max_kb становится
+холодным: он сжимается gzip в <archive_dir>/<имя>.<время>.log.gz (на SD - одна
+последовательная запись, в 5-10 раз меньше исходного), хранятся keep последних.
+При штатном выходе активный сегмент архивируется сразу.
+
+Сколько строк может пропасть:
+    - падение процесса (SIGKILL, segfault): буфер в памяти - не больше batch_kb
+      или flush_interval секунд записей ниже WARNING; WARNING и выше уже в tmpfs.
+      Сегменты в tmpfs переживают падение и архивируются при следующем запуске.
+    - потеря питания или перезагрузка без остановки сервисов: дополнительно
+      активный сегмент в tmpfs - не больше max_kb последних строк.
+
+    tail -f /dev/shm/aiva_logs/aiva_worker.log        # живой лог
+    zcat logs/aiva_worker.*.log.gz | less              # архив
+"""
+import os
+import sys
+import glob
+import gzip
+import fcntl
+import time
+import queue
+import atexit
+import shutil
+import logging
+import threading
+import logging.handlers
+from typing import Dict, Any, Optional, List
+
+DEFAULT_DIR = "/dev/shm/aiva_logs"
+DEFAULT_ARCHIVE_DIR = "logs"
+DEFAULT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def load_section(path: str = "config.toml", section: str = "logging") -> Dict[str, Any]:
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f).get(section, {})
+    except (ImportError, OSError, ValueError):
+        return {}
+
+
+class BatchFileHandler(logging.Handler):
+    #Пачки строк в сегмент в tmpfs, холодные сегменты - gzip в архив
+    def __init__(self, name: str, config: Dict[str, Any]):
+        super().__init__()
+        self.log_name = name
+        directory = config.get("dir", DEFAULT_DIR)
+        self.archive_dir = config.get("archive_dir", DEFAULT_ARCHIVE_DIR)
+        self.batch_bytes = int(config.get("batch_kb", 64)) * 1024
+        self.flush_interval = float(config.get("flush_interval", 5.0))
+        self.max_bytes = int(config.get("max_kb", 1024)) * 1024
+        self.keep = int(config.get("keep", 20))
+        self.flush_level = logging.WARNING
+        os.makedirs(directory, exist_ok=True)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.log")
+        self.file = self._open()
+        if self.file is None:
+            # Сегмент занят живым процессом с тем же именем (например, "aiva_worker.py memory")
+            self.path = os.path.join(directory, f"{name}.{os.getpid()}.log")
+            self.file = self._open()
+
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.first_t = 0.0
+        self.size = self.file.tell()
+        self.closed = False
+
+        # Холодные сегменты прошлого запуска (процесс упал до архивации)
+        leftovers = glob.glob(f"{self.path}.*")
+        if leftovers:
+            threading.Thread(target=self._archive_all, args=(leftovers,), daemon=True).start()
+
+        self.stop_event = threading.Event()
+        self.timer = threading.Thread(target=self._flush_loop, name=f"log-flush-{name}", daemon=True)
+        self.timer.start()
+
+    def _open(self):
+        #Активный сегмент под flock: его переименует при ротации только владелец
+        f = open(self.path, "a", encoding="utf-8")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+        if not self.buffer:
+            self.first_t = time.monotonic()
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if record.levelno >= self.flush_level or self.buffered >= self.batch_bytes:
+            self._write()
+
+    def _write(self):
+        # Вызывается под self.lock
+        if not self.buffer or self.closed:
+            return
+        data = "".join(self.buffer)
+        self.buffer.clear()
+        self.buffered = 0
+        try:
+            self.file.write(data)
+            self.file.flush()
+            self.size += len(data.encode("utf-8"))
+            if self.size >= self.max_bytes:
+                self._rotate(background=True)
+        except OSError as e:
+            sys.stderr.write(f"log_setup: ошибка записи {self.path}: {e}\n")
+
+    def flush(self):
+        with self.lock:
+            self._write()
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(min(1.0, self.flush_interval)):
+            if self.buffer and time.monotonic() - self.first_t >= self.flush_interval:
+                self.flush()
+
+    def _rotate(self, background: bool):
+        self.file.close()
+        # Метка с миллисекундами; сегменты одной секунды не должны перезаписать друг друга
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+        cold = f"{self.path}.{stamp}"
+        while os.path.exists(cold):
+            cold += "0"
+        os.replace(self.path, cold)
+        if not self.closed:
+            self.file = self._open() or open(self.path, "a", encoding="utf-8")
+            self.size = 0
+        if background:
+            # Сжатие 1 МБ на Zero 2W - сотни миллисекунд: не задерживаем поток логирования
+            threading.Thread(target=self._archive_all, args=([cold],), daemon=True).start()
+        else:
+            self._archive_all([cold])
+
+    def _archive_all(self, paths: List[str]):
+        for cold in sorted(paths):
+            stamp = cold.rsplit(".", 1)[-1]
+            dest = os.path.join(self.archive_dir, f"{self.log_name}.{stamp}.log.gz")
+            try:
+                with open(cold, "rb") as src, gzip.open(dest + ".tmp", "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(dest + ".tmp", dest)
+                os.unlink(cold)
+            except OSError as e:
+                sys.stderr.write(f"log_setup: не удалось архивировать {cold}: {e}\n")
+        archives = sorted(glob.glob(os.path.join(self.archive_dir, f"{self.log_name}.*.log.gz")))
+        for old in archives[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.unlink(old)
+            except OSError:
+                pass
+
+    def close(self):
+        self.stop_event.set()
+        with self.lock:
+            if not self.closed:
+                self._write()
+                self.closed = True
+                if self.size:
+                    self._rotate(background=False)
+                else:
+                    self.file.close()
+        super().close()
+
+
+def setup_logging(name: str, config: Optional[Dict[str, Any]] = None, fmt: str = DEFAULT_FORMAT,
+                  level: int = logging.INFO) -> None:
+    #Корневой логгер процесса: QueueHandler -> поток с stderr и BatchFileHandler.
+    #Повторный вызов (модуль воркера, импортированный хостом) ничего не меняет
+    global _listener
+    if _listener is not None:
+        return
+    if config is None:
+        config = load_section()
+    formatter = logging.Formatter(fmt)
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    try:
+        handlers.append(BatchFileHandler(name, config))
+    except OSError as e:
+        sys.stderr.write(f"log_setup: файловый лог отключён: {e}\n")
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    #Дописать очередь и буфер, заархивировать активный сегмент
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
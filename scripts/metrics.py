@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Метрики в текстовом формате Prometheus по схеме textfile: каждый компонент
+раз в interval секунд атомарно переписывает свой файл <dir>/<имя>.prom,
+scripts/metrics_exporter.py склеивает их и отдаёт по HTTP на localhost.
+Запись метрик не зависит от того, есть ли скрейпер, и стоит одного write в tmpfs.
+"""
+import os
+import gc
+import time
+import bisect
+import logging
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = "/dev/shm/aiva_metrics"
+# Границы корзин, секунды: от долей миллисекунды (GC) до секунд (синтез речи)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    #Гистограмма Prometheus с фиксированными корзинами (секунды)
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float, n: int = 1):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += n
+        self.count += n
+        self.sum += seconds * n
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        result = []
+        seen = 0
+        for le, n in zip(self.buckets, self.counts):
+            seen += n
+            result.append((le, seen))
+        return result
+
+
+def from_hdr(hdr, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    #Гистограмма из latency.LatencyHistogram воркера (корзины - по серединам HDR-корзин)
+    from latency import bucket_bounds
+    h = Histogram(buckets)
+    for index, n in enumerate(hdr.counts):
+        if n:
+            low, high = bucket_bounds(index)
+            h.observe((low + high) / 2e6, n)
+    h.sum = hdr.total_us / 1e6
+    return h
+
+
+class GcPauses:
+    #Паузы сборщика мусора через gc.callbacks: одна метка времени на начало и конец
+    def __init__(self):
+        self.pauses = Histogram()
+        self.collections = [0, 0, 0]
+        self.collected = 0
+        self._start = 0.0
+        gc.callbacks.append(self._callback)
+
+    def _callback(self, phase: str, info: Dict[str, int]):
+        if phase == "start":
+            self._start = time.perf_counter()
+            return
+        self.pauses.observe(time.perf_counter() - self._start)
+        self.collections[info["generation"]] += 1
+        self.collected += info["collected"]
+
+    def export(self, exp: "Exposition", **labels):
+        exp.histogram("aiva_python_gc_pause_seconds", self.pauses, "Паузы сборщика мусора Python", **labels)
+        for generation, n in enumerate(self.collections):
+            exp.counter("aiva_python_gc_collections_total", n, "Сборки мусора по поколениям",
+                        generation=str(generation), **labels)
+        exp.counter("aiva_python_gc_collected_total", self.collected, "Освобождено объектов", **labels)
+
+
+def _value(value: float) -> str:
+    # Целые (байты, счётчики) - без экспоненты, дробные - до 10 значащих цифр
+    return str(value) if isinstance(value, int) else f"{value:.10g}"
+
+
+def _labels(labels: Dict[str, Any], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Exposition:
+    #Сборка текста в формате Prometheus: сэмплы сгруппированы по семействам, HELP и TYPE - по разу
+    def __init__(self):
+        self.families: Dict[str, List] = {}  # имя -> [тип, описание, строки сэмплов]
+
+    def _family(self, name: str, kind: str, help_text: str) -> List[str]:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = [kind, help_text, []]
+        return family[2]
+
+    def gauge(self, name: str, value: float, help_text: str = "", **labels):
+        self._family(name, "gauge", help_text).append(f"{name}{_labels(labels)} {_value(value)}")
+
+    def counter(self, name: str, value: float, help_text: str = "", **labels):
+        self._family(name, "counter", help_text).append(f"{name}{_labels(labels)} {_value(value)}")
+
+    def histogram(self, name: str, hist: Histogram, help_text: str = "", **labels):
+        lines = self._family(name, "histogram", help_text)
+        for le, n in hist.cumulative():
+            bucket = _labels(labels, 'le="%g"' % le)
+            lines.append(f"{name}_bucket{bucket} {n}")
+        bucket = _labels(labels, 'le="+Inf"')
+        lines.append(f"{name}_bucket{bucket} {hist.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_value(hist.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+    def merge(self, text: str):
+        #Добавить текст другого компонента: одно семейство из нескольких файлов - одним блоком
+        help_text, lines = "", None
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                help_text = line.split(" ", 3)[3] if line.count(" ") >= 3 else ""
+            elif line.startswith("# TYPE "):
+                _, _, name, kind = line.split(" ", 3)
+                lines = self._family(name, kind, help_text)
+            elif line and not line.startswith("#") and lines is not None:
+                lines.append(line)
+
+    def text(self) -> str:
+        out = []
+        for name, (kind, help_text, lines) in self.families.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+class TextfileWriter:
+    def __init__(self, name: str, directory: str = DEFAULT_DIR):
+        self.path = os.path.join(directory, f"{name}.prom")
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, exp: Exposition):
+        # Через временный файл и rename: экспортёр не увидит половину файла
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(exp.text())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.error(f"Ошибка записи метрик {self.path}: {e}")
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Экспортёр метрик Prometheus на localhost: объединяет файлы <metrics.dir>/*.prom,
+которые пишут Rust (rust.prom), хост воркеров (worker.prom) и v1 (aiva_v1.prom),
+и добавляет то, что читается прямо при запросе:
+    - температура CPU, MemAvailable, загрузка
+    - RSS и процессорное время процессов AIVA (список pid кэшируется)
+    - показания INA219 и заряд из снимка брокера питания (seqlock, без I2C)
+Запрос обходится в несколько чтений /proc и tmpfs - скрейп раз в 5 с на Zero 2W незаметен.
+
+    python3 scripts/metrics_exporter.py              # http://127.0.0.1:9101/metrics
+    python3 scripts/metrics_exporter.py once         # один снимок в stdout
+    python3 metrics_exporter.py --dir /dev/shm/aiva_metrics   # v1 (config.yaml не читается)
+"""
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Tuple
+
+import metrics
+from log_setup import load_section
+from power_broker import PowerBrokerClient
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_LISTEN = "127.0.0.1:9101"
+THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+# Процессы AIVA по командной строке: Rust-бинарник, воркеры, v1
+PROCESS_MARKERS = ("aiva", "vision_voice_zero_imx500", "aiva_worker.py", "camera_worker.py", "tts_worker.py",
+                   "power_broker.py", "ups_monitor.py", "main.py")
+PID_CACHE_S = 30.0
+POWER_FIELDS = (("voltage", "Напряжение батареи, В"), ("current_ma", "Ток, мА (+ зарядка)"),
+                ("power_mw", "Мощность, мВт"), ("percentage", "Заряд, %"),
+                ("avg_current_ma", "Средний ток за 60 с, мА"), ("min_voltage", "Минимум напряжения за 60 с, В"))
+
+
+class Collector:
+    def __init__(self, config: Dict[str, Any]):
+        self.directory = config.get("metrics", {}).get("dir", metrics.DEFAULT_DIR)
+        self.power = PowerBrokerClient.from_config(config.get("power", {}))
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.pids: List[Tuple[int, str]] = []
+        self.pids_t = 0.0
+        self.scrapes = 0
+
+    def _processes(self) -> List[Tuple[int, str]]:
+        # Полный обход /proc - раз в PID_CACHE_S, между ними только statm и stat известных pid
+        now = time.monotonic()
+        if now - self.pids_t < PID_CACHE_S and self.pids:
+            return self.pids
+        found = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit() or int(entry) == os.getpid():
+                continue
+            try:
+                with open(f"/proc/{entry}/cmdline", "rb") as f:
+                    argv = f.read().decode(errors="replace").split("\0")
+            except OSError:
+                continue
+            # Сама программа или скрипт интерпретатора, а не timeout/sh с ним в аргументах
+            program = os.path.basename(argv[0])
+            if program.startswith("python") and len(argv) > 1:
+                program = os.path.basename(argv[1])
+            if program in PROCESS_MARKERS:
+                found.append((int(entry), program.replace(".py", "")))
+        self.pids, self.pids_t = found, now
+        return found
+
+    def _process_metrics(self, exp: metrics.Exposition):
+        alive = []
+        for pid, name in self._processes():
+            try:
+                with open(f"/proc/{pid}/statm") as f:
+                    rss = int(f.read().split()[1]) * self.page_size
+                with open(f"/proc/{pid}/stat") as f:
+                    # Имя процесса в скобках может содержать пробелы
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu = (int(fields[11]) + int(fields[12])) / self.clock_ticks
+            except (OSError, IndexError, ValueError):
+                continue
+            alive.append((pid, name))
+            exp.gauge("aiva_process_resident_bytes", rss, "RSS процесса", process=name, pid=pid)
+            exp.counter("aiva_process_cpu_seconds_total", cpu, "Процессорное время", process=name, pid=pid)
+        if len(alive) != len(self.pids):
+            self.pids_t = 0.0  # процесс завершился - на следующем запросе обойдём /proc заново
+
+    def _system_metrics(self, exp: metrics.Exposition):
+        try:
+            with open(THERMAL_PATH) as f:
+                exp.gauge("aiva_cpu_temperature_celsius", int(f.read()) / 1000.0, "Температура CPU")
+        except (OSError, ValueError):
+            pass
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("MemTotal", "MemAvailable", "SwapFree"):
+                    exp.gauge("aiva_memory_bytes", int(value.split()[0]) * 1024, "Память системы", kind=key)
+        load1, load5, _ = os.getloadavg()
+        exp.gauge("aiva_load_average", load1, "Средняя загрузка", window="1m")
+        exp.gauge("aiva_load_average", load5, "Средняя загрузка", window="5m")
+
+    def _power_metrics(self, exp: metrics.Exposition):
+        if not self.power.available():
+            return
+        try:
+            snapshot = self.power.snapshot()
+        except (OSError, ValueError, TimeoutError) as e:
+            logger.debug(f"Снимок брокера питания недоступен: {e}")
+            return
+        for field, help_text in POWER_FIELDS:
+            exp.gauge(f"aiva_power_{field}", snapshot[field], help_text)
+        exp.counter("aiva_power_charge_mah_total", snapshot["charge_mah"], "Заряд с запуска брокера, мА·ч")
+        exp.counter("aiva_power_samples_total", snapshot["samples"], "Отсчётов INA219")
+        exp.counter("aiva_power_errors_total", snapshot["errors"], "Ошибок чтения INA219")
+        exp.gauge("aiva_power_snapshot_age_seconds", max(0.0, time.time() - snapshot["t_wall"]),
+                  "Возраст снимка брокера")
+
+    def collect(self) -> str:
+        start = time.perf_counter()
+        self.scrapes += 1
+        exp = metrics.Exposition()
+        self._system_metrics(exp)
+        self._process_metrics(exp)
+        self._power_metrics(exp)
+
+        # Файлы компонентов: возраст показывает, что писатель жив
+        now = time.time()
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.prom"))):
+            try:
+                with open(path) as f:
+                    exp.merge(f.read())
+                age = now - os.stat(path).st_mtime
+            except OSError:
+                continue
+            exp.gauge("aiva_metrics_file_age_seconds", age, "Секунд с обновления файла метрик",
+                      file=os.path.basename(path)[:-len(".prom")])
+        exp.counter("aiva_exporter_scrapes_total", self.scrapes, "Запросов к экспортёру")
+        exp.gauge("aiva_exporter_scrape_seconds", time.perf_counter() - start, "Длительность сбора")
+        return exp.text()
+
+
+def _make_handler(collector: Collector):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = collector.collect().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # запрос каждые несколько секунд - не для лога
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Экспортёр метрик AIVA для Prometheus')
+    parser.add_argument('--config', default='config.toml', help='Путь к файлу конфигурации')
+    parser.add_argument('--listen', default=None, help='Адрес:порт (по умолчанию metrics.listen)')
+    parser.add_argument('--dir', default=None, help='Каталог *.prom (по умолчанию metrics.dir)')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('once', help='Вывести метрики один раз и выйти')
+    args = parser.parse_args()
+
+    config = {section: load_section(args.config, section) for section in ("metrics", "power")}
+    if args.dir:
+        config.setdefault("metrics", {})["dir"] = args.dir
+    collector = Collector(config)
+    if args.command == 'once':
+        sys.stdout.write(collector.collect())
+        return 0
+
+    host, _, port = (args.listen or config.get("metrics", {}).get("listen", DEFAULT_LISTEN)).rpartition(":")
+    server = HTTPServer((host, int(port)), _make_handler(collector))
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics ({collector.directory})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
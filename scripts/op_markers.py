@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Маркеры начала/конца операций для энергопрофилировщика
+Включаются переменной окружения AIVA_ENERGY_MARKERS=<файл>, без неё ничего не пишут
+"""
+import os
+import time
+import itertools
+from contextlib import contextmanager
+
+MARKERS_ENV = "AIVA_ENERGY_MARKERS"
+
+# Имена операций, которые понимает energy_profiler.py
+OP_DETECT = "imx500_detect"
+OP_SYNTH = "piper_synth"
+OP_PLAY = "aplay"
+OP_VOSK = "vosk_audio"
+OP_BT_RECONNECT = "bt_reconnect"
+
+_path = os.environ.get(MARKERS_ENV)
+_fd = None
+_seq = itertools.count(1)
+
+
+def enabled() -> bool:
+    return bool(_path)
+
+
+def mark(op: str, phase: str, op_id: int = 0, units: float = None):
+    # Одна строка на событие: t_ns pid id op phase [units]
+    # O_APPEND + один write() - строки разных процессов не перемешиваются
+    global _fd
+    if not _path:
+        return
+    try:
+        if _fd is None:
+            _fd = os.open(_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        line = f"{time.monotonic_ns()} {os.getpid()} {op_id} {op} {phase}"
+        if units is not None:
+            line += f" {units:g}"
+        os.write(_fd, (line + "\n").encode())
+    except OSError:
+        pass
+
+
+@contextmanager
+def marked(op: str, units: float = None):
+    # units - во сколько "единиц" нормировать энергию (например, секунды аудио для Vosk)
+    if not _path:
+        yield
+        return
+    op_id = next(_seq)
+    mark(op, "start", op_id)
+    try:
+        yield
+    finally:
+        mark(op, "end", op_id, units)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Брокер питания: единственный процесс, который работает с INA219 на UPS HAT C
+Один раз настраивает и калибрует датчик, опрашивает его с частотой broker_rate
+и публикует последнее измерение и агрегаты:
+    - снимок в разделяемой памяти (broker_snapshot, seqlock, см. SNAPSHOT_FORMAT)
+    - Unix-сокет (broker_socket) с текстовыми командами: latest, stats, stream
+
+Клиенты: ups_monitor.py, energy_profiler.py, Rust PowerMonitor, PowerManager.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import signal
+import logging
+import argparse
+import threading
+import socketserver
+from collections import deque
+from typing import Dict, Any, Iterator, Tuple
+
+from ina219_backend import (open_bus, load_power_config, INA219_REG_CONFIG,
+                            INA219_REG_CALIBRATION, DEFAULT_CALIBRATION)
+import event_journal
+from log_setup import load_section
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT = "/dev/shm/aiva_power.snap"
+DEFAULT_SOCKET = "/dev/shm/aiva_power.sock"
+
+# 32V, /8 (±320mV на шунте = ±3.2A), 12 бит 532µs, непрерывный режим
+INA219_CONFIG_VALUE = 0x399F
+# Гистерезис смены зарядки/разрядки по среднему току окна
+CHARGE_HYSTERESIS_MA = 20.0
+
+# Снимок (little endian, 112 байт): magic, seq, t_mono_ns, t_wall, voltage, current_ma,
+# power_mw, percentage, avg_voltage, avg_current_ma, min_voltage (окно 60 с),
+# charge_mah (с запуска брокера, + зарядка), samples, errors.
+# seq нечётный во время записи - читатель повторяет чтение.
+SNAPSHOT_MAGIC = b"AIVAPWR1"
+SNAPSHOT_FORMAT = "<8sQQdddddddddQQ"
+SNAPSHOT_SIZE = struct.calcsize(SNAPSHOT_FORMAT)
+# Снимок старше - брокер считается зависшим (как SNAPSHOT_MAX_AGE в power_monitor.rs)
+SNAPSHOT_MAX_AGE = 10.0
+SNAPSHOT_FIELDS = ("t_mono_ns", "t_wall", "voltage", "current_ma", "power_mw", "percentage",
+                   "avg_voltage", "avg_current_ma", "min_voltage", "charge_mah",
+                   "samples", "errors")
+
+
+class RollingWindow:
+    #Скользящие среднее/минимум за window секунд, амортизированно O(1) на отсчёт
+    def __init__(self, window: float):
+        self.window = window
+        self.items = deque()
+        self.minima = deque()  # (t, voltage) с возрастающим напряжением
+        self.sum_v = 0.0
+        self.sum_i = 0.0
+
+    def add(self, t: float, voltage: float, current: float):
+        self.items.append((t, voltage, current))
+        self.sum_v += voltage
+        self.sum_i += current
+        while self.minima and self.minima[-1][1] >= voltage:
+            self.minima.pop()
+        self.minima.append((t, voltage))
+
+        horizon = t - self.window
+        while self.items[0][0] < horizon:
+            _, v, i = self.items.popleft()
+            self.sum_v -= v
+            self.sum_i -= i
+        while self.minima[0][0] < horizon:
+            self.minima.popleft()
+
+    def averages(self) -> Tuple[float, float, float]:
+        if not self.items:
+            return 0.0, 0.0, 0.0
+        n = len(self.items)
+        return self.sum_v / n, self.sum_i / n, self.minima[0][1]
+
+
+class SnapshotWriter:
+    def __init__(self, path: str):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SNAPSHOT_SIZE)
+            self.mm = mmap.mmap(fd, SNAPSHOT_SIZE)
+        finally:
+            os.close(fd)
+        self.seq = 0
+
+    def write(self, values: Dict[str, Any]):
+        # seqlock: нечётный seq -> данные -> чётный seq
+        self.seq += 1
+        struct.pack_into("<Q", self.mm, 8, self.seq)
+        packed = struct.pack(SNAPSHOT_FORMAT, SNAPSHOT_MAGIC, self.seq,
+                             *(values[f] for f in SNAPSHOT_FIELDS))
+        self.mm[16:] = packed[16:]
+        self.seq += 1
+        self.mm[:16] = SNAPSHOT_MAGIC + struct.pack("<Q", self.seq)
+
+    def close(self):
+        self.mm.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class PowerBroker:
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.rate = float(config.get("broker_rate", 50))
+        self.address = config.get("i2c_address", 0x42)
+        self.min_v = config.get("shutdown_voltage", 6.4)
+        self.warning_v = config.get("warning_voltage", 6.8)
+        self.max_v = config.get("full_voltage", 8.4)
+        self.journal_interval = float(config.get("journal_interval", 60))
+        self.journal_t = 0.0
+        self.level = None
+        self.charging = None
+        self.socket_path = config.get("broker_socket", DEFAULT_SOCKET)
+        self.snapshot_path = config.get("broker_snapshot") or DEFAULT_SNAPSHOT
+
+        self.running = True
+        self.bus = None
+        self.window = RollingWindow(60.0)
+        self.latest: Dict[str, Any] = {}
+        self.charge_mah = 0.0
+        self.samples = 0
+        self.errors = 0
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        signal.signal(signal.SIGINT, self.signal_handler)
+
+    def signal_handler(self, signum, frame):
+        logger.info(f"Получен сигнал {signum}, завершение работы...")
+        self.running = False
+
+    def initialize(self):
+        #Единственная запись конфигурации и калибровки INA219
+        self.bus = open_bus(self.config.get("backend"), self.config.get("i2c_bus", 1))
+        self.bus.write_i2c_block_data(self.address, INA219_REG_CONFIG,
+                                      list(INA219_CONFIG_VALUE.to_bytes(2, "big")))
+        self.bus.write_i2c_block_data(self.address, INA219_REG_CALIBRATION,
+                                      list(DEFAULT_CALIBRATION.to_bytes(2, "big")))
+        logger.info(f"✓ INA219 настроен (0x{INA219_CONFIG_VALUE:04X}, калибровка {DEFAULT_CALIBRATION}), "
+                    f"опрос {self.rate:.0f} Гц")
+
+    def sample_loop(self, snapshot: SnapshotWriter):
+        from ups_monitor import read_voltage, read_current, calculate_percentage
+
+        period = 1.0 / self.rate
+        next_tick = time.monotonic()
+        last_t = None
+        while self.running:
+            try:
+                voltage = read_voltage(self.bus)
+                current = read_current(self.bus)
+            except OSError as e:
+                self.errors += 1
+                if self.errors % 100 == 1:
+                    logger.error(f"Ошибка чтения I2C: {e}")
+                    event_journal.record_power("i2c_error", 0.0)
+                time.sleep(period)
+                continue
+
+            t_ns = time.monotonic_ns()
+            t = t_ns / 1e9
+            if last_t is not None:
+                self.charge_mah += current * (t - last_t) / 3600.0
+            last_t = t
+            self.samples += 1
+            self.window.add(t, voltage, current)
+            avg_v, avg_i, min_v = self.window.averages()
+
+            latest = {
+                "t_mono_ns": t_ns,
+                "t_wall": time.time(),
+                "voltage": voltage,
+                "current_ma": current,
+                "power_mw": voltage * abs(current),
+                "percentage": calculate_percentage(voltage, self.min_v, self.max_v),
+                "avg_voltage": avg_v,
+                "avg_current_ma": avg_i,
+                "min_voltage": min_v,
+                "charge_mah": self.charge_mah,
+                "samples": self.samples,
+                "errors": self.errors,
+            }
+            snapshot.write(latest)
+            self.journal(t, latest)
+            with self.lock:
+                self.latest = latest
+                line = f"{t_ns} {voltage:.4f} {current:.2f}\n".encode()
+                for sub in self.subscribers:
+                    sub.append(line)
+
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def journal(self, t: float, latest: Dict[str, Any]):
+        #События питания в журнал: смена уровня заряда и зарядки по средним окна,
+        #отсчёт раз в journal_interval секунд для кривых разряда
+        if not event_journal.enabled():
+            return
+        avg_v, avg_i = latest["avg_voltage"], latest["avg_current_ma"]
+        events = []
+        level = "critical" if avg_v < self.min_v else "warning" if avg_v < self.warning_v else "normal"
+        if level != self.level:
+            if self.level is not None or level != "normal":
+                events.append(level)
+            self.level = level
+        threshold = -CHARGE_HYSTERESIS_MA if self.charging else CHARGE_HYSTERESIS_MA
+        charging = avg_i > threshold
+        if charging != self.charging:
+            if self.charging is not None:
+                events.append("charging" if charging else "discharging")
+            self.charging = charging
+        if t - self.journal_t >= self.journal_interval:
+            self.journal_t = t
+            events.append("sample")
+        for event in events:
+            event_journal.record_power(event, latest["voltage"], latest["current_ma"],
+                                       latest["power_mw"], latest["percentage"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.latest, rate=self.rate, subscribers=len(self.subscribers))
+
+    def run(self):
+        self.initialize()
+        snapshot = SnapshotWriter(self.snapshot_path)
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, _make_handler(self))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"✓ Брокер питания: {self.snapshot_path}, {self.socket_path}")
+
+        try:
+            self.sample_loop(snapshot)
+        finally:
+            server.shutdown()
+            server.server_close()
+            os.unlink(self.socket_path)
+            snapshot.close()
+            self.bus.close()
+            logger.info("✓ Брокер питания остановлен")
+
+
+def _make_handler(broker: PowerBroker):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                command = raw.decode().strip()
+                if command in ("latest", "stats"):
+                    self.wfile.write((json.dumps(broker.stats()) + "\n").encode())
+                elif command == "stream":
+                    self._stream()
+                    return
+                else:
+                    self.wfile.write(b'{"error": "unknown_command"}\n')
+
+        def _stream(self):
+            # Поток отсчётов "t_ns voltage current_ma"; медленный клиент теряет старые
+            queue = deque(maxlen=int(broker.rate * 10))
+            with broker.lock:
+                broker.subscribers.append(queue)
+            try:
+                while broker.running:
+                    while queue:
+                        self.wfile.write(queue.popleft())
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:
+                pass
+            finally:
+                with broker.lock:
+                    broker.subscribers.remove(queue)
+
+    return Handler
+
+
+class PowerBrokerClient:
+    #Клиент брокера: снимок из разделяемой памяти и команды через сокет
+    def __init__(self, snapshot_path: str = DEFAULT_SNAPSHOT, socket_path: str = DEFAULT_SOCKET,
+                 max_age: float = SNAPSHOT_MAX_AGE):
+        self.snapshot_path = snapshot_path
+        self.socket_path = socket_path
+        self.max_age = max_age  # 0 - не проверять
+        self._mm = None
+        self._inode = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "PowerBrokerClient":
+        return cls(config.get("broker_snapshot") or DEFAULT_SNAPSHOT,
+                   config.get("broker_socket", DEFAULT_SOCKET),
+                   float(config.get("broker_max_age", SNAPSHOT_MAX_AGE)))
+
+    def available(self) -> bool:
+        return os.path.exists(self.snapshot_path)
+
+    def _map(self):
+        # Перезапущенный брокер удаляет старый файл и создаёт новый: отображение
+        # старого inode застыло бы на последних значениях, поэтому сверяем inode
+        inode = os.stat(self.snapshot_path).st_ino
+        if self._mm is not None and inode != self._inode:
+            self.close()
+        if self._mm is None:
+            with open(self.snapshot_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), SNAPSHOT_SIZE, access=mmap.ACCESS_READ)
+                self._inode = os.fstat(f.fileno()).st_ino
+
+    def snapshot(self, retries: int = 100) -> Dict[str, Any]:
+        #Согласованный снимок; TimeoutError - брокер завис (снимок старше max_age)
+        self._map()
+        for _ in range(retries):
+            seq1 = struct.unpack_from("<Q", self._mm, 8)[0]
+            data = self._mm[:SNAPSHOT_SIZE]
+            seq2 = struct.unpack_from("<Q", self._mm, 8)[0]
+            if seq1 == seq2 and seq1 % 2 == 0:
+                magic, _, *values = struct.unpack(SNAPSHOT_FORMAT, data)
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError(f"Неверный формат снимка: {self.snapshot_path}")
+                snapshot = dict(zip(SNAPSHOT_FIELDS, values))
+                age = time.time() - snapshot["t_wall"]
+                if self.max_age and age > self.max_age:
+                    raise TimeoutError(f"Снимок брокера устарел на {age:.0f} с (брокер завис?)")
+                return snapshot
+        raise TimeoutError("Снимок брокера постоянно обновляется")
+
+    def request(self, command: str) -> Dict[str, Any]:
+        import socket
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            sock.sendall(command.encode() + b"\n")
+            return json.loads(sock.makefile().readline())
+
+    def stream(self) -> Iterator[Tuple[int, float, float]]:
+        #Отсчёты (t_ns, voltage, current_ma) по мере опроса INA219
+        import socket
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            sock.sendall(b"stream\n")
+            for line in sock.makefile():
+                t_ns, voltage, current = line.split()
+                yield int(t_ns), float(voltage), float(current)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._inode = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Брокер питания UPS HAT C (INA219)')
+    parser.add_argument('--config', default='config.toml', help='Путь к файлу конфигурации')
+    parser.add_argument('--backend', default=None, help='I2C бэкенд (перекрывает power.backend)')
+    parser.add_argument('--rate', type=float, default=None, help='Частота опроса, Гц')
+    args = parser.parse_args()
+
+    config = load_power_config(args.config)
+    if args.backend:
+        config["backend"] = args.backend
+    if args.rate:
+        config["broker_rate"] = args.rate
+
+    event_journal.configure(load_section(args.config, "journal"), "power_broker")
+    PowerBroker(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Компактная бинарная запись отсчётов INA219 (ups_monitor.py record)
+
+Формат (little endian):
+    заголовок   "<8sHH"  magic AIVATRC1, версия, размер записи
+    чанк        "<4sQI"  b"CHNK", base_ns (CLOCK_MONOTONIC), число записей
+                затем записи "<IHh": dt_us от base_ns, напряжение mV, ток 0.1mA
+    индекс      "<4sQI"  b"INDX", смещение предыдущего индекса, число элементов
+                затем элементы "<QQI": base_ns, смещение чанка, число записей
+    окончание   "<4sQQ"  b"TEND", смещение последнего индекса, всего записей
+
+Чанк пишется не реже раза в секунду (при сбое теряется не больше секунды),
+индекс - каждые INDEX_EVERY чанков. Без окончания файл читается сканированием чанков.
+"""
+import os
+import mmap
+import struct
+from typing import List, Tuple
+
+MAGIC = b"AIVATRC1"
+VERSION = 1
+HEADER = struct.Struct("<8sHH")
+CHUNK = struct.Struct("<4sQI")
+RECORD = struct.Struct("<IHh")
+INDEX = struct.Struct("<4sQI")
+INDEX_ENTRY = struct.Struct("<QQI")
+FOOTER = struct.Struct("<4sQQ")
+
+CHUNK_RECORDS = 1024
+CHUNK_SPAN_NS = 1_000_000_000
+INDEX_EVERY = 64
+
+
+def is_power_trace(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class PowerTraceWriter:
+    def __init__(self, path: str):
+        self.f = open(path, "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.base_ns = None
+        self.buffer = bytearray()
+        self.count = 0
+        self.total = 0
+        self.pending_index: List[Tuple[int, int, int]] = []
+        self.last_index = 0
+
+    def append(self, t_ns: int, voltage: float, current_ma: float):
+        if self.base_ns is not None and (self.count >= CHUNK_RECORDS or
+                                         t_ns - self.base_ns >= CHUNK_SPAN_NS):
+            self._flush_chunk()
+        if self.base_ns is None:
+            self.base_ns = t_ns
+        mv = max(0, min(0xFFFF, int(round(voltage * 1000))))
+        deci_ma = max(-32768, min(32767, int(round(current_ma * 10))))
+        self.buffer += RECORD.pack((t_ns - self.base_ns) // 1000, mv, deci_ma)
+        self.count += 1
+
+    def _flush_chunk(self):
+        if not self.count:
+            return
+        offset = self.f.tell()
+        self.f.write(CHUNK.pack(b"CHNK", self.base_ns, self.count))
+        self.f.write(self.buffer)
+        self.pending_index.append((self.base_ns, offset, self.count))
+        self.total += self.count
+        self.base_ns = None
+        self.buffer.clear()
+        self.count = 0
+        if len(self.pending_index) >= INDEX_EVERY:
+            self._write_index()
+        self.f.flush()
+
+    def _write_index(self):
+        offset = self.f.tell()
+        self.f.write(INDEX.pack(b"INDX", self.last_index, len(self.pending_index)))
+        for entry in self.pending_index:
+            self.f.write(INDEX_ENTRY.pack(*entry))
+        self.last_index = offset
+        self.pending_index = []
+
+    def close(self):
+        self._flush_chunk()
+        if self.pending_index:
+            self._write_index()
+        self.f.write(FOOTER.pack(b"TEND", self.last_index, self.total))
+        self.f.close()
+
+
+class PowerTraceReader:
+    def __init__(self, path: str):
+        self.path = path
+        self.f = open(path, "rb")
+        size = os.fstat(self.f.fileno()).st_size
+        self.mm = mmap.mmap(self.f.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+        if size < HEADER.size or HEADER.unpack_from(self.mm)[0] != MAGIC:
+            raise ValueError(f"Не запись ups_monitor: {path}")
+        self.chunks = self._load_index() or self._scan()
+
+    def _load_index(self) -> List[Tuple[int, int, int]]:
+        # Цепочка индексов от окончания к началу файла
+        if len(self.mm) < HEADER.size + FOOTER.size:
+            return []
+        tag, offset, _ = FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if tag != b"TEND":
+            return []
+        chunks = []
+        while offset:
+            tag, previous, count = INDEX.unpack_from(self.mm, offset)
+            entries = [INDEX_ENTRY.unpack_from(self.mm, offset + INDEX.size + i * INDEX_ENTRY.size)
+                       for i in range(count)]
+            chunks[:0] = entries
+            offset = previous
+        return chunks
+
+    def _scan(self) -> List[Tuple[int, int, int]]:
+        # Файл без окончания (запись прервана): обходим заголовки чанков
+        chunks = []
+        offset = HEADER.size
+        end = len(self.mm)
+        while offset + CHUNK.size <= end:
+            tag, base_ns, count = struct.unpack_from("<4sQI", self.mm, offset)
+            if tag == b"CHNK":
+                if offset + CHUNK.size + count * RECORD.size > end:
+                    break  # недописанный чанк
+                chunks.append((base_ns, offset, count))
+                offset += CHUNK.size + count * RECORD.size
+            elif tag == b"INDX":
+                offset += INDEX.size + count * INDEX_ENTRY.size
+            else:
+                break
+        return chunks
+
+    def __len__(self):
+        return sum(c[2] for c in self.chunks)
+
+    def time_range(self) -> Tuple[int, int]:
+        if not self.chunks:
+            return 0, 0
+        base_ns, offset, count = self.chunks[-1]
+        last_dt = RECORD.unpack_from(self.mm, offset + CHUNK.size + (count - 1) * RECORD.size)[0]
+        return self.chunks[0][0], base_ns + last_dt * 1000
+
+    def iter_records(self):
+        #(t_ns, voltage, current_ma) без numpy
+        for base_ns, offset, count in self.chunks:
+            start = offset + CHUNK.size
+            for dt_us, mv, deci_ma in RECORD.iter_unpack(self.mm[start:start + count * RECORD.size]):
+                yield base_ns + dt_us * 1000, mv / 1000.0, deci_ma / 10.0
+
+    def arrays(self, t_start: int = None, t_end: int = None):
+        #Векторная загрузка (numpy): t_ns int64, voltage и current_ma float64
+        import numpy as np
+
+        dtype = np.dtype([("dt_us", "<u4"), ("mv", "<u2"), ("deci_ma", "<i2")])
+        parts_t, parts_v, parts_i = [], [], []
+        for i, (base_ns, offset, count) in enumerate(self.chunks):
+            next_base = self.chunks[i + 1][0] if i + 1 < len(self.chunks) else None
+            if t_start is not None and next_base is not None and next_base < t_start:
+                continue
+            if t_end is not None and base_ns > t_end:
+                break
+            rec = np.frombuffer(self.mm, dtype=dtype, count=count, offset=offset + CHUNK.size)
+            parts_t.append(base_ns + rec["dt_us"].astype(np.int64) * 1000)
+            parts_v.append(rec["mv"] / 1000.0)
+            parts_i.append(rec["deci_ma"] / 10.0)
+
+        if not parts_t:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty
+        t = np.concatenate(parts_t)
+        v = np.concatenate(parts_v)
+        i = np.concatenate(parts_i)
+        mask = np.ones(len(t), dtype=bool)
+        if t_start is not None:
+            mask &= t >= t_start
+        if t_end is not None:
+            mask &= t <= t_end
+        return t[mask], v[mask], i[mask]
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.f.close()
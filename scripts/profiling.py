@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Профилирование по сигналу на устройстве, без перезапуска воркера:
+    SIGUSR1 - включить/выключить сэмплер стеков; при выключении пишется
+              <dir>/aiva_profile.<имя>.<pid>.<время>.collapsed (формат flamegraph.pl,
+              speedscope: "поток;файл:функция;... число")
+    SIGUSR2 - первый раз запускает tracemalloc и запоминает снимок, каждый следующий
+              пишет <dir>/aiva_tracemalloc.<имя>.<pid>.<время>.txt - top-N прироста
+              памяти по строкам с прошлого сигнала
+Файлы - в tmpfs (/dev/shm), SD-карта не изнашивается.
+
+    kill -USR1 $(pgrep -f aiva_worker.py)       # старт, через минуту ещё раз - стоп
+    python3 scripts/profiling.py top /dev/shm/aiva_profile.aiva_worker.*.collapsed
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = "/dev/shm"
+DEFAULT_INTERVAL = 0.02   # 50 Гц: обход стеков ~0.1 мс, меньше 1% одного ядра Zero 2W
+DEFAULT_MAX_SECONDS = 300  # забытый сэмплер останавливается сам
+DEFAULT_TOP = 25
+DEFAULT_FRAMES = 8         # глубина стека tracemalloc (больше - дороже каждая аллокация)
+
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+class StackSampler:
+    #Периодически снимает стеки всех потоков через sys._current_frames()
+    def __init__(self, path: str, interval: float, max_seconds: float):
+        self.path = path
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.labels: Dict[Any, str] = {}  # code -> "файл:функция", строка собирается один раз
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="aiva-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return label
+
+    def _sample(self, names: Dict[int, str]):
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            parts = []
+            while frame is not None:
+                parts.append(self._label(frame.f_code))
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            parts.reverse()
+            self.stacks[";".join(parts)] += 1
+
+    def _run(self):
+        started = time.monotonic()
+        names: Dict[int, str] = {}
+        names_t = 0.0
+        while not self.stop_event.wait(self.interval):
+            now = time.monotonic()
+            if now - names_t > 1.0:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                names_t = now
+            self._sample(names)
+            self.samples += 1
+            if now - started > self.max_seconds:
+                logger.info(f"🔬 Сэмплер остановлен по лимиту {self.max_seconds:.0f} с")
+                break
+        self._write(time.monotonic() - started)
+
+    def _write(self, duration: float):
+        try:
+            with open(self.path, "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"🔬 Профиль: {self.samples} сэмплов за {duration:.1f} с -> {self.path}")
+        except OSError as e:
+            logger.error(f"Не удалось сохранить профиль {self.path}: {e}")
+
+
+class SignalProfiler:
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.directory = config.get("dir", DEFAULT_DIR)
+        self.interval = float(config.get("interval", DEFAULT_INTERVAL))
+        self.max_seconds = float(config.get("max_seconds", DEFAULT_MAX_SECONDS))
+        self.top = int(config.get("top", DEFAULT_TOP))
+        self.frames = int(config.get("frames", DEFAULT_FRAMES))
+        self.sampler: Optional[StackSampler] = None
+        self.baseline = None
+        self.lock = threading.Lock()
+
+    def _path(self, kind: str, ext: str) -> str:
+        return os.path.join(self.directory, f"aiva_{kind}.{self.name}.{os.getpid()}.{_stamp()}.{ext}")
+
+    def toggle_sampler(self, signum=None, frame=None):
+        # Обработчик сигнала только переключает состояние; файл пишет поток сэмплера
+        if self.sampler is not None and self.sampler.thread.is_alive():
+            self.sampler.stop()
+            self.sampler = None
+            return
+        self.sampler = StackSampler(self._path("profile", "collapsed"), self.interval, self.max_seconds)
+        self.sampler.start()
+        logger.info(f"🔬 Сэмплер стеков запущен ({1 / self.interval:.0f} Гц), повторный SIGUSR1 - стоп")
+
+    def tracemalloc_diff(self, signum=None, frame=None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"🔬 tracemalloc запущен (глубина {self.frames}), следующий SIGUSR2 - разница")
+        # Снимок и сравнение - сотни миллисекунд, не в обработчике сигнала
+        threading.Thread(target=self._snapshot, name="aiva-tracemalloc", daemon=True).start()
+
+    def _snapshot(self):
+        with self.lock:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            previous, self.baseline = self.baseline, snapshot
+        if previous is None:
+            return
+        path = self._path("tracemalloc", "txt")
+        current, peak = tracemalloc.get_traced_memory()
+        try:
+            with open(path, "w") as f:
+                f.write(f"# {self.name} pid {os.getpid()}: отслеживается {current / 1024:.0f} КБ, "
+                        f"пик {peak / 1024:.0f} КБ\n")
+                for stat in snapshot.compare_to(previous, "lineno")[:self.top]:
+                    f.write(f"{stat}\n")
+            logger.info(f"🔬 Разница аллокаций (top {self.top}) -> {path}")
+        except OSError as e:
+            logger.error(f"Не удалось сохранить разницу аллокаций {path}: {e}")
+
+
+def install(name: str, config: Optional[Dict[str, Any]] = None) -> SignalProfiler:
+    #SIGUSR1/SIGUSR2 в текущем процессе; вызывать из главного потока
+    profiler = SignalProfiler(name, config or {})
+    signal.signal(signal.SIGUSR1, profiler.toggle_sampler)
+    signal.signal(signal.SIGUSR2, profiler.tracemalloc_diff)
+    return profiler
+
+
+def top(args) -> int:
+    # Самые частые функции без flamegraph.pl: собственное время (вершина стека) и суммарное
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    samples = 0
+    for path in args.files:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if not stack:
+                    continue
+                n = int(count)
+                frames = stack.split(";")[1:]  # первым идёт имя потока
+                samples += n
+                if frames:
+                    self_counts[frames[-1]] += n
+                for func in set(frames):
+                    total_counts[func] += n
+    if not samples:
+        print("Сэмплов нет", file=sys.stderr)
+        return 1
+    print(f"Сэмплов: {samples}")
+    print(f"{'своё':>7}{'всего':>8}  функция")
+    for func, n in self_counts.most_common(args.limit):
+        print(f"{n / samples:>7.1%}{total_counts[func] / samples:>8.1%}  {func}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Профили, снятые по SIGUSR1/SIGUSR2')
+    sub = parser.add_subparsers(dest='command', required=True)
+    t = sub.add_parser('top', help='Самые частые функции в *.collapsed')
+    t.add_argument('files', nargs='+')
+    t.add_argument('-n', '--limit', type=int, default=20)
+    args = parser.parse_args()
+    return top(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Сквозная трассировка "увидел -> сказал": Rust создаёт trace id в detection_loop
+и передаёт его в хост воркеров, спаны обоих языков пишутся в формате Chrome
+trace (JSON-массив событий "ph": "X", по строке на событие) в tmpfs:
+    <trace.dir>/aiva_trace.rust.json, <trace.dir>/aiva_trace.python.json
+Время - микросекунды UNIX, общее для обоих процессов.
+
+    python3 scripts/trace_spans.py report            # перцентили сквозной задержки и по звеньям
+    python3 scripts/trace_spans.py merge out.json    # один файл для Perfetto / chrome://tracing
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+from latency import LatencyHistogram
+
+DEFAULT_DIR = "/dev/shm"
+PYTHON_PID = 2  # Rust пишет с pid 1
+TOTAL_SPAN = "see_to_speak"
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def perf_to_us(t: float) -> int:
+    #Отметка time.perf_counter() -> микросекунды UNIX
+    return int((time.time() - time.perf_counter() + t) * 1e6)
+
+
+class TraceWriter:
+    def __init__(self, path: str, max_bytes: int, pid: int, process_name: str):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.pid = pid
+        self.process_name = process_name
+        self.lock = threading.Lock()
+        self.file = None
+        self.size = 0
+
+    def _open(self):
+        self.file = open(self.path, "a", buffering=1)
+        self.size = self.file.tell()
+        if self.size == 0:
+            meta = {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.process_name}}
+            self.file.write("[\n" + json.dumps(meta) + ",\n")
+            self.size = self.file.tell()
+
+    def write(self, event: Dict[str, Any]):
+        line = json.dumps(event, ensure_ascii=False) + ",\n"
+        with self.lock:
+            if self.file is None:
+                self._open()
+            elif self.size + len(line) > self.max_bytes:
+                # Одна предыдущая часть, чтобы tmpfs не рос
+                self.file.close()
+                os.replace(self.path, self.path + ".1")
+                self._open()
+            self.file.write(line)
+            self.size += len(line)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+_writer: Optional[TraceWriter] = None
+
+
+def configure(config: Dict[str, Any]):
+    #Секция [trace] config.toml; без enabled трассировка ничего не стоит
+    global _writer
+    if not config.get("enabled", False):
+        return
+    path = os.path.join(config.get("dir", DEFAULT_DIR), "aiva_trace.python.json")
+    _writer = TraceWriter(path, int(config.get("max_kb", 1024)) * 1024, PYTHON_PID, "python workers")
+
+
+def span(name: str, trace: Optional[int], start_us: int, end_us: int, **args):
+    if _writer is None or trace is None:
+        return
+    args["trace"] = trace
+    _writer.write({"name": name, "cat": name.split(".")[0], "ph": "X", "ts": start_us,
+                   "dur": max(0, end_us - start_us), "pid": PYTHON_PID,
+                   "tid": threading.get_ident() & 0xFFFF, "args": args})
+
+
+def close():
+    if _writer is not None:
+        _writer.close()
+
+
+def load_events(paths: List[str]) -> List[Dict[str, Any]]:
+    # Файлы пишутся построчно и не закрываются "]": читаем по строкам
+    events = []
+    for path in paths:
+        for part in (path + ".1", path):
+            if not os.path.exists(part):
+                continue
+            with open(part) as f:
+                for line in f:
+                    line = line.strip().rstrip(",")
+                    if line.startswith("{"):
+                        try:
+                            events.append(json.loads(line))
+                        except ValueError:
+                            pass  # строка, оборванная при записи
+    return events
+
+
+def default_paths(directory: str) -> List[str]:
+    return [os.path.join(directory, f"aiva_trace.{side}.json") for side in ("rust", "python")]
+
+
+def report(args) -> int:
+    events = [e for e in load_events(args.files or default_paths(args.dir)) if e.get("ph") == "X"]
+    traces: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for e in events:
+        trace = e.get("args", {}).get("trace")
+        if trace is not None:
+            traces[trace].append(e)
+    if not traces:
+        print("Спанов с trace id нет", file=sys.stderr)
+        return 1
+
+    total = LatencyHistogram()
+    hops: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+    hop_sum: Dict[str, float] = defaultdict(float)
+    complete = 0
+    for spans in traces.values():
+        names = {s["name"] for s in spans}
+        for s in spans:
+            hops[s["name"]].record(s["dur"] / 1e6)
+        if TOTAL_SPAN not in names:
+            continue  # без речи (нечего сказать, cooldown) - только звенья
+        complete += 1
+        total.record(next(s["dur"] for s in spans if s["name"] == TOTAL_SPAN) / 1e6)
+        for s in spans:
+            if s["name"] != TOTAL_SPAN:
+                hop_sum[s["name"]] += s["dur"]
+
+    result = {
+        "traces": len(traces),
+        "complete": complete,
+        TOTAL_SPAN: total.summary(),
+        "hops": {name: h.summary() for name, h in sorted(hops.items()) if name != TOTAL_SPAN},
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    print(f"Трасс: {len(traces)}, со сказанной фразой: {complete}")
+    if complete:
+        t = result[TOTAL_SPAN]
+        print(f"Увидел -> сказал: p50 {t['p50_ms']:.0f} ms, p90 {t['p90_ms']:.0f} ms, "
+              f"p99 {t['p99_ms']:.0f} ms, макс {t['max_ms']:.0f} ms")
+    print(f"{'звено':<24}{'n':>6}{'p50, ms':>10}{'p90, ms':>10}{'доля':>8}")
+    total_us = total.total_us or 1
+    for name, s in result["hops"].items():
+        share = hop_sum.get(name, 0.0) / total_us
+        print(f"{name:<24}{s['count']:>6}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}{share:>8.0%}")
+    print("Доля - от суммарной сквозной задержки; вложенные звенья (rust.tts и tts.*) перекрываются.")
+    return 0
+
+
+def merge(args) -> int:
+    events = load_events(args.files or default_paths(args.dir))
+    with open(args.output, "w") as f:
+        json.dump(events, f)
+    print(f"{len(events)} событий -> {args.output}")
+    return 0
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--dir', default=DEFAULT_DIR, help='Каталог трасс (trace.dir)')
+    common.add_argument('files', nargs='*', help='Файлы трасс (по умолчанию rust и python из --dir)')
+
+    parser = argparse.ArgumentParser(description='Трассы "увидел -> сказал"')
+    sub = parser.add_subparsers(dest='command', required=True)
+    r = sub.add_parser('report', parents=[common], help='Перцентили сквозной задержки и по звеньям')
+    r.add_argument('--json', action='store_true', help='Результат в JSON')
+    m = sub.add_parser('merge', parents=[common], help='Объединить в один Chrome trace JSON')
+    m.add_argument('-o', '--output', default='aiva_trace.json')
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        return report(args)
+    return merge(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,79 +1,112 @@
 #!/usr/bin/env python3
 import sys
+import time
 import argparse
 import logging
 import subprocess
 from pathlib import Path
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('logs/tts_worker.log'),
-        logging.StreamHandler(sys.stderr)
-    ]
-)
+from op_markers import marked, OP_SYNTH, OP_PLAY
+from latency import StageLatency
+import trace_spans
+import profiling
+import event_journal
+from log_setup import setup_logging, load_section
+
+# Лог - пачками в tmpfs, на SD только сжатые сегменты (scripts/log_setup.py)
+setup_logging("tts_worker")
 logger = logging.getLogger(__name__)
 
+LATENCY_DUMP = "logs/latency_tts.json"
+# Первая порция в aplay: один буфер --buffer-size 512 кадров S16_LE
+FIRST_CHUNK_BYTES = 1024
+
 class TtsWorker:
     def __init__(self, model_path: str, sample_rate: int = 16000):
         self.model_path = Path(model_path)
         self.sample_rate = sample_rate
+        # synth - работа Piper, first_audio (первая порция записана в aplay) и play_end - от начала запроса
+        self.latency = StageLatency("tts", ("synth", "first_audio", "play_end"))
         
         if not self.model_path.exists():
             raise FileNotFoundError(f"Модель TTS не найдена: {model_path}")
             
-    def speak(self, text: str) -> bool:
-        #Синтез речи через Piper (оптимизировано)
+    def speak(self, text: str, trace: int = None) -> bool:
+        #Фраза целиком; удачная или нет - запись speech в журнале событий
+        t_start = time.perf_counter()
+        self.synth_s = 0.0
+        ok = self._speak(text, trace)
+        event_journal.record_speech(text, ok, time.perf_counter() - t_start, self.synth_s, trace)
+        return ok
+
+    def _speak(self, text: str, trace: int = None) -> bool:
+        #Синтез речи через Piper (оптимизировано); trace - id сквозной трассы от Rust
         try:
             logger.info(f"Синтез речи: {text}")
+            t_start = time.perf_counter()
             
-            piper_process = subprocess.Popen(
-                [
-                    "piper",
-                    "--model", str(self.model_path),
-                    "--output_raw",
-                    "--length_scale", "1.1",
-                    "--noise_scale", "0.667",
-                    "--noise_w", "0.8"
-                ],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            with marked(OP_SYNTH):
+                piper_process = subprocess.Popen(
+                    [
+                        "piper",
+                        "--model", str(self.model_path),
+                        "--output_raw",
+                        "--length_scale", "1.1",
+                        "--noise_scale", "0.667",
+                        "--noise_w", "0.8"
+                    ],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
             
-            audio_data, piper_err = piper_process.communicate(
-                input=text.encode('utf-8'),
-                timeout=15
-            )
+                audio_data, piper_err = piper_process.communicate(
+                    input=text.encode('utf-8'),
+                    timeout=15
+                )
+            
+            t_synth = time.perf_counter()
             
             if piper_process.returncode != 0:
                 logger.error(f"Ошибка Piper: {piper_err.decode()}")
                 return False
+            self.synth_s = t_synth - t_start
+            self.latency.record("synth", self.synth_s)
+            trace_spans.span("tts.synth", trace, trace_spans.perf_to_us(t_start),
+                             trace_spans.perf_to_us(t_synth), chars=len(text))
             
             # Воспроизведение с минимальной задержкой
-            aplay_process = subprocess.Popen(
-                [
-                    "aplay",
-                    "-r", str(self.sample_rate),
-                    "-f", "S16_LE",
-                    "-t", "raw",
-                    "-q",
-                    "--buffer-size", "512"
-                ],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            with marked(OP_PLAY):
+                aplay_process = subprocess.Popen(
+                    [
+                        "aplay",
+                        "-r", str(self.sample_rate),
+                        "-f", "S16_LE",
+                        "-t", "raw",
+                        "-q",
+                        "--buffer-size", "512"
+                    ],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+                # Первую порцию пишем сами: first_audio - момент, когда сэмплы ушли в aplay,
+                # а не только запуск процесса; остальное - через communicate
+                aplay_process.stdin.write(audio_data[:FIRST_CHUNK_BYTES])
+                aplay_process.stdin.flush()
+                self.latency.record("first_audio", time.perf_counter() - t_start)
             
-            aplay_out, aplay_err = aplay_process.communicate(
-                input=audio_data,
-                timeout=20
-            )
+                aplay_out, aplay_err = aplay_process.communicate(
+                    input=audio_data[FIRST_CHUNK_BYTES:],
+                    timeout=20
+                )
             
             if aplay_process.returncode != 0:
                 logger.error(f"Ошибка aplay: {aplay_err.decode()}")
                 return False
+            t_end = time.perf_counter()
+            self.latency.record("play_end", t_end - t_start)
+            trace_spans.span("tts.play", trace, trace_spans.perf_to_us(t_synth), trace_spans.perf_to_us(t_end))
                 
             logger.info("✓ Синтез завершен")
             return True
@@ -85,16 +118,22 @@ class TtsWorker:
             logger.error(f"Ошибка синтеза речи: {e}", exc_info=True)
             return False
 
+    def shutdown(self):
+        self.latency.dump(LATENCY_DUMP)
+
 def main():
     parser = argparse.ArgumentParser(description='TTS Worker')
     parser.add_argument('--model', required=True, help='Путь к модели Piper')
     parser.add_argument('--sample-rate', type=int, default=16000, help='Частота дискретизации')
     parser.add_argument('--text', required=True, help='Текст для озвучивания')
     args = parser.parse_args()
+    profiling.install("tts_worker")
+    event_journal.configure(load_section(section="journal"), "tts_worker")
     
     try:
         worker = TtsWorker(args.model, args.sample_rate)
         success = worker.speak(args.text)
+        worker.shutdown()
         sys.exit(0 if success else 1)
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}", exc_info=True)
@@ -2,16 +2,27 @@
 """
 Автономный монитор UPS HAT C
 Для использования отдельно от основной программы
+
+Режимы:
+    (без режима)               строка состояния раз в 2 с
+    record <файл> [--duration] бинарная запись отсчётов (формат в power_trace.py)
+    replay <файл> [--speed]    воспроизведение записи строкой состояния
+    summarize <файл>           статистика записи (numpy)
 """
-import smbus2
 import time
 import sys
+import argparse
+
+from ina219_backend import open_bus, load_power_config, BACKEND_ENV
 
 INA219_ADDRESS = 0x42
 INA219_REG_BUSVOLTAGE = 0x02
 INA219_REG_CURRENT = 0x04
 INA219_REG_POWER = 0x03
 
+# Bus + shunt по 532µs (12 бит) в непрерывном режиме - новое измерение ~раз в 1.06 мс
+INA219_MAX_RATE = 940
+
 def read_voltage(bus):
     data = bus.read_i2c_block_data(INA219_ADDRESS, INA219_REG_BUSVOLTAGE, 2)
     voltage = ((data[0] << 8) | data[1]) >> 3
@@ -29,38 +40,202 @@ def read_power(bus):
     power = (data[0] << 8) | data[1]
     return power * 2.0
 
-def calculate_percentage(voltage):
-    min_v = 6.4
-    max_v = 8.4
+def calculate_percentage(voltage, min_v=6.4, max_v=8.4):
     percentage = ((voltage - min_v) / (max_v - min_v)) * 100.0
     return max(0, min(100, percentage))
 
+def open_reader(args):
+    #Источник (voltage, current, power): снимок брокера питания или своя шина (--direct)
+    if args.direct:
+        bus = open_bus(args.backend, args.i2c_bus)
+        return lambda: (read_voltage(bus), read_current(bus), read_power(bus))
+
+    # Обычный режим: INA219 принадлежит power_broker.py, читаем его снимок
+    from power_broker import PowerBrokerClient
+    client = PowerBrokerClient.from_config(load_power_config(args.config))
+    if not client.available():
+        raise RuntimeError("Брокер питания не запущен: python3 scripts/power_broker.py (или --direct)")
+
+    def read():
+        snap = client.snapshot()
+        return snap["voltage"], snap["current_ma"], snap["power_mw"]
+    return read
+
+def print_status(voltage, current, power):
+    percentage = calculate_percentage(voltage)
+    status = "⚡Зарядка" if current > 0 else "🔋Разрядка"
+    print(f"\r🔋 {percentage:5.1f}% | {voltage:.2f}V | {abs(current):6.0f}mA | {abs(power):6.1f}mW | {status}", end="")
+    sys.stdout.flush()
+
+def run_monitor(args):
+    read = open_reader(args)
+
+    print("╔════════════════════════════════════════╗")
+    print("║   Waveshare UPS HAT C Monitor          ║")
+    print("╚════════════════════════════════════════╝")
+    print()
+
+    while True:
+        print_status(*read())
+        time.sleep(2)
+
+def run_record(args):
+    #Запись отсчётов: поток брокера (его частота) или свой опрос до INA219_MAX_RATE
+    from power_trace import PowerTraceWriter
+
+    if args.direct:
+        bus = open_bus(args.backend, args.i2c_bus)
+        period = 1.0 / min(args.rate, INA219_MAX_RATE)
+
+        def samples():
+            next_tick = time.monotonic()
+            while True:
+                voltage = read_voltage(bus)
+                current = read_current(bus)
+                yield time.monotonic_ns(), voltage, current
+                next_tick += period
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.monotonic()
+        source = samples()
+    else:
+        from power_broker import PowerBrokerClient
+        source = PowerBrokerClient.from_config(load_power_config(args.config)).stream()
+
+    writer = PowerTraceWriter(args.output)
+    deadline = time.monotonic() + args.duration if args.duration > 0 else float("inf")
+    count = 0
+    print(f"Запись в {args.output} (Ctrl+C - стоп)")
+    try:
+        for t_ns, voltage, current in source:
+            writer.append(t_ns, voltage, current)
+            count += 1
+            if count % 1000 == 0:
+                print(f"\r📼 {count} отсчётов | {voltage:.2f}V | {abs(current):6.0f}mA", end="")
+                sys.stdout.flush()
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        writer.close()
+        print(f"\n✓ Записано отсчётов: {count}")
+
+def run_replay(args):
+    from power_trace import PowerTraceReader
+
+    reader = PowerTraceReader(args.input)
+    start_ns, _ = reader.time_range()
+    wall_start = time.monotonic()
+    next_print = 0.0
+    for t_ns, voltage, current in reader.iter_records():
+        offset = (t_ns - start_ns) / 1e9
+        if offset < next_print:
+            continue
+        delay = wall_start + offset / args.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        print_status(voltage, current, voltage * abs(current))
+        # Строка состояния не чаще 20 раз в секунду реального времени
+        next_print = offset + args.speed / 20
+    print()
+
+def summarize(t_ns, voltage, current, bucket: float = 0.0):
+    #Векторная статистика записи -> dict (+ таблица по интервалам bucket секунд)
+    import numpy as np
+
+    t = (t_ns - t_ns[0]) / 1e9
+    dt = np.diff(t)
+    power = voltage * np.abs(current)
+    median_dt = float(np.median(dt)) if len(dt) else 0.0
+    summary = {
+        "samples": len(t),
+        "duration_s": float(t[-1]) if len(t) else 0.0,
+        "rate_hz": 1.0 / median_dt if median_dt > 0 else 0.0,
+        "gaps": int(np.count_nonzero(dt > 5 * median_dt)) if median_dt > 0 else 0,
+        "voltage": [float(x) for x in (voltage.min(), voltage.mean(), voltage.max())],
+        "current_p5_p50_p95": [float(x) for x in np.percentile(current, [5, 50, 95])],
+        "power_mean_mw": float(power.mean()),
+        "energy_wh": float(np.sum(0.5 * (power[1:] + power[:-1]) * dt) / 3.6e6),
+        "charge_mah": float(np.sum(0.5 * (current[1:] + current[:-1]) * dt) / 3600.0),
+    }
+
+    if bucket > 0 and len(t):
+        edges = np.searchsorted(t, np.arange(0.0, t[-1] + bucket, bucket))
+        edges = np.unique(edges[edges < len(t)])
+        counts = np.diff(np.append(edges, len(t)))
+        summary["buckets"] = [
+            {"start_s": float(t[e]), "voltage_mean": float(v), "voltage_min": float(vmin),
+             "current_mean": float(c)}
+            for e, v, vmin, c in zip(
+                edges,
+                np.add.reduceat(voltage, edges) / counts,
+                np.minimum.reduceat(voltage, edges),
+                np.add.reduceat(current, edges) / counts,
+            )
+        ]
+    return summary
+
+def run_summarize(args):
+    from power_trace import PowerTraceReader
+
+    reader = PowerTraceReader(args.input)
+    start_ns, _ = reader.time_range()
+    t_from = start_ns + int(args.start * 1e9) if args.start else None
+    t_to = start_ns + int(args.end * 1e9) if args.end else None
+    t_ns, voltage, current = reader.arrays(t_from, t_to)
+    if not len(t_ns):
+        print("Нет отсчётов в выбранном интервале")
+        return
+
+    s = summarize(t_ns, voltage, current, args.bucket)
+    v_min, v_mean, v_max = s["voltage"]
+    p5, p50, p95 = s["current_p5_p50_p95"]
+    print(f"Отсчётов: {s['samples']} за {s['duration_s'] / 3600:.2f} ч "
+          f"({s['rate_hz']:.0f} Гц, пропусков: {s['gaps']})")
+    print(f"Напряжение: {v_min:.3f} / {v_mean:.3f} / {v_max:.3f} V (мин/сред/макс)")
+    print(f"Ток: p5 {p5:.0f}, p50 {p50:.0f}, p95 {p95:.0f} mA")
+    print(f"Мощность: {s['power_mean_mw']:.0f} mW, энергия {s['energy_wh']:.3f} Wh, "
+          f"заряд {s['charge_mah']:+.1f} mAh")
+    for b in s.get("buckets", []):
+        print(f"  {b['start_s'] / 3600:6.2f} ч | {b['voltage_mean']:.3f} V (мин {b['voltage_min']:.3f}) "
+              f"| {b['current_mean']:7.1f} mA")
+
 def main():
+    parser = argparse.ArgumentParser(description='Монитор UPS HAT C')
+    parser.add_argument('--config', default='config.toml', help='Путь к файлу конфигурации')
+    parser.add_argument('--direct', action='store_true',
+                        help='Читать INA219 напрямую, без брокера питания (только для отладки)')
+    parser.add_argument('--backend', default=None,
+                        help=f'I2C бэкенд для --direct: smbus, sim:..., trace:<файл> (по умолчанию ${BACKEND_ENV} или smbus)')
+    parser.add_argument('--i2c-bus', type=int, default=1, help='Номер I2C шины')
+    sub = parser.add_subparsers(dest='mode')
+
+    record = sub.add_parser('record', help='Бинарная запись отсчётов')
+    record.add_argument('output', help='Файл записи')
+    record.add_argument('--duration', type=float, default=0, help='Секунды (0 - до Ctrl+C)')
+    record.add_argument('--rate', type=float, default=INA219_MAX_RATE,
+                        help='Частота опроса для --direct, Гц (без --direct - power.broker_rate)')
+
+    replay = sub.add_parser('replay', help='Воспроизведение записи')
+    replay.add_argument('input', help='Файл записи')
+    replay.add_argument('--speed', type=float, default=60.0, help='Ускорение')
+
+    summary = sub.add_parser('summarize', help='Статистика записи')
+    summary.add_argument('input', help='Файл записи')
+    summary.add_argument('--bucket', type=float, default=3600, help='Интервал таблицы, с (0 - без таблицы)')
+    summary.add_argument('--from', dest='start', type=float, default=0, help='Начало, с от начала записи')
+    summary.add_argument('--to', dest='end', type=float, default=0, help='Конец, с от начала записи')
+
+    args = parser.parse_args()
+    modes = {'record': run_record, 'replay': run_replay, 'summarize': run_summarize}
+
     try:
-        bus = smbus2.SMBus(1)
-        
-        print("╔════════════════════════════════════════╗")
-        print("║   Waveshare UPS HAT C Monitor          ║")
-        print("╚════════════════════════════════════════╝")
-        print()
-        
-        while True:
-            voltage = read_voltage(bus)
-            current = read_current(bus)
-            power = read_power(bus)
-            percentage = calculate_percentage(voltage)
-            
-            status = "⚡Зарядка" if current > 0 else "🔋Разрядка"
-            
-            print(f"\r🔋 {percentage:5.1f}% | {voltage:.2f}V | {abs(current):6.0f}mA | {abs(power):6.1f}mW | {status}", end="")
-            sys.stdout.flush()
-            
-            time.sleep(2)
-            
+        modes.get(args.mode, run_monitor)(args)
     except KeyboardInterrupt:
         print("\n\nМониторинг остановлен")
     except Exception as e:
         print(f"\nОшибка: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
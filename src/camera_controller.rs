@@ -1,11 +1,12 @@
 use anyhow::{Context, Result};
-use log::{info, error};
+use log::info;
 use serde::{Deserialize, Serialize};
-use tokio::process::{Command, Child, ChildStdin, ChildStdout};
-use tokio::io::{AsyncWriteExt, AsyncBufReadExt, BufReader};
-use std::process::Stdio;
+use serde_json::{json, Value};
+use std::sync::Arc;
+use std::time::Duration;
 
 use crate::config::CameraConfig;
+use crate::worker_host::WorkerHost;
 
 #[derive(Debug, Clone, Serialize, Deserialize)]
 pub struct Detection {
@@ -24,75 +25,34 @@ pub struct BoundingBox {
 
 pub struct CameraController {
     config: CameraConfig,
-    process: Option<Child>,
-    stdin: Option<ChildStdin>,
-    stdout: Option<BufReader<ChildStdout>>,
+    host: Arc<WorkerHost>,
 }
 
 impl CameraController {
-    pub async fn new(config: CameraConfig) -> Result<Self> {
-        let mut controller = Self {
-            config,
-            process: None,
-            stdin: None,
-            stdout: None,
-        };
-        
+    pub async fn new(config: CameraConfig, host: Arc<WorkerHost>) -> Result<Self> {
+        let controller = Self { config, host };
         controller.start().await?;
         Ok(controller)
     }
 
-    async fn start(&mut self) -> Result<()> {
+    async fn start(&self) -> Result<()> {
         info!("🎥 Запуск AI Camera IMX500...");
-        
-        let mut child = Command::new("python3")
-            .arg("scripts/camera_worker.py")
-            .arg("--config")
-            .arg("config.toml")
-            .stdin(Stdio::piped())
-            .stdout(Stdio::piped())
-            .stderr(Stdio::piped())
-            .spawn()
-            .context("Не удалось запустить camera_worker.py")?;
 
-        let stdin = child.stdin.take()
-            .context("Не удалось захватить stdin камеры")?;
-        let stdout = child.stdout.take()
-            .context("Не удалось захватить stdout камеры")?;
+        // Ответ приходит после инициализации и прогрева IMX500 в хосте воркеров
+        self.host.request("camera", "start", Value::Null, Duration::from_secs(30)).await
+            .context("Камера не инициализирована")?;
 
-        self.process = Some(child);
-        self.stdin = Some(stdin);
-        self.stdout = Some(BufReader::new(stdout));
-
-        // Даем время на инициализацию IMX500
-        tokio::time::sleep(tokio::time::Duration::from_secs(3)).await;
-        
         info!("✓ AI Camera IMX500 запущена");
         Ok(())
     }
 
-    pub async fn detect(&mut self) -> Result<Vec<Detection>> {
-        let stdin = self.stdin.as_ref()
-            .context("Stdin камеры не доступен")?;
-        let stdout = self.stdout.as_ref().as_mut()
-            .context("Stdout камеры не доступен")?;
-
-        let mut stdin = stdin;
-        stdin.write_all(b"detect
-").await
-            .context("Не удалось отправить команду детекции")?;
-
-        let mut line = String::new();
-        let timeout = tokio::time::Duration::from_secs(self.config.inference_timeout);
-        
-        tokio::time::timeout(timeout, stdout.read_line(&mut line)).await
-            .context("Таймаут при чтении результата детекции")??;
-
-        if line.trim().is_empty() {
-            return Ok(Vec::new());
-        }
+    // trace - id сквозной трассы: спаны камеры в Python пишутся с ним же
+    pub async fn detect(&self, trace: u64) -> Result<Vec<Detection>> {
+        let timeout = Duration::from_secs(self.config.inference_timeout);
+        let result = self.host.request("camera", "detect", json!({ "trace": trace }), timeout).await
+            .context("Ошибка детекции")?;
 
-        let detections: Vec<Detection> = serde_json::from_str(line.trim())
+        let detections: Vec<Detection> = serde_json::from_value(result)
             .context("Ошибка парсинга результата детекции")?;
 
         let filtered: Vec<Detection> = detections.into_iter()
@@ -102,21 +62,9 @@ impl CameraController {
         Ok(filtered)
     }
 
-    pub async fn shutdown(&mut self) -> Result<()> {
-        if let Some(mut stdin) = self.stdin.take() {
-            let _ = stdin.write_all(b"exit
-").await;
-        }
-
-        if let Some(mut process) = self.process.take() {
-            tokio::time::timeout(
-                tokio::time::Duration::from_secs(10),
-                process.wait()
-            ).await
-                .context("Таймаут при остановке камеры")??;
-        }
-
+    pub async fn shutdown(&self) -> Result<()> {
+        // Камеру останавливает хост воркеров при выходе (WorkerHost::shutdown)
         info!("✓ Камера остановлена");
         Ok(())
     }
-}
\ No newline at end of file
+}
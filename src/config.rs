@@ -11,6 +11,10 @@ pub struct Config {
     pub power: PowerConfig,
     pub detection: DetectionConfig,
     pub optimization: OptimizationConfig,
+    #[serde(default)]
+    pub trace: TraceConfig,
+    #[serde(default)]
+    pub metrics: MetricsConfig,
 }
 
 #[derive(Debug, Clone, Deserialize)]
@@ -19,6 +23,13 @@ pub struct SystemConfig {
     pub version: String,
     pub log_level: String,
     pub max_threads: usize,
+    // Сервисы scripts/aiva_worker.py: "camera", "tts", "power"
+    #[serde(default = "default_worker_services")]
+    pub worker_services: Vec<String>,
+}
+
+fn default_worker_services() -> Vec<String> {
+    vec!["camera".to_string(), "tts".to_string()]
 }
 
 #[derive(Debug, Clone, Deserialize)]
@@ -58,6 +69,15 @@ pub struct PowerConfig {
     pub check_interval: u64,
     pub auto_shutdown: bool,
     pub warning_repeat_interval: u64,
+    #[serde(default = "default_power_backend")]
+    pub backend: String,
+    // Снимок power_broker.py; пусто - прямой доступ к INA219
+    #[serde(default)]
+    pub broker_snapshot: String,
+}
+
+fn default_power_backend() -> String {
+    "smbus".to_string()
 }
 
 #[derive(Debug, Clone, Deserialize)]
@@ -78,6 +98,35 @@ pub struct OptimizationConfig {
     pub low_power_mode: bool,
 }
 
+#[derive(Debug, Clone, Deserialize)]
+#[serde(default)]
+pub struct TraceConfig {
+    pub enabled: bool,
+    pub dir: String,
+    pub max_kb: u64,
+}
+
+impl Default for TraceConfig {
+    fn default() -> Self {
+        Self { enabled: false, dir: "/dev/shm".to_string(), max_kb: 1024 }
+    }
+}
+
+// Секция [metrics]; listen читает только scripts/metrics_exporter.py
+#[derive(Debug, Clone, Deserialize)]
+#[serde(default)]
+pub struct MetricsConfig {
+    pub enabled: bool,
+    pub dir: String,
+    pub interval: u64,
+}
+
+impl Default for MetricsConfig {
+    fn default() -> Self {
+        Self { enabled: false, dir: "/dev/shm/aiva_metrics".to_string(), interval: 5 }
+    }
+}
+
 impl Config {
     pub fn load(path: &str) -> Result<Self> {
         let content = fs::read_to_string(path)
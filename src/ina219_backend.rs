@@ -0,0 +1,237 @@
+use anyhow::{bail, Context, Result};
+use byteorder::{BigEndian, ByteOrder};
+use i2cdev::core::*;
+use i2cdev::linux::LinuxI2CDevice;
+use log::info;
+use std::time::Instant;
+
+use crate::config::PowerConfig;
+
+// Тот же формат, что и у scripts/ina219_backend.py:
+// "smbus" | "sim:load=30:450/5:900,capacity=3000,speed=1000,..."
+const BACKEND_ENV: &str = "AIVA_I2C_BACKEND";
+
+const REG_CONFIG: u8 = 0x00;
+const REG_SHUNTVOLTAGE: u8 = 0x01;
+const REG_BUSVOLTAGE: u8 = 0x02;
+const REG_POWER: u8 = 0x03;
+const REG_CURRENT: u8 = 0x04;
+const REG_CALIBRATION: u8 = 0x05;
+
+const SHUNT_OHMS: f64 = 0.1;
+
+// OCV одной ячейки 18650 от SoC
+const CELL_CURVE: [(f64, f64); 12] = [
+    (0.00, 3.00), (0.05, 3.30), (0.10, 3.45), (0.20, 3.60), (0.30, 3.68),
+    (0.40, 3.74), (0.50, 3.80), (0.60, 3.87), (0.70, 3.95), (0.80, 4.03),
+    (0.90, 4.10), (1.00, 4.20),
+];
+
+/// Доступ к регистрам INA219 (значения в порядке байт регистра - big endian)
+pub trait Ina219Bus: Send + Sync {
+    fn read_register(&mut self, reg: u8) -> Result<u16>;
+    fn write_register(&mut self, reg: u8, value: u16) -> Result<()>;
+}
+
+pub fn open_bus(config: &PowerConfig) -> Result<Box<dyn Ina219Bus>> {
+    let spec = std::env::var(BACKEND_ENV).unwrap_or_else(|_| config.backend.clone());
+    let (kind, options) = spec.split_once(':').unwrap_or((spec.as_str(), ""));
+
+    match kind {
+        "smbus" | "i2c" => Ok(Box::new(LinuxBus::open(config.i2c_bus, config.i2c_address)?)),
+        "sim" => {
+            info!("🧪 UPS HAT C: симулятор INA219 ({})", options);
+            Ok(Box::new(SimulatedIna219::from_options(options)?))
+        }
+        _ => bail!("Неизвестный I2C бэкенд: {}", spec),
+    }
+}
+
+pub struct LinuxBus {
+    device: LinuxI2CDevice,
+}
+
+impl LinuxBus {
+    pub fn open(bus: u8, address: u16) -> Result<Self> {
+        let device_path = format!("/dev/i2c-{}", bus);
+        let device = LinuxI2CDevice::new(&device_path, address)
+            .context("Не удалось открыть I2C устройство")?;
+        Ok(Self { device })
+    }
+}
+
+impl Ina219Bus for LinuxBus {
+    fn read_register(&mut self, reg: u8) -> Result<u16> {
+        let data = self.device.smbus_read_i2c_block_data(reg, 2)?;
+        if data.len() < 2 {
+            bail!("Короткое чтение регистра 0x{:02x}", reg);
+        }
+        Ok(BigEndian::read_u16(&data))
+    }
+
+    fn write_register(&mut self, reg: u8, value: u16) -> Result<()> {
+        self.device.smbus_write_i2c_block_data(reg, &value.to_be_bytes())?;
+        Ok(())
+    }
+}
+
+/// INA219 на модели батареи: кривая разряда, профиль нагрузки, шум, ускоренное время
+pub struct SimulatedIna219 {
+    cells: f64,
+    capacity_mah: f64,
+    soc: f64,
+    internal_resistance: f64,
+    load: Vec<(f64, f64)>,
+    speed: f64,
+    noise_mv: f64,
+    noise_ma: f64,
+    started: Instant,
+    sim_time: f64,
+    rng: u64,
+    config: u16,
+    calibration: u16,
+}
+
+impl SimulatedIna219 {
+    pub fn from_options(options: &str) -> Result<Self> {
+        let mut sim = Self {
+            cells: 2.0,
+            capacity_mah: 3000.0,
+            soc: 1.0,
+            internal_resistance: 0.15,
+            load: vec![(1.0, 450.0)],
+            speed: 1.0,
+            noise_mv: 4.0,
+            noise_ma: 5.0,
+            started: Instant::now(),
+            sim_time: 0.0,
+            rng: 0x9E37_79B9_7F4A_7C15,
+            config: 0x399F,
+            calibration: 4096,
+        };
+
+        for pair in options.split(',').filter(|p| !p.is_empty()) {
+            let (key, value) = pair.split_once('=')
+                .context(format!("Ожидалось ключ=значение: {}", pair))?;
+            let number = || value.parse::<f64>()
+                .context(format!("Неверное значение {}", pair));
+            match key.trim() {
+                "cells" => sim.cells = number()?,
+                "capacity" => sim.capacity_mah = number()?,
+                "soc" => sim.soc = number()?,
+                "resistance" => sim.internal_resistance = number()?,
+                "speed" => sim.speed = number()?,
+                "noise_mv" => sim.noise_mv = number()?,
+                "noise_ma" => sim.noise_ma = number()?,
+                "seed" => sim.rng = value.parse::<u64>()?.max(1),
+                "load" => sim.load = parse_load(value)?,
+                _ => bail!("Неизвестный параметр симулятора: {}", key),
+            }
+        }
+        Ok(sim)
+    }
+
+    fn load_at(&self, t: f64) -> f64 {
+        let period: f64 = self.load.iter().map(|(d, _)| d).sum();
+        let mut t = t % period;
+        for (duration, current) in &self.load {
+            if t < *duration {
+                return *current;
+            }
+            t -= duration;
+        }
+        self.load[self.load.len() - 1].1
+    }
+
+    fn update(&mut self) {
+        // Интегрируем разряд шагами не крупнее секунды симуляции
+        let now = self.started.elapsed().as_secs_f64() * self.speed;
+        while self.sim_time < now {
+            let dt = (now - self.sim_time).min(1.0);
+            let load = self.load_at(self.sim_time);
+            self.soc = (self.soc - load * dt / 3600.0 / self.capacity_mah).clamp(0.0, 1.0);
+            self.sim_time += dt;
+        }
+    }
+
+    fn open_circuit_voltage(&self) -> f64 {
+        let i = CELL_CURVE.iter().rposition(|(s, _)| *s <= self.soc)
+            .unwrap_or(0)
+            .min(CELL_CURVE.len() - 2);
+        let (s0, v0) = CELL_CURVE[i];
+        let (s1, v1) = CELL_CURVE[i + 1];
+        (v0 + (v1 - v0) * (self.soc.clamp(s0, s1) - s0) / (s1 - s0)) * self.cells
+    }
+
+    fn gauss(&mut self, sigma: f64) -> f64 {
+        // xorshift64 + сумма равномерных ≈ нормальное распределение
+        let mut sum = 0.0;
+        for _ in 0..4 {
+            self.rng ^= self.rng << 13;
+            self.rng ^= self.rng >> 7;
+            self.rng ^= self.rng << 17;
+            sum += (self.rng >> 11) as f64 / (1u64 << 53) as f64;
+        }
+        (sum - 2.0) * 1.732 * sigma
+    }
+
+    fn measure(&mut self) -> (f64, f64) {
+        self.update();
+        let load = self.load_at(self.sim_time);
+        let voltage = self.open_circuit_voltage() - load / 1000.0 * self.internal_resistance
+            + self.gauss(self.noise_mv / 1000.0);
+        let current = -load + self.gauss(self.noise_ma);
+        (voltage, current)
+    }
+}
+
+impl Ina219Bus for SimulatedIna219 {
+    fn read_register(&mut self, reg: u8) -> Result<u16> {
+        match reg {
+            REG_CONFIG => return Ok(self.config),
+            REG_CALIBRATION => return Ok(self.calibration),
+            _ => {}
+        }
+
+        let (voltage, current_ma) = self.measure();
+        let current_lsb_ma = if self.calibration > 0 {
+            40.96 / (self.calibration as f64 * SHUNT_OHMS)
+        } else {
+            0.0
+        };
+
+        let value = match reg {
+            REG_BUSVOLTAGE => (((voltage.max(0.0) / 0.004) as u16) << 3) | 0x02,
+            REG_SHUNTVOLTAGE => (current_ma / 1000.0 * SHUNT_OHMS / 10e-6) as i16 as u16,
+            _ if current_lsb_ma == 0.0 => 0,
+            REG_CURRENT => (current_ma / current_lsb_ma).clamp(-32768.0, 32767.0) as i16 as u16,
+            REG_POWER => (voltage * current_ma.abs() / (20.0 * current_lsb_ma)).min(65535.0) as u16,
+            _ => bail!("INA219: нет регистра 0x{:02x}", reg),
+        };
+        Ok(value)
+    }
+
+    fn write_register(&mut self, reg: u8, value: u16) -> Result<()> {
+        match reg {
+            REG_CONFIG => self.config = value,
+            REG_CALIBRATION => self.calibration = value,
+            _ => bail!("INA219: регистр 0x{:02x} только для чтения", reg),
+        }
+        Ok(())
+    }
+}
+
+fn parse_load(spec: &str) -> Result<Vec<(f64, f64)>> {
+    // "30:450/5:900" или "450"
+    let mut segments = Vec::new();
+    for part in spec.split('/').filter(|p| !p.is_empty()) {
+        match part.split_once(':') {
+            Some((duration, current)) => segments.push((duration.parse()?, current.parse()?)),
+            None => segments.push((1.0, part.parse()?)),
+        }
+    }
+    if segments.is_empty() {
+        bail!("Пустой профиль нагрузки");
+    }
+    Ok(segments)
+}
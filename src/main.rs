@@ -2,17 +2,23 @@ mod config;
 mod camera_controller;
 mod tts_controller;
 mod power_monitor;
+mod ina219_backend;
+mod worker_host;
+mod trace;
+mod metrics;
 
 use anyhow::Result;
 use log::{info, warn, error};
 use tokio::signal;
 use std::sync::Arc;
+use std::time::Duration;
 use tokio::sync::RwLock;
 
 use config::Config;
 use camera_controller::CameraController;
 use tts_controller::TtsController;
 use power_monitor::PowerMonitor;
+use worker_host::WorkerHost;
 
 #[tokio::main(flavor = "current_thread")]
 async fn main() -> Result<()> {
@@ -25,15 +31,17 @@ async fn main() -> Result<()> {
     // Загрузка конфигурации
     let config = Config::load("config.toml")?;
     info!("✓ Конфигурация загружена");
+    trace::init(&config.trace);
 
-    // Проверка системы
-    check_system();
+    // Память и температура - периодически, вместе с записью метрик
+    let monitor_task = tokio::spawn(metrics::system_monitor(config.metrics.clone()));
+
+    // Один процесс Python на камеру и TTS (и брокер питания, если он в system.worker_services)
+    let host = WorkerHost::start(&config.system.worker_services).await?;
 
     // Создание контроллеров
-    let camera = Arc::new(RwLock::new(
-        CameraController::new(config.camera.clone()).await?
-    ));
-    let tts = Arc::new(TtsController::new(config.tts.clone())?);
+    let camera = Arc::new(CameraController::new(config.camera.clone(), Arc::clone(&host)).await?);
+    let tts = Arc::new(TtsController::new(config.tts.clone(), Arc::clone(&host))?);
     
     // Инициализация мониторинга питания
     let power_monitor = if config.power.enabled {
@@ -93,12 +101,14 @@ async fn main() -> Result<()> {
         warn!("Ошибка TTS: {}", e);
     }
     
-    let mut camera = camera.write().await;
     camera.shutdown().await?;
     
     if let Some(task) = power_task {
         task.abort();
     }
+    monitor_task.abort();
+
+    host.shutdown().await?;
     
     info!("✓ Система остановлена");
     Ok(())
@@ -113,36 +123,6 @@ fn print_banner() {
     info!("╚════════════════════════════════════════╝");
 }
 
-fn check_system() {
-    // Проверка памяти
-    if let Ok(meminfo) = std::fs::read_to_string("/proc/meminfo") {
-        for line in meminfo.lines() {
-            if line.starts_with("MemTotal:") {
-                if let Some(total) = line.split_whitespace().nth(1) {
-                    if let Ok(kb) = total.parse::<u64>() {
-                        let mb = kb / 1024;
-                        info!("💾 Всего памяти: {} MB", mb);
-                        if mb < 400 {
-                            warn!("⚠️  Мало оперативной памяти!");
-                        }
-                    }
-                }
-            }
-        }
-    }
-
-    // Проверка температуры
-    if let Ok(temp) = std::fs::read_to_string("/sys/class/thermal/thermal_zone0/temp") {
-        if let Ok(millidegrees) = temp.trim().parse::<f32>() {
-            let celsius = millidegrees / 1000.0;
-            info!("🌡️  Температура CPU: {:.1}°C", celsius);
-            if celsius > 75.0 {
-                warn!("⚠️  Высокая температура CPU!");
-            }
-        }
-    }
-}
-
 async fn power_monitoring_loop(
     power_monitor: Arc<RwLock<PowerMonitor>>,
     tts: Arc<TtsController>,
@@ -197,7 +177,7 @@ async fn power_monitoring_loop(
 }
 
 async fn detection_loop(
-    camera: Arc<RwLock<CameraController>>,
+    camera: Arc<CameraController>,
     tts: Arc<TtsController>,
     det_cfg: crate::config::DetectionConfig,
     opt_cfg: crate::config::OptimizationConfig,
@@ -209,28 +189,50 @@ async fn detection_loop(
         tokio::time::sleep(tokio::time::Duration::from_secs(det_cfg.scan_interval)).await;
         
         cycle_count += 1;
+        metrics::DETECT_CYCLES.inc();
         
         // Периодическая очистка памяти
         if opt_cfg.force_gc_interval > 0 && cycle_count % opt_cfg.force_gc_interval == 0 {
             info!("🧹 Очистка памяти (цикл {})", cycle_count);
         }
         
-        // Выполнение детекции
-        let mut camera = camera.read().await;
-        match camera.detect().await {
+        // Выполнение детекции: trace id идёт через камеру, форматирование и TTS
+        let trace_id = trace::new_id();
+        let t_detect = trace::now_us();
+        match camera.detect(trace_id).await {
             Ok(detections) => {
+                trace::span("rust.detect", trace_id, t_detect);
+                metrics::DETECT_LATENCY.observe(Duration::from_micros(trace::now_us().saturating_sub(t_detect)));
+                metrics::OBJECTS.add(detections.len() as u64);
                 if !detections.is_empty() {
                     info!("📸 Обнаружено объектов: {}", detections.len());
                     
                     // Проверка cooldown
                     if last_detection.elapsed().as_secs() >= det_cfg.cooldown_period {
+                        let mut spoken = 0;
                         for detection in detections.iter().take(det_cfg.max_detections) {
                             // Фильтруем по enabled_classes
                             if det_cfg.enabled_classes.contains(&detection.label) {
+                                let t_format = trace::now_us();
                                 let message = format_detection_message(detection, &det_cfg);
+                                trace::span("rust.format", trace_id, t_format);
                                 
-                                if let Err(e) = tts.speak(&message).await {
-                                    error!("Ошибка TTS: {}", e);
+                                let t_tts = trace::now_us();
+                                let said = match tts.speak_traced(&message, trace_id).await {
+                                    Ok(said) => said,
+                                    Err(e) => {
+                                        error!("Ошибка TTS: {}", e);
+                                        false
+                                    }
+                                };
+                                trace::span("rust.tts", trace_id, t_tts);
+                                // Сквозная задержка - до конца первой действительно сказанной фразы
+                                // (пропущенные и неудавшиеся не искажают перцентили)
+                                if said {
+                                    if spoken == 0 {
+                                        trace::span("see_to_speak", trace_id, t_detect);
+                                    }
+                                    spoken += 1;
                                 }
                                 
                                 // Пауза между озвучиваниями
@@ -242,6 +244,7 @@ async fn detection_loop(
                 }
             }
             Err(e) => {
+                metrics::DETECT_ERRORS.inc();
                 error!("Ошибка детекции: {}", e);
                 tokio::time::sleep(tokio::time::Duration::from_secs(5)).await;
             }
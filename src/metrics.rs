@@ -0,0 +1,188 @@
+use log::{info, warn};
+use std::fmt::Write as _;
+use std::fs;
+use std::path::Path;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::{Duration, Instant};
+
+use crate::config::MetricsConfig;
+
+// Метрики Rust-процесса в текстовом формате Prometheus: раз в metrics.interval
+// переписывается <dir>/rust.prom, scripts/metrics_exporter.py отдаёт его на localhost.
+// Счётчики - атомики без блокировок, запись отсчёта - одна-две атомарные операции.
+
+pub struct Counter(AtomicU64);
+
+impl Counter {
+    pub const fn new() -> Self {
+        Self(AtomicU64::new(0))
+    }
+
+    pub fn inc(&self) {
+        self.0.fetch_add(1, Ordering::Relaxed);
+    }
+
+    pub fn add(&self, n: u64) {
+        self.0.fetch_add(n, Ordering::Relaxed);
+    }
+
+    fn get(&self) -> u64 {
+        self.0.load(Ordering::Relaxed)
+    }
+}
+
+// Границы корзин в секундах - те же, что DEFAULT_BUCKETS в scripts/metrics.py
+const BUCKETS: [f64; 14] = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0];
+#[allow(clippy::declare_interior_mutable_const)]
+const ZERO: AtomicU64 = AtomicU64::new(0);
+
+pub struct Histogram {
+    counts: [AtomicU64; BUCKETS.len() + 1],
+    sum_us: AtomicU64,
+}
+
+impl Histogram {
+    pub const fn new() -> Self {
+        Self { counts: [ZERO; BUCKETS.len() + 1], sum_us: ZERO }
+    }
+
+    pub fn observe(&self, elapsed: Duration) {
+        let seconds = elapsed.as_secs_f64();
+        let index = BUCKETS.iter().position(|&le| seconds <= le).unwrap_or(BUCKETS.len());
+        self.counts[index].fetch_add(1, Ordering::Relaxed);
+        self.sum_us.fetch_add(elapsed.as_micros() as u64, Ordering::Relaxed);
+    }
+
+    fn write(&self, out: &mut String, name: &str, help: &str) {
+        let _ = writeln!(out, "# HELP {} {}\n# TYPE {} histogram", name, help, name);
+        let mut seen = 0;
+        for (le, count) in BUCKETS.iter().zip(&self.counts) {
+            seen += count.load(Ordering::Relaxed);
+            let _ = writeln!(out, "{}_bucket{{le=\"{}\"}} {}", name, le, seen);
+        }
+        seen += self.counts[BUCKETS.len()].load(Ordering::Relaxed);
+        let _ = writeln!(out, "{}_bucket{{le=\"+Inf\"}} {}", name, seen);
+        let _ = writeln!(out, "{}_sum {}", name, self.sum_us.load(Ordering::Relaxed) as f64 / 1e6);
+        let _ = writeln!(out, "{}_count {}", name, seen);
+    }
+}
+
+pub static DETECT_CYCLES: Counter = Counter::new();
+pub static DETECT_ERRORS: Counter = Counter::new();
+pub static OBJECTS: Counter = Counter::new();
+pub static DETECT_LATENCY: Histogram = Histogram::new();
+pub static TTS_PHRASES: Counter = Counter::new();
+pub static TTS_SKIPPED: Counter = Counter::new();
+pub static TTS_ERRORS: Counter = Counter::new();
+pub static TTS_LATENCY: Histogram = Histogram::new();
+
+const HIGH_TEMPERATURE: f32 = 75.0;
+const LOW_MEMORY_MB: u64 = 400;
+const LOW_AVAILABLE_MB: u64 = 50;
+
+#[derive(Default)]
+struct SystemReading {
+    total_mb: u64,
+    available_mb: u64,
+    temperature: Option<f32>,
+}
+
+fn read_system() -> SystemReading {
+    let mut reading = SystemReading::default();
+    if let Ok(meminfo) = fs::read_to_string("/proc/meminfo") {
+        for line in meminfo.lines() {
+            let mut parts = line.split_whitespace();
+            let (Some(key), Some(kb)) = (parts.next(), parts.next().and_then(|v| v.parse::<u64>().ok())) else {
+                continue;
+            };
+            match key {
+                "MemTotal:" => reading.total_mb = kb / 1024,
+                "MemAvailable:" => reading.available_mb = kb / 1024,
+                _ => {}
+            }
+        }
+    }
+    reading.temperature = fs::read_to_string("/sys/class/thermal/thermal_zone0/temp")
+        .ok()
+        .and_then(|t| t.trim().parse::<f32>().ok())
+        .map(|millidegrees| millidegrees / 1000.0);
+    reading
+}
+
+fn write_textfile(dir: &str, started: Instant) -> std::io::Result<()> {
+    let mut out = String::with_capacity(4096);
+    let counters = [
+        ("aiva_detect_cycles_total", "Циклов детекции", &DETECT_CYCLES),
+        ("aiva_detect_errors_total", "Ошибок детекции", &DETECT_ERRORS),
+        ("aiva_detected_objects_total", "Обнаруженных объектов", &OBJECTS),
+        ("aiva_tts_phrases_total", "Сказанных фраз", &TTS_PHRASES),
+        ("aiva_tts_skipped_total", "Фраз, пропущенных во время речи", &TTS_SKIPPED),
+        ("aiva_tts_errors_total", "Ошибок TTS", &TTS_ERRORS),
+    ];
+    for (name, help, counter) in counters {
+        let _ = writeln!(out, "# HELP {} {}\n# TYPE {} counter\n{} {}", name, help, name, name, counter.get());
+    }
+    DETECT_LATENCY.write(&mut out, "aiva_rust_detect_seconds", "camera.detect из Rust (с очередью хоста воркеров)");
+    TTS_LATENCY.write(&mut out, "aiva_rust_tts_seconds", "tts.speak из Rust (синтез и воспроизведение)");
+    let _ = writeln!(out, "# HELP aiva_uptime_seconds Время работы Rust-процесса\n# TYPE aiva_uptime_seconds gauge");
+    let _ = writeln!(out, "aiva_uptime_seconds {}", started.elapsed().as_secs());
+
+    // Через временный файл и rename: экспортёр не увидит половину файла
+    let path = Path::new(dir).join("rust.prom");
+    let tmp = Path::new(dir).join("rust.prom.tmp");
+    fs::write(&tmp, out)?;
+    fs::rename(&tmp, &path)
+}
+
+// Вместо однократной проверки при запуске: память и температура каждые interval секунд,
+// предупреждения - при переходе через порог, а не на каждой проверке
+pub async fn system_monitor(config: MetricsConfig) {
+    let started = Instant::now();
+    if config.enabled {
+        if let Err(e) = fs::create_dir_all(&config.dir) {
+            warn!("Метрики отключены: не удалось создать {}: {}", config.dir, e);
+        }
+    }
+
+    let first = read_system();
+    info!("💾 Всего памяти: {} MB", first.total_mb);
+    if first.total_mb > 0 && first.total_mb < LOW_MEMORY_MB {
+        warn!("⚠️  Мало оперативной памяти!");
+    }
+    if let Some(celsius) = first.temperature {
+        info!("🌡️  Температура CPU: {:.1}°C", celsius);
+    }
+
+    let mut hot = false;
+    let mut low = false;
+    let mut interval = tokio::time::interval(Duration::from_secs(config.interval.max(1)));
+    loop {
+        interval.tick().await;
+        let reading = read_system();
+
+        if let Some(celsius) = reading.temperature {
+            let is_hot = celsius > HIGH_TEMPERATURE;
+            if is_hot != hot {
+                hot = is_hot;
+                if is_hot {
+                    warn!("⚠️  Высокая температура CPU: {:.1}°C", celsius);
+                } else {
+                    info!("🌡️  Температура CPU снизилась: {:.1}°C", celsius);
+                }
+            }
+        }
+        let is_low = reading.total_mb > 0 && reading.available_mb < LOW_AVAILABLE_MB;
+        if is_low != low {
+            low = is_low;
+            if is_low {
+                warn!("⚠️  Мало свободной памяти: {} MB", reading.available_mb);
+            }
+        }
+
+        if config.enabled {
+            if let Err(e) = write_textfile(&config.dir, started) {
+                warn!("Ошибка записи метрик: {}", e);
+            }
+        }
+    }
+}
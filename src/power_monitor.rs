@@ -1,10 +1,12 @@
-use anyhow::{Context, Result};
-use i2cdev::core::*;
-use i2cdev::linux::LinuxI2CDevice;
-use byteorder::{BigEndian, ByteOrder};
+use anyhow::{bail, Context, Result};
+use byteorder::{ByteOrder, LittleEndian};
 use log::{info, error};
+use std::fs::File;
+use std::os::unix::fs::FileExt;
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
 
 use crate::config::PowerConfig;
+use crate::ina219_backend::{self, Ina219Bus};
 
 // INA219 Registers
 const INA219_REG_CONFIG: u8 = 0x00;
@@ -22,64 +24,62 @@ pub struct PowerStatus {
     pub percentage: f32,   // Процент заряда
 }
 
+// Снимок scripts/power_broker.py (SNAPSHOT_FORMAT = "<8sQQdddddddddQQ")
+const SNAPSHOT_MAGIC: &[u8; 8] = b"AIVAPWR1";
+const SNAPSHOT_SIZE: usize = 112;
+const SNAPSHOT_MAX_AGE: f64 = 10.0;
+
+enum PowerSource {
+    // INA219 принадлежит брокеру, читаем его снимок из /dev/shm
+    Broker(String),
+    // Прямой доступ к шине (без брокера, для отладки)
+    Bus(Box<dyn Ina219Bus>),
+}
+
 pub struct PowerMonitor {
-    device: LinuxI2CDevice,
+    source: PowerSource,
     config: PowerConfig,
 }
 
 impl PowerMonitor {
     pub fn new(config: PowerConfig) -> Result<Self> {
-        let device_path = format!("/dev/i2c-{}", config.i2c_bus);
-        let mut device = LinuxI2CDevice::new(&device_path, config.i2c_address)
-            .context("Не удалось открыть I2C устройство")?;
+        if !config.broker_snapshot.is_empty() {
+            info!("🔌 UPS HAT C: подключение к брокеру питания ({})", config.broker_snapshot);
+            let deadline = Instant::now() + Duration::from_secs(10);
+            while File::open(&config.broker_snapshot).is_err() {
+                if Instant::now() > deadline {
+                    bail!("Брокер питания не запущен: {}", config.broker_snapshot);
+                }
+                std::thread::sleep(Duration::from_millis(200));
+            }
+            let source = PowerSource::Broker(config.broker_snapshot.clone());
+            return Ok(Self { source, config });
+        }
+
+        // Настоящая шина или симулятор (power.backend / AIVA_I2C_BACKEND)
+        let mut bus = ina219_backend::open_bus(&config)?;
 
         info!("🔌 Инициализация UPS HAT C (INA219)...");
 
-        // Конфигурация INA219
+        // Конфигурация INA219 (та же, что у брокера)
         // 32V, ±3.2A range, 12-bit, 532µs conversion time
-        let config_value: u16 = 0x219F;
-        let config_bytes = config_value.to_be_bytes();
-        device.smbus_write_i2c_block_data(INA219_REG_CONFIG, &config_bytes)
+        bus.write_register(INA219_REG_CONFIG, 0x399F)
             .context("Не удалось настроить INA219")?;
 
         // Калибровка для 0.1 Ом шунта
-        let calibration: u16 = 4096;
-        let cal_bytes = calibration.to_be_bytes();
-        device.smbus_write_i2c_block_data(INA219_REG_CALIBRATION, &cal_bytes)
+        bus.write_register(INA219_REG_CALIBRATION, 4096)
             .context("Не удалось откалибровать INA219")?;
 
         info!("✓ UPS HAT C инициализирован");
 
-        Ok(Self { device, config })
+        Ok(Self { source: PowerSource::Bus(bus), config })
     }
 
     pub fn read_status(&mut self) -> Result<PowerStatus> {
-        // Чтение напряжения шины (Bus Voltage)
-        let mut bus_voltage_buf = [0u8; 2];
-        self.device
-            .smbus_read_i2c_block_data(INA219_REG_BUSVOLTAGE, 2)
-            .context("Ошибка чтения напряжения")?;
-        
-        let bus_voltage_raw = BigEndian::read_u16(&bus_voltage_buf);
-        let voltage = ((bus_voltage_raw >> 3) as f32) * 0.004; // LSB = 4mV
-
-        // Чтение тока (Current)
-        let mut current_buf = [0u8; 2];
-        self.device
-            .smbus_read_i2c_block_data(INA219_REG_CURRENT, 2)
-            .context("Ошибка чтения тока")?;
-        
-        let current_raw = BigEndian::read_i16(&current_buf);
-        let current = (current_raw as f32) * 0.1; // LSB = 0.1mA
-
-        // Чтение мощности (Power)
-        let mut power_buf = [0u8; 2];
-        self.device
-            .smbus_read_i2c_block_data(INA219_REG_POWER, 2)
-            .context("Ошибка чтения мощности")?;
-        
-        let power_raw = BigEndian::read_u16(&power_buf);
-        let power = (power_raw as f32) * 2.0; // LSB = 2mW
+        let (voltage, current, power) = match &mut self.source {
+            PowerSource::Broker(path) => read_broker_snapshot(path)?,
+            PowerSource::Bus(bus) => read_bus(bus.as_mut())?,
+        };
 
         // Определение режима (зарядка/разрядка)
         let charging = current > 0.0;
@@ -105,4 +105,55 @@ impl PowerMonitor {
         let percentage = ((voltage - min_v) / (max_v - min_v)) * 100.0;
         percentage.max(0.0).min(100.0)
     }
-}
\ No newline at end of file
+}
+
+fn read_bus(bus: &mut dyn Ina219Bus) -> Result<(f32, f32, f32)> {
+    // Чтение напряжения шины (Bus Voltage)
+    let bus_voltage_raw = bus
+        .read_register(INA219_REG_BUSVOLTAGE)
+        .context("Ошибка чтения напряжения")?;
+    let voltage = ((bus_voltage_raw >> 3) as f32) * 0.004; // LSB = 4mV
+
+    // Чтение тока (Current)
+    let current_raw = bus
+        .read_register(INA219_REG_CURRENT)
+        .context("Ошибка чтения тока")? as i16;
+    let current = (current_raw as f32) * 0.1; // LSB = 0.1mA
+
+    // Чтение мощности (Power)
+    let power_raw = bus
+        .read_register(INA219_REG_POWER)
+        .context("Ошибка чтения мощности")?;
+    let power = (power_raw as f32) * 2.0; // LSB = 2mW
+
+    Ok((voltage, current, power))
+}
+
+fn read_broker_snapshot(path: &str) -> Result<(f32, f32, f32)> {
+    let file = File::open(path)
+        .context(format!("Брокер питания недоступен: {}", path))?;
+    let mut buf = [0u8; SNAPSHOT_SIZE];
+    let mut seq_after = [0u8; 8];
+
+    // seqlock: seq до и после копирования совпадает и чётный
+    for _ in 0..100 {
+        file.read_exact_at(&mut buf, 0).context("Ошибка чтения снимка питания")?;
+        file.read_exact_at(&mut seq_after, 8).context("Ошибка чтения снимка питания")?;
+        let seq = LittleEndian::read_u64(&buf[8..16]);
+        if seq % 2 != 0 || seq != LittleEndian::read_u64(&seq_after) {
+            continue;
+        }
+        if &buf[0..8] != SNAPSHOT_MAGIC {
+            bail!("Неверный формат снимка питания: {}", path);
+        }
+
+        let field = |offset: usize| LittleEndian::read_f64(&buf[offset..offset + 8]);
+        let now = SystemTime::now().duration_since(UNIX_EPOCH)?.as_secs_f64();
+        let age = now - field(24);
+        if age > SNAPSHOT_MAX_AGE {
+            bail!("Снимок питания устарел на {:.0} с (брокер завис?)", age);
+        }
+        return Ok((field(32) as f32, field(40) as f32, field(48) as f32));
+    }
+    bail!("Снимок питания постоянно обновляется")
+}
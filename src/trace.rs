@@ -0,0 +1,114 @@
+use log::{info, warn};
+use serde::Serialize;
+use std::fs::{self, File, OpenOptions};
+use std::io::Write;
+use std::path::Path;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Mutex, OnceLock};
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use crate::config::TraceConfig;
+
+// Сквозная трассировка "увидел -> сказал" в формате Chrome trace.
+// Спаны Rust - pid 1 в <dir>/aiva_trace.rust.json, Python (scripts/trace_spans.py) - pid 2;
+// время - микросекунды UNIX, общее для обоих процессов.
+const RUST_PID: u32 = 1;
+
+static TRACER: OnceLock<Tracer> = OnceLock::new();
+static NEXT_ID: AtomicU64 = AtomicU64::new(1);
+
+struct Tracer {
+    path: String,
+    max_bytes: u64,
+    file: Mutex<Option<(File, u64)>>,
+}
+
+#[derive(Serialize)]
+struct Event<'a> {
+    name: &'a str,
+    cat: &'a str,
+    ph: &'a str,
+    ts: u64,
+    dur: u64,
+    pid: u32,
+    tid: u32,
+    args: SpanArgs,
+}
+
+#[derive(Serialize)]
+struct SpanArgs {
+    trace: u64,
+}
+
+pub fn init(config: &TraceConfig) {
+    if !config.enabled {
+        return;
+    }
+    let path = Path::new(&config.dir).join("aiva_trace.rust.json");
+    let tracer = Tracer {
+        path: path.to_string_lossy().into_owned(),
+        max_bytes: config.max_kb * 1024,
+        file: Mutex::new(None),
+    };
+    info!("🧵 Трассировка: {}", tracer.path);
+    let _ = TRACER.set(tracer);
+}
+
+// Уникален в пределах запуска и меньше 2^53 (Perfetto читает числа как double)
+pub fn new_id() -> u64 {
+    ((std::process::id() as u64 & 0xFFFF) << 32) | NEXT_ID.fetch_add(1, Ordering::Relaxed)
+}
+
+pub fn now_us() -> u64 {
+    SystemTime::now().duration_since(UNIX_EPOCH).map(|d| d.as_micros() as u64).unwrap_or(0)
+}
+
+// Спан от start_us до текущего момента
+pub fn span(name: &str, trace: u64, start_us: u64) {
+    let Some(tracer) = TRACER.get() else { return };
+    let event = Event {
+        name,
+        cat: "rust",
+        ph: "X",
+        ts: start_us,
+        dur: now_us().saturating_sub(start_us),
+        pid: RUST_PID,
+        tid: 1,
+        args: SpanArgs { trace },
+    };
+    let Ok(mut line) = serde_json::to_string(&event) else { return };
+    line.push_str(",\n");
+    if let Err(e) = tracer.write(line.as_bytes()) {
+        warn!("Ошибка записи трассы: {}", e);
+    }
+}
+
+impl Tracer {
+    fn write(&self, line: &[u8]) -> std::io::Result<()> {
+        let mut guard = self.file.lock().unwrap();
+        let rotate = matches!(&*guard, Some((_, size)) if size + line.len() as u64 > self.max_bytes);
+        if rotate {
+            // Одна предыдущая часть, чтобы tmpfs не рос
+            *guard = None;
+            fs::rename(&self.path, format!("{}.1", self.path))?;
+        }
+        if guard.is_none() {
+            let mut file = OpenOptions::new().create(true).append(true).open(&self.path)?;
+            let mut size = file.metadata()?.len();
+            if size == 0 {
+                let header = format!(
+                    "[\n{{\"name\":\"process_name\",\"ph\":\"M\",\"pid\":{},\"args\":{{\"name\":\"aiva (rust)\"}}}},\n",
+                    RUST_PID
+                );
+                file.write_all(header.as_bytes())?;
+                size = header.len() as u64;
+            }
+            *guard = Some((file, size));
+        }
+        if let Some((file, size)) = guard.as_mut() {
+            file.write_all(line)?;
+            *size += line.len() as u64;
+        }
+        Ok(())
+    }
+}
@@ -1,22 +1,26 @@
-use anyhow::{Context, Result};
-use log::{info, error};
-use tokio::process::Command;
-use std::process::Stdio;
+use anyhow::Result;
+use log::info;
+use serde_json::json;
 use std::sync::atomic::{AtomicBool, Ordering};
 use std::sync::Arc;
+use std::time::{Duration, Instant};
 
 use crate::config::TtsConfig;
+use crate::metrics;
+use crate::worker_host::WorkerHost;
 
 pub struct TtsController {
     config: TtsConfig,
+    host: Arc<WorkerHost>,
     is_speaking: Arc<AtomicBool>,
 }
 
 impl TtsController {
-    pub fn new(config: TtsConfig) -> Result<Self> {
+    pub fn new(config: TtsConfig, host: Arc<WorkerHost>) -> Result<Self> {
         info!("🔊 Инициализация TTS");
         Ok(Self {
             config,
+            host,
             is_speaking: Arc::new(AtomicBool::new(false)),
         })
     }
@@ -24,18 +28,31 @@ impl TtsController {
     pub async fn speak(&self, text: &str) -> Result<()> {
         // Пропускаем если уже говорим
         if self.is_speaking.load(Ordering::Relaxed) {
+            metrics::TTS_SKIPPED.inc();
             return Ok(());
         }
         
-        self.speak_internal(text, false).await
+        self.speak_internal(text, false, None).await
+    }
+
+    // Фраза из detection_loop: синтез и воспроизведение попадают в трассу trace.
+    // Ok(false) - фраза пропущена, потому что уже говорим
+    pub async fn speak_traced(&self, text: &str, trace: u64) -> Result<bool> {
+        if self.is_speaking.load(Ordering::Relaxed) {
+            metrics::TTS_SKIPPED.inc();
+            return Ok(false);
+        }
+        
+        self.speak_internal(text, false, Some(trace)).await?;
+        Ok(true)
     }
 
     pub async fn speak_priority(&self, text: &str) -> Result<()> {
         // Приоритетное сообщение - не проверяем is_speaking
-        self.speak_internal(text, true).await
+        self.speak_internal(text, true, None).await
     }
 
-    async fn speak_internal(&self, text: &str, priority: bool) -> Result<()> {
+    async fn speak_internal(&self, text: &str, priority: bool, trace: Option<u64>) -> Result<()> {
         if !priority {
             self.is_speaking.store(true, Ordering::Relaxed);
         }
@@ -48,33 +65,22 @@ impl TtsController {
         
         info!("💬 TTS: {}", truncated);
 
-        let result = Command::new("python3")
-            .arg("scripts/tts_worker.py")
-            .arg("--model")
-            .arg(&self.config.model_path)
-            .arg("--sample-rate")
-            .arg(self.config.sample_rate.to_string())
-            .arg("--text")
-            .arg(truncated)
-            .stdin(Stdio::null())
-            .stdout(Stdio::null())
-            .stderr(Stdio::piped())
-            .status()
-            .await
-            .context("Не удалось запустить TTS worker");
+        // Синтез и воспроизведение в хосте воркеров (Piper 15 с + aplay 20 с)
+        let started = Instant::now();
+        let result = self.host
+            .request("tts", "speak", json!({ "text": truncated, "trace": trace }), Duration::from_secs(40))
+            .await;
+        metrics::TTS_LATENCY.observe(started.elapsed());
+        if result.is_ok() {
+            metrics::TTS_PHRASES.inc();
+        } else {
+            metrics::TTS_ERRORS.inc();
+        }
 
         if !priority {
             self.is_speaking.store(false, Ordering::Relaxed);
         }
 
-        match result {
-            Ok(status) => {
-                if !status.success() {
-                    error!("TTS worker завершился с ошибкой: {:?}", status);
-                }
-                Ok(())
-            }
-            Err(e) => Err(e),
-        }
+        result.map(|_| ())
     }
 }
\ No newline at end of file
@@ -0,0 +1,143 @@
+use anyhow::{bail, Context, Result};
+use log::{info, warn, error};
+use serde::{Deserialize, Serialize};
+use serde_json::Value;
+use tokio::process::{Command, Child, ChildStdin};
+use tokio::io::{AsyncWriteExt, AsyncBufReadExt, BufReader};
+use tokio::sync::{oneshot, Mutex};
+use std::collections::HashMap;
+use std::process::Stdio;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::Arc;
+use std::time::Duration;
+
+type Pending = Arc<std::sync::Mutex<HashMap<u64, oneshot::Sender<Response>>>>;
+
+#[derive(Serialize)]
+struct Request<'a> {
+    id: u64,
+    service: &'a str,
+    op: &'a str,
+    args: Value,
+}
+
+#[derive(Deserialize)]
+struct Response {
+    id: u64,
+    ok: bool,
+    #[serde(default)]
+    result: Value,
+    #[serde(default)]
+    error: String,
+}
+
+// Один процесс scripts/aiva_worker.py на все сервисы (камера, TTS, питание).
+// Запросы мультиплексируются по id: ответы приходят в любом порядке,
+// поэтому долгий синтез речи не блокирует детекцию.
+pub struct WorkerHost {
+    stdin: Mutex<ChildStdin>,
+    process: Mutex<Option<Child>>,
+    pending: Pending,
+    next_id: AtomicU64,
+}
+
+impl WorkerHost {
+    pub async fn start(services: &[String]) -> Result<Arc<Self>> {
+        info!("🐍 Запуск хоста воркеров ({})...", services.join(", "));
+
+        let mut child = Command::new("python3")
+            .arg("scripts/aiva_worker.py")
+            .arg("--config")
+            .arg("config.toml")
+            .arg("--services")
+            .arg(services.join(","))
+            .stdin(Stdio::piped())
+            .stdout(Stdio::piped())
+            .stderr(Stdio::inherit())
+            .spawn()
+            .context("Не удалось запустить aiva_worker.py")?;
+
+        let stdin = child.stdin.take()
+            .context("Не удалось захватить stdin хоста воркеров")?;
+        let stdout = child.stdout.take()
+            .context("Не удалось захватить stdout хоста воркеров")?;
+
+        let pending: Pending = Arc::new(std::sync::Mutex::new(HashMap::new()));
+        let reader_pending = Arc::clone(&pending);
+        tokio::spawn(async move {
+            let mut lines = BufReader::new(stdout).lines();
+            loop {
+                match lines.next_line().await {
+                    Ok(Some(line)) => match serde_json::from_str::<Response>(&line) {
+                        Ok(response) => {
+                            let waiter = reader_pending.lock().unwrap().remove(&response.id);
+                            if let Some(tx) = waiter {
+                                let _ = tx.send(response);
+                            }
+                        }
+                        Err(e) => warn!("Некорректный ответ хоста воркеров: {} ({})", line, e),
+                    },
+                    Ok(None) => break,
+                    Err(e) => {
+                        error!("Ошибка чтения хоста воркеров: {}", e);
+                        break;
+                    }
+                }
+            }
+            // Процесс завершился: ожидающие запросы получат ошибку
+            reader_pending.lock().unwrap().clear();
+            warn!("Хост воркеров закрыл stdout");
+        });
+
+        Ok(Arc::new(Self {
+            stdin: Mutex::new(stdin),
+            process: Mutex::new(Some(child)),
+            pending,
+            next_id: AtomicU64::new(1),
+        }))
+    }
+
+    pub async fn request(&self, service: &str, op: &str, args: Value, timeout: Duration) -> Result<Value> {
+        let id = self.next_id.fetch_add(1, Ordering::Relaxed);
+        let (tx, rx) = oneshot::channel();
+        self.pending.lock().unwrap().insert(id, tx);
+
+        let mut line = serde_json::to_vec(&Request { id, service, op, args })
+            .context("Ошибка сериализации запроса")?;
+        line.push(b'\n');
+        {
+            let mut stdin = self.stdin.lock().await;
+            if let Err(e) = stdin.write_all(&line).await {
+                self.pending.lock().unwrap().remove(&id);
+                bail!("Не удалось отправить {}.{}: {}", service, op, e);
+            }
+        }
+
+        let response = match tokio::time::timeout(timeout, rx).await {
+            Ok(Ok(response)) => response,
+            Ok(Err(_)) => bail!("Хост воркеров завершился до ответа на {}.{}", service, op),
+            Err(_) => {
+                self.pending.lock().unwrap().remove(&id);
+                bail!("Таймаут {}.{} ({} с)", service, op, timeout.as_secs());
+            }
+        };
+        if !response.ok {
+            bail!("{}.{}: {}", service, op, response.error);
+        }
+        Ok(response.result)
+    }
+
+    pub async fn shutdown(&self) -> Result<()> {
+        if let Ok(stats) = self.request("host", "stats", Value::Null, Duration::from_secs(2)).await {
+            info!("🐍 Хост воркеров: {}", stats);
+        }
+        let _ = self.request("host", "exit", Value::Null, Duration::from_secs(2)).await;
+
+        if let Some(mut process) = self.process.lock().await.take() {
+            tokio::time::timeout(Duration::from_secs(10), process.wait()).await
+                .context("Таймаут при остановке хоста воркеров")??;
+        }
+        info!("✓ Хост воркеров остановлен");
+        Ok(())
+    }
+}